@@ -0,0 +1,103 @@
+"""
+Compares two benchmark results files (default: the two most recent in benchmarks/results/).
+
+    python -m benchmarks.compare [BASELINE.json CANDIDATE.json] [--threshold 0.1]
+
+Exits with status 1 when a stage got slower (or used more memory) by more than the threshold.
+"""
+import argparse
+import json
+import os
+import sys
+
+from benchmarks import harness
+
+# (section, metric) pairs compared per stage: ingestion is a batch job (total time matters),
+# /chat is judged on tail latency
+METRICS = [("ingest", "total_s"), ("chat", "p50_ms"), ("chat", "p95_ms"), ("ingest", "peak_rss_mb"),
+           ("chat", "peak_rss_mb")]
+
+# Differences below these are noise, whatever the ratio
+MIN_DELTA = {"total_s": 0.05, "p50_ms": 2.0, "p95_ms": 2.0, "peak_rss_mb": 10.0}
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_results(baseline, candidate, threshold=0.1):
+    """Returns rows (section, stage, metric, old, new, change, regressed) for stages in both results."""
+    rows = []
+    for section, metric in METRICS:
+        old_stages = baseline.get(section, {}).get("stages", {})
+        new_stages = candidate.get(section, {}).get("stages", {})
+        for stage in old_stages:
+            old = old_stages[stage].get(metric)
+            new = new_stages.get(stage, {}).get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            regressed = change > threshold and new - old > MIN_DELTA[metric]
+            rows.append((section, stage, metric, old, new, change, regressed))
+    return rows
+
+
+def unmatched_stages(baseline, candidate):
+    """(section, stage, "baseline" or "current") for stages recorded in only one of the results."""
+    unmatched = []
+    for section in sorted({section for section, _ in METRICS}):
+        old_stages = baseline.get(section, {}).get("stages", {})
+        new_stages = candidate.get(section, {}).get("stages", {})
+        unmatched += [(section, stage, "baseline") for stage in old_stages if stage not in new_stages]
+        unmatched += [(section, stage, "current") for stage in new_stages if stage not in old_stages]
+    return unmatched
+
+
+def _describe(results):
+    git = results.get("git", {})
+    commit = (git.get("commit") or "?")[:8] + ("+dirty" if git.get("dirty") else "")
+    return f"{commit} {results.get('label') or ''}".strip()
+
+
+def print_comparison(baseline, candidate, threshold=0.1, baseline_name=None):
+    rows = compare_results(baseline, candidate, threshold)
+    print(f"\nCompared with {baseline_name or _describe(baseline)} -> {_describe(candidate)} "
+          f"(regression: > {threshold:.0%} worse)")
+    print(f"{'stage':<26} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}")
+    for section, stage, metric, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{stage:<26} {metric:<12} {old:>10.3f} {new:>10.3f} {change:>+8.1%}{flag}")
+
+    for section, key in [("ingest", "vectors_per_s"), ("chat", "requests_per_s")]:
+        old = baseline.get(section, {}).get(key)
+        new = candidate.get(section, {}).get(key)
+        if old and new:
+            print(f"{section + ' ' + key:<39} {old:>10.2f} {new:>10.2f} {(new - old) / old:>+8.1%}")
+
+    # A stage that stopped being recorded would otherwise drop out of the comparison unnoticed
+    for section, stage, only_in in unmatched_stages(baseline, candidate):
+        print(f"Note: {section} stage '{stage}' was only recorded in the {only_in} run; not compared.")
+
+    if baseline.get("config") != candidate.get("config"):
+        print("Note: the two runs used different benchmark settings.")
+    return [row for row in rows if row[-1]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark results files")
+    parser.add_argument("files", nargs="*", help="BASELINE CANDIDATE (default: the two latest results)")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--results", default=harness.RESULTS_DIR, help="Folder searched for the latest results")
+    args = parser.parse_args()
+
+    files = args.files
+    if not files:
+        latest = harness.latest_results(args.results)
+        files = [harness.latest_results(args.results, exclude=latest), latest]
+    if len(files) != 2 or not all(files):
+        parser.error("need two results files")
+
+    regressions = print_comparison(load(files[0]), load(files[1]), args.threshold,
+                                   baseline_name=os.path.basename(files[0]))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,112 @@
+import re
+import time
+import zlib
+
+import numpy as np
+
+from src.ingestion.container import FilesystemContainerClient
+from src.retrieval.upsert import FakeIndex
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddingModel:
+    """
+    Offline stand-in for the SentenceTransformer model: feature-hashed bag of words, so texts
+    sharing words get similar vectors and retrieval returns meaningful matches.
+    `latency_per_text` seconds are slept per encoded text to emulate model compute.
+    """
+
+    def __init__(self, dimension=384, latency_per_text=0.0):
+        self.dimension = dimension
+        self.latency_per_text = latency_per_text
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], normalize_embeddings=normalize_embeddings)[0]
+
+        vectors = np.zeros((len(sentences), self.dimension), dtype=np.float32)
+        for row, text in enumerate(sentences):
+            for word in _WORD_RE.findall(text.lower()):
+                h = zlib.crc32(word.encode("utf-8"))
+                vectors[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        if self.latency_per_text:
+            time.sleep(self.latency_per_text * len(sentences))
+        return vectors
+
+
+class FakeVectorIndex(FakeIndex):
+    """
+    upsert.FakeIndex (network latency, optional 503s, request size limit) plus a brute-force
+    query(), so the same fake serves ingestion and the /chat path.
+    """
+
+    def __init__(self, query_latency=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.query_latency = query_latency
+        self._matrix = None
+        self._ids = []
+
+    def upsert(self, vectors):
+        result = super().upsert(vectors)
+        with self.lock:
+            self._matrix = None
+        return result
+
+    def delete(self, ids=None, delete_all=False):
+        super().delete(ids=ids, delete_all=delete_all)
+        with self.lock:
+            self._matrix = None
+
+    def query(self, vector, top_k=5, include_metadata=False, include_values=False, **kwargs):
+        time.sleep(self.query_latency)
+        with self.lock:
+            if self._matrix is None:
+                self._ids = list(self.vectors)
+                self._matrix = np.array([self.vectors[i]["values"] for i in self._ids], dtype=np.float32).reshape(
+                    len(self._ids), -1)
+            matrix, ids = self._matrix, self._ids
+
+        if not ids:
+            return {"matches": []}
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        best = np.argsort(-scores)[:top_k]
+
+        matches = []
+        for i in best:
+            match = {"id": ids[i], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = self.vectors[ids[i]].get("metadata", {})
+            if include_values:
+                match["values"] = matrix[i].tolist()
+            matches.append(match)
+        return {"matches": matches}
+
+
+class _FakeBlobServiceClient:
+    def __init__(self, root):
+        self.root = root
+
+    def get_container_client(self, container_name):
+        return FilesystemContainerClient(self.root)
+
+
+def fake_blob_service(root):
+    """
+    Replacement for azure.storage.blob.BlobServiceClient (patched into read_data) whose
+    containers are the directory `root`.
+    """
+    class FakeBlobServiceClient:
+        @staticmethod
+        def from_connection_string(connection_string, **kwargs):
+            return _FakeBlobServiceClient(root)
+
+    return FakeBlobServiceClient
@@ -0,0 +1,238 @@
+import functools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ------------------------------
+# MEMORY
+# ------------------------------
+def current_rss():
+    """Resident set size of this process in bytes (Linux /proc; None where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss(who=resource.RUSAGE_SELF):
+    """Peak RSS in bytes so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def process_memory(pid):
+    """
+    {"rss", "pss", "uss"} of one process in bytes (Linux smaps_rollup; None where unavailable).
+    PSS splits each shared page between the processes mapping it, so summing PSS over a
+    process tree counts copy-on-write shared memory (a preloaded model) only once.
+    """
+    fields = {"Rss:": "rss", "Pss:": "pss", "Private_Clean:": "uss", "Private_Dirty:": "uss"}
+    usage = {"rss": 0, "pss": 0, "uss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    usage[fields[parts[0]]] += int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return usage
+
+
+def process_tree(pid):
+    """`pid` and all of its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the parent pid follows the closing parenthesis
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+class MemorySampler:
+    """
+    Samples this process's RSS every `interval` seconds on a background thread, so the peak
+    of any time window (one stage) can be read back afterwards. Unlike tracemalloc it sees
+    native allocations (PyMuPDF, Camelot, the model) and adds no overhead to the code measured.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if current_rss() is None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append((time.perf_counter(), current_rss()))
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def peak(self, start, end):
+        values = [rss for t, rss in self.samples if start <= t <= end]
+        return max(values) if values else None
+
+
+# ------------------------------
+# STAGE TIMING
+# ------------------------------
+class StageRecorder:
+    """
+    Times named stages. `wrap(module, "function", "stage")` swaps a module attribute for a timed
+    wrapper (callers look functions up on the module, so they pick it up); `restore()` undoes
+    every wrap. Each call's (start, end) is kept for latency percentiles and peak memory.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self._patches = []
+
+    def record(self, stage, start, end):
+        with self.lock:
+            self.calls.setdefault(stage, []).append((start, end))
+
+    def time(self, stage):
+        recorder = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                recorder.record(stage, self.start, time.perf_counter())
+
+        return _Timer()
+
+    def wrap(self, module, name, stage):
+        original = getattr(module, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, start, time.perf_counter())
+
+        setattr(module, name, timed)
+        self._patches.append((module, name, original))
+
+    def patch(self, module, name, value):
+        """Replaces a module attribute (fakes), restored together with the wraps."""
+        self._patches.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def restore(self):
+        for module, name, original in reversed(self._patches):
+            setattr(module, name, original)
+        self._patches.clear()
+
+    def summary(self, sampler=None):
+        stages = {}
+        for stage, calls in self.calls.items():
+            durations = np.array([end - start for start, end in calls]) * 1000
+            stats = {
+                "calls": len(calls),
+                "total_s": round(float(durations.sum()) / 1000, 4),
+                "mean_ms": round(float(durations.mean()), 3),
+                "max_ms": round(float(durations.max()), 3),
+            }
+            for p in (50, 90, 95, 99):
+                stats[f"p{p}_ms"] = round(float(np.percentile(durations, p)), 3)
+            if sampler is not None:
+                peaks = [sampler.peak(start, end) for start, end in calls]
+                peaks = [p for p in peaks if p is not None]
+                stats["peak_rss_mb"] = round(max(peaks) / 1e6, 1) if peaks else None
+            stages[stage] = stats
+        return stages
+
+
+# ------------------------------
+# RESULTS
+# ------------------------------
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def save_results(results, folder=RESULTS_DIR, label=None):
+    """Writes results to `folder/<UTC time>-<commit>[-label].json` and returns the path."""
+    os.makedirs(folder, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    commit = (results.get("git", {}).get("commit") or "nogit")[:8]
+    name = f"{stamp}-{commit}" + (f"-{label}" if label else "") + ".json"
+    path = os.path.join(folder, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def latest_results(folder=RESULTS_DIR, exclude=None):
+    if not os.path.isdir(folder):
+        return None
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".json"))
+    paths = [p for p in paths if p != exclude]
+    return paths[-1] if paths else None
+
+
+def print_stages(title, stages):
+    print(f"\n{title}")
+    print(f"{'stage':<26} {'calls':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for stage, s in stages.items():
+        peak = f"{s['peak_rss_mb']:.0f}" if s.get("peak_rss_mb") else "-"
+        print(f"{stage:<26} {s['calls']:>6} {s['total_s']:>9.3f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+              f"{s['p99_ms']:>9.2f} {peak:>8}")
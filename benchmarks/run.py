@@ -0,0 +1,242 @@
+"""
+Offline end-to-end benchmark: generates a synthetic PDF, runs the real ingestion pipeline
+(run_pipeline) and the /chat endpoint against local fakes of Azure Blob, Gemini, the embedding
+model, Pinecone and Groq, and reports per-stage latency percentiles, throughput and peak memory.
+
+    python -m benchmarks.run --pages 100 --queries 200 --concurrency 8 --baseline latest
+
+Results are saved under benchmarks/results/ (see benchmarks/compare.py).
+"""
+import argparse
+import asyncio
+import functools
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import compare, harness, synthetic
+from benchmarks.fakes import FakeVectorIndex, HashingEmbeddingModel, fake_blob_service
+from src import main
+from src.app import app as chat_api
+from src.app import chat_app, concurrency
+from src.app.fake_llm import FakeLLMClient
+from src.embeddings import embedding
+from src.ingestion import captioning, formula, img, parallel, read_data, streaming, table
+from src.processing import chunking
+from src.retrieval import upsert, vector_store
+from src.utils import registry
+
+BLOB_NAME = "benchmark.pdf"
+
+
+def install_fakes(recorder, args, blob_root):
+    """Points every external service at a local fake; returns the vector index used."""
+    recorder.patch(read_data, "BlobServiceClient", fake_blob_service(blob_root))
+    recorder.patch(main, "CONN_STR", "benchmark")
+    recorder.patch(main, "CONTAINER", "benchmark")
+    recorder.patch(main, "BLOB_NAME", BLOB_NAME)
+    recorder.patch(main, "GOOGLE_API_KEY", "benchmark")  # captions and embedding only run with a key
+
+    captioner = captioning.FakeCaptioner(latency=args.caption_latency)
+    limiter = captioning.RateLimiter(requests_per_minute=args.caption_rpm, tokens_per_minute=10 ** 9)
+    recorder.patch(captioning, "shared_limiter", lambda: limiter)
+    recorder.patch(img, "generate_image_captions",
+                   functools.partial(img.generate_image_captions, captioner=captioner))
+    recorder.patch(streaming, "stream_document",
+                   functools.partial(streaming.stream_document, captioner=captioner))
+    recorder.patch(main, "INGEST_STREAMING", args.stream)
+
+    if args.embedder == "fake":
+        registry.override("embedding_model", HashingEmbeddingModel(latency_per_text=args.embed_latency))
+
+    if args.index == "local":
+        index = vector_store.get_index(backend="local")
+    else:
+        index = FakeVectorIndex(latency=args.index_latency, query_latency=args.index_latency)
+    recorder.patch(vector_store, "get_index", lambda *a, **k: index)
+    registry.override("vector_index", index)
+
+    registry.override("llm_client", FakeLLMClient(first_token_delay=args.llm_first_token, token_delay=args.llm_token))
+    return index
+
+
+# ------------------------------
+# INGESTION
+# ------------------------------
+def bench_ingestion(recorder, args, sampler):
+    recorder.wrap(read_data, "download_blob_to_file", "download")
+    recorder.wrap(parallel, "extract_all", "extract")
+    # In-process only: with --workers > 1 these run in the pool and are not recorded
+    recorder.wrap(img, "collect_images", "extract.images")
+    recorder.wrap(table, "find_table_pages", "extract.table_prefilter")
+    recorder.wrap(parallel, "read_page_tables", "extract.tables")
+    recorder.wrap(formula, "find_formulas", "extract.formulas")
+    recorder.wrap(chunking, "read_page_texts", "extract.text")
+    recorder.wrap(chunking, "chunk_page_texts", "extract.chunking")
+    recorder.wrap(img, "generate_image_captions", "captions")
+    recorder.wrap(main, "embed_content", "embeddings")
+    recorder.wrap(vector_store, "upsert_vectors", "upsert")
+    # --stream: the stages overlap, so only the whole run and its individual calls are timed
+    recorder.wrap(streaming, "stream_document", "stream")
+    recorder.wrap(embedding, "encode_matrix", "embeddings.call")
+    recorder.wrap(upsert, "upsert_records", "upsert.call")
+
+    with recorder.time("ingest.total") as timer:
+        main.run_pipeline(workers=args.workers, resume=False)
+    seconds = time.perf_counter() - timer.start
+
+    vectors = main.IngestionManifest().ids_for(BLOB_NAME)
+    return {
+        "stages": recorder.summary(sampler),
+        "vectors": len(vectors),
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(args.pages / seconds, 2),
+        "vectors_per_s": round(len(vectors) / seconds, 2),
+    }
+
+
+# ------------------------------
+# CHAT
+# ------------------------------
+async def _send_queries(queries, concurrency_limit, recorder=None):
+    transport = httpx.ASGITransport(app=chat_api.app)
+    slots = asyncio.Semaphore(concurrency_limit)
+    statuses = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        async def ask(i, query):
+            async with slots:
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"query": query, "session_id": f"bench-{i % concurrency_limit}"})
+                if recorder:
+                    recorder.record("chat.request", start, time.perf_counter())
+                statuses.append(response.status_code)
+
+        await asyncio.gather(*(ask(i, q) for i, q in enumerate(queries)))
+    return statuses
+
+
+def bench_chat(args, sampler):
+    queries = synthetic.make_queries(args.queries + args.warmup, seed=args.seed)
+    warmup, queries = queries[:args.warmup], queries[args.warmup:]
+
+    # Thread pools, the batcher and the model are started outside the measured requests
+    asyncio.run(_send_queries(warmup, 1))
+
+    chat = harness.StageRecorder()
+    chat.wrap(chat_app, "get_embedding", "chat.embed")
+    chat.wrap(chat_app, "build_context", "chat.context")
+    chat.wrap(chat_app, "generate_answer", "chat.generate")
+    try:
+        start = time.perf_counter()
+        statuses = asyncio.run(_send_queries(queries, args.concurrency, recorder=chat))
+        seconds = time.perf_counter() - start
+    finally:
+        chat.restore()
+
+    return {
+        "stages": chat.summary(sampler),
+        "requests": len(queries),
+        "errors": sum(status != 200 for status in statuses),
+        "seconds": round(seconds, 3),
+        "requests_per_s": round(len(queries) / seconds, 2) if seconds else 0.0,
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Offline ingestion + /chat benchmark with synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--table-every", type=int, default=5, help="A ruled table every N pages (0: none)")
+    parser.add_argument("--image-every", type=int, default=4, help="A figure every N pages (0: none)")
+    parser.add_argument("--formulas", type=int, default=1, help="Formula lines per page")
+    parser.add_argument("--no-logo", action="store_true", help="No repeated header image")
+    parser.add_argument("--workers", type=int, default=1, help="Extraction worker processes")
+    parser.add_argument("--stream", action="store_true", help="Streaming ingestion (overlapping stages)")
+    parser.add_argument("--queries", type=int, default=100, help="Measured /chat requests")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured /chat requests sent first")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /chat requests")
+    parser.add_argument("--embedder", choices=["fake", "real"], default="fake",
+                        help="'real' loads EMBEDDING_MODEL_NAME (EMBEDDING_BACKEND=torch or onnx)")
+    parser.add_argument("--index", choices=["fake", "local"], default="fake",
+                        help="In-memory Pinecone fake, or the embedded LocalVectorStore")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Fake model seconds per text")
+    parser.add_argument("--caption-latency", type=float, default=0.2, help="Fake caption call seconds")
+    parser.add_argument("--caption-rpm", type=int, default=10 ** 6, help="Caption rate limit (default: none)")
+    parser.add_argument("--index-latency", type=float, default=0.02, help="Fake index round trip seconds")
+    parser.add_argument("--llm-first-token", type=float, default=0.05)
+    parser.add_argument("--llm-token", type=float, default=0.002)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-ingest", action="store_true", help="Index the PDF unmeasured, benchmark /chat only")
+    parser.add_argument("--skip-chat", action="store_true")
+    parser.add_argument("--label", default=None, help="Appended to the results file name")
+    parser.add_argument("--output", default=harness.RESULTS_DIR)
+    parser.add_argument("--baseline", default=None, help="Results file to compare with, or 'latest'")
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args()
+
+    repo_root = os.getcwd()
+    output = os.path.join(repo_root, args.output)
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    blob_root = os.path.join(workdir, "blobs")
+    os.makedirs(blob_root)
+    document = synthetic.make_pdf(
+        os.path.join(blob_root, BLOB_NAME), pages=args.pages, table_every=args.table_every,
+        image_every=args.image_every, formulas_per_page=args.formulas, logo=not args.no_logo, seed=args.seed,
+    )
+    document["bytes"] = os.path.getsize(os.path.join(blob_root, BLOB_NAME))
+    print(f"[benchmark] Synthetic PDF: {document}")
+
+    # Caches, manifests, artifacts and extracted files all use relative paths: keep them in the workdir
+    os.chdir(workdir)
+    recorder = harness.StageRecorder()
+    sampler = harness.MemorySampler().start()
+    results = {
+        "label": args.label,
+        "git": harness.git_revision(),
+        "environment": harness.environment(),
+        "config": vars(args),
+        "document": document,
+    }
+    try:
+        install_fakes(recorder, args, blob_root)
+        if args.skip_ingest:
+            main.run_pipeline(workers=args.workers, resume=False)
+        else:
+            results["ingest"] = bench_ingestion(recorder, args, sampler)
+        if not args.skip_chat:
+            results["chat"] = bench_chat(args, sampler)
+    finally:
+        sampler.stop()
+        recorder.restore()
+        concurrency.shutdown()
+        os.chdir(repo_root)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results["peak_rss_mb"] = round(harness.max_rss() / 1e6, 1)
+    results["children_peak_rss_mb"] = round(harness.max_rss(resource.RUSAGE_CHILDREN) / 1e6, 1)
+
+    if "ingest" in results:
+        r = results["ingest"]
+        harness.print_stages(f"Ingestion: {r['vectors']} vectors in {r['seconds']}s "
+                             f"({r['pages_per_s']} pages/s, {r['vectors_per_s']} vectors/s)", r["stages"])
+    if "chat" in results:
+        r = results["chat"]
+        harness.print_stages(f"/chat: {r['requests']} requests at concurrency {args.concurrency} in {r['seconds']}s "
+                             f"({r['requests_per_s']} req/s, {r['errors']} errors)", r["stages"])
+    print(f"\nPeak RSS: {results['peak_rss_mb']} MB (worker processes: {results['children_peak_rss_mb']} MB)")
+
+    path = harness.save_results(results, output, args.label)
+    print(f"[benchmark] Results saved to '{path}'.")
+
+    baseline = harness.latest_results(output, exclude=path) if args.baseline == "latest" else args.baseline
+    if baseline:
+        compare.print_comparison(compare.load(baseline), results, baseline_name=os.path.basename(baseline))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,149 @@
+"""
+Memory of the chat server with several workers, per serving mode:
+
+    uvicorn   uvicorn --workers N: every worker loads its own embedding model
+    preload   gunicorn -c gunicorn.conf.py: the model is loaded once, before forking (copy-on-write)
+    remote    an embedding server process (src/embeddings/server.py) + N workers with EMBEDDING_BACKEND=remote
+
+    python -m benchmarks.serving_memory --workers 4 --modes uvicorn preload remote
+
+Each mode is started with 1 and N workers (fake LLM, empty local index), warmed up with
+/chat requests, and measured as the PSS summed over all its processes. The difference
+divided by N - 1 is the memory one additional worker costs.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import harness, synthetic
+
+MODES = ["uvicorn", "preload", "remote"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(mode, workers, port, workdir):
+    """Starts one server configuration; returns its top-level processes."""
+    env = dict(os.environ, LLM_BACKEND="fake", VECTOR_BACKEND="local",
+               LOCAL_INDEX_PATH=os.path.join(workdir, "index"), PYTHONUNBUFFERED="1")
+    log = open(os.path.join(workdir, f"{mode}-{workers}.log"), "a")
+    app = ["src.app.app:app"]
+    processes = []
+
+    if mode == "remote":
+        env["EMBEDDING_SOCKET"] = os.path.join(workdir, "embedding.sock")
+        backend = env.get("EMBEDDING_BACKEND", "torch")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "src.embeddings.server", "--backend", "torch" if backend == "remote" else backend],
+            env=env, cwd=harness.REPO_ROOT, stdout=log, stderr=subprocess.STDOUT))
+        env["EMBEDDING_BACKEND"] = "remote"
+
+    if mode == "preload":
+        env.update(WEB_CONCURRENCY=str(workers), PORT=str(port))
+        command = [sys.executable, "-m", "gunicorn", *app, "-c", "gunicorn.conf.py"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", *app, "--port", str(port), "--workers", str(workers)]
+    processes.append(subprocess.Popen(command, env=env, cwd=harness.REPO_ROOT, stdout=log, stderr=subprocess.STDOUT))
+    return processes
+
+
+def _wait_ready(port, workers, timeout):
+    """Polls /ready until it answers 200 several times in a row (connections land on different workers)."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            # A new connection per poll, so the kernel spreads them over the workers
+            status = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=5).status_code
+        except httpx.HTTPError:
+            status = None
+        streak = streak + 1 if status == 200 else 0
+        if streak >= 4 * workers:
+            return
+        time.sleep(0.1)
+    raise TimeoutError(f"server on port {port} not ready after {timeout}s")
+
+
+def _measure(processes):
+    usage = {"rss": 0, "pss": 0, "uss": 0, "processes": 0}
+    for process in processes:
+        for pid in harness.process_tree(process.pid):
+            memory = harness.process_memory(pid)
+            if memory:
+                usage["processes"] += 1
+                for key in ("rss", "pss", "uss"):
+                    usage[key] += memory[key]
+    return usage
+
+
+def _stop(processes):
+    # uvicorn, gunicorn and the embedding server all shut down cleanly on SIGINT
+    for process in reversed(processes):
+        process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def measure_mode(mode, workers, queries, timeout, workdir):
+    port = _free_port()
+    processes = _start(mode, workers, port, workdir)
+    try:
+        _wait_ready(port, workers, timeout)
+        for query in queries:
+            response = httpx.post(f"http://127.0.0.1:{port}/chat", json={"query": query}, timeout=60)
+            if response.status_code != 200:
+                raise RuntimeError(f"{mode}: /chat answered {response.status_code}: {response.text[:200]}")
+        time.sleep(1.0)
+        return _measure(processes)
+    finally:
+        _stop(processes)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="PSS of the chat server per serving mode and worker count")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--queries", type=int, default=20, help="/chat requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for readiness")
+    args = parser.parse_args()
+    if args.workers < 2:
+        parser.error("--workers must be at least 2")
+
+    queries = synthetic.make_queries(args.queries)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="rag-serving-") as workdir:
+        for mode in args.modes:
+            one = measure_mode(mode, 1, queries, args.timeout, workdir)
+            many = measure_mode(mode, args.workers, queries, args.timeout, workdir)
+            per_worker = (many["pss"] - one["pss"]) / (args.workers - 1)
+            results[mode] = {"one": one, "many": many, "per_worker": per_worker}
+            print(f"[serving] {mode}: {one['pss'] / 1e6:.0f} MB with 1 worker, {many['pss'] / 1e6:.0f} MB "
+                  f"with {args.workers}, {per_worker / 1e6:.0f} MB per additional worker")
+
+    mb = 1e6
+    print(f"\n{'mode':<9} {'PSS 1 worker':>13} {f'PSS {args.workers} workers':>15} {'RSS sum':>9} "
+          f"{'per extra worker':>17} {'saved per worker':>17}")
+    baseline = results.get("uvicorn", {}).get("per_worker")
+    for mode, r in results.items():
+        saved = f"{(baseline - r['per_worker']) / mb:>14.0f} MB" if baseline is not None else f"{'-':>17}"
+        print(f"{mode:<9} {r['one']['pss'] / mb:>10.0f} MB {r['many']['pss'] / mb:>12.0f} MB "
+              f"{r['many']['rss'] / mb:>6.0f} MB {r['per_worker'] / mb:>14.0f} MB {saved}")
+    return results
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,118 @@
+import io
+import random
+
+import fitz
+import numpy as np
+from PIL import Image
+
+# Domain-flavoured vocabulary so chunks, queries and retrieval look like a technical document
+VOCABULARY = (
+    "attention transformer encoder decoder embedding vector token sequence layer head query key value "
+    "softmax gradient optimizer learning rate batch normalization dropout residual connection weight "
+    "matrix projection dimension position encoding training inference latency throughput memory cache "
+    "index retrieval document chunk table figure formula model parameter loss accuracy benchmark dataset"
+).split()
+
+FORMULAS = [
+    "Attention(Q, K, V) = softmax(Q K^T / sqrt(d_k)) V",
+    "PE(pos, 2i) = sin(pos / 10000^(2i / d_model))",
+    "PE(pos, 2i+1) = cos(pos / 10000^(2i / d_model))",
+    "FFN(x) = max(0, x W_1 + b_1) W_2 + b_2",
+    "lrate = d_model^(-0.5) * min(step^(-0.5), step * warmup^(-1.5))",
+    "LayerNorm(x) = (x - mean(x)) / sqrt(var(x) + eps)",
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+
+
+def _sentence(rng, words=14):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def _paragraphs(rng, sentences):
+    return "\n\n".join(" ".join(_sentence(rng) for _ in range(5)) for _ in range(max(1, sentences // 5)))
+
+
+def _png(width, height, seed):
+    """Noisy gradient image: incompressible enough to pass the 5 KB image filter."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(gradient + rng.normal(0, 40, (height, width, 3)), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _draw_table(page, rng, top, rows=8, cols=4):
+    """Ruled grid with a header row: the lattice layout Camelot (and the table prefilter) detect."""
+    cell_w = (PAGE_WIDTH - 2 * MARGIN) / cols
+    cell_h = 20
+    header = ["Model", "Params", "Latency (ms)", "Accuracy"][:cols]
+    for r in range(rows + 1):
+        for c in range(cols):
+            rect = fitz.Rect(MARGIN + c * cell_w, top + r * cell_h, MARGIN + (c + 1) * cell_w, top + (r + 1) * cell_h)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+            if r == 0:
+                text = header[c] if c < len(header) else f"Col {c + 1}"
+            elif c == 0:
+                text = f"{rng.choice(VOCABULARY)}-{r}"
+            else:
+                text = f"{rng.uniform(0, 100):.2f}"
+            page.insert_text((rect.x0 + 4, rect.y1 - 6), text, fontsize=9)
+    return top + (rows + 1) * cell_h
+
+
+def make_pdf(path, pages=50, table_every=5, image_every=4, formulas_per_page=1, sentences_per_page=30,
+             logo=True, seed=0):
+    """
+    Writes a synthetic PDF to `path` and returns a summary of what it contains:
+    text on every page, a ruled table every `table_every` pages, a distinct figure every
+    `image_every` pages, `formulas_per_page` formula lines per page and, with `logo`, the same
+    header image on every page (exercises image deduplication). 0 disables a feature.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    logo_png = _png(320, 80, seed) if logo else None
+    summary = {"pages": pages, "tables": 0, "images": 0, "formulas": 0, "logo": bool(logo)}
+
+    for page_index in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        top = MARGIN
+        if logo_png:
+            page.insert_image(fitz.Rect(MARGIN, 15, MARGIN + 120, 45), stream=logo_png)
+
+        page.insert_text((MARGIN, top + 10), f"Section {page_index + 1}: {rng.choice(VOCABULARY).title()} "
+                                             f"and {rng.choice(VOCABULARY)}", fontsize=14)
+        top += 30
+
+        if table_every and page_index % table_every == table_every - 1:
+            top = _draw_table(page, rng, top) + 20
+            summary["tables"] += 1
+
+        if image_every and page_index % image_every == 0:
+            page.insert_image(fitz.Rect(MARGIN, top, MARGIN + 300, top + 180), stream=_png(600, 360, seed + page_index + 1))
+            top += 200
+            summary["images"] += 1
+
+        for i in range(formulas_per_page):
+            page.insert_text((MARGIN, top + 10), FORMULAS[(page_index + i) % len(FORMULAS)], fontsize=10)
+            top += 20
+            summary["formulas"] += 1
+
+        body = fitz.Rect(MARGIN, top + 10, PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN)
+        page.insert_textbox(body, _paragraphs(rng, sentences_per_page), fontsize=9)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return summary
+
+
+def make_queries(count, seed=0):
+    """Distinct questions in the document's vocabulary (distinct so the query caches don't hide retrieval)."""
+    rng = random.Random(seed + 1)
+    queries = set()
+    while len(queries) < count:
+        a, b, c = rng.sample(VOCABULARY, 3)
+        queries.add(f"How does the {a} {b} affect {c}?")
+    return sorted(queries)
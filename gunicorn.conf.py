@@ -0,0 +1,37 @@
+"""
+Multi-worker serving with one copy of the embedding model:
+
+    gunicorn src.app.app:app -c gunicorn.conf.py
+
+The master imports the app and loads the embedding model before forking, so every worker
+shares the model weights copy-on-write instead of loading its own copy. Network clients
+(Groq, Pinecone) are not fork-safe and are created per worker after the fork.
+"""
+import gc
+import os
+
+from src.utils import registry
+
+# --- Configuration ---
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+
+def on_starting(server):
+    # A remote model is only a socket client: each worker opens its own connections
+    if registry.EMBEDDING_BACKEND != "remote":
+        registry.get_embedding_model().encode(["warm up"])
+
+
+def pre_fork(server, worker):
+    # Objects that exist now move to the permanent generation: the garbage collector stops
+    # writing to their headers, which would otherwise copy the shared pages into every worker
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    registry.reset(keep=("embedding_model",) if registry.EMBEDDING_BACKEND != "remote" else ())
@@ -1,36 +1,71 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+import threading
 import uvicorn
+import json
+import time
 import os
 
-from src.app import chat_app
+from src.app import chat_app, concurrency
+from src.app.concurrency import DependencyTimeout
+from src.app.sessions import new_session_id
+from src.utils import metrics, registry
+
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+
+# Warm up models/clients in the background so the server starts listening immediately;
+# /ready reports 503 until warm-up has finished. Without warm-up everything loads lazily
+# on first use, so the server is ready right away.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=registry.warm_up, name="warm-up", daemon=True).start()
+    else:
+        registry.mark_ready()
+    yield
+    concurrency.shutdown()
 
 
 # Initialize App
 app = FastAPI(
     title="Multi-RAG Chatbot API",
     description="API for chatting with PDF documents (Text, Tables, Images, Formulas)",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 
 # Static folder setup
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-STATIC_DIR = os.path.join(os.path.dirname(BASE_DIR), "static")
+STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# Per-request traces (X-Trace-Id), request counters and latency histograms for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 # Request/Response Models
 class ChatRequest(BaseModel):
     query: str
+    # Omitted: the answer starts a new session and returns its id; send it back to continue it
+    session_id: str | None = None
+
+
+class ResetRequest(BaseModel):
+    session_id: str
 
 
 class ChatResponse(BaseModel):
     answer: str
+    session_id: str
     sources: list[str] = []
+    prompt_tokens_saved: int = 0
 
 
 # Greeting detector
@@ -45,10 +80,72 @@ def serve_ui():
     return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
 
+# Liveness: the process is up
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+# Readiness: models and clients are loaded, safe to route traffic here
+@app.get("/ready")
+def ready():
+    if registry.is_ready():
+        return {"status": "ready"}
+
+    error = registry.warmup_error()
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error" if error else "warming_up", "detail": str(error) if error else None}
+    )
+
+
+# Prometheus metrics: stage latencies, LLM tokens, HTTP requests, plus the stats endpoints below as gauges
+metrics.gauge_callback("rag_cache_entries", "Entries in the query caches.",
+                       lambda: {name: s["size"] for name, s in chat_app.cache_stats().items()}, ["cache"])
+metrics.gauge_callback("rag_cache_hit_ratio", "Hit ratio of the query caches.",
+                       lambda: {name: s["hit_rate"] for name, s in chat_app.cache_stats().items()}, ["cache"])
+metrics.gauge_callback("rag_sessions", "Chat sessions held in memory.", lambda: chat_app.sessions.stats()["sessions"])
+metrics.gauge_callback("rag_embedding_batch_size_avg", "Average micro-batch size of query embeddings.",
+                       lambda: chat_app.embedding_batcher.stats()["avg_batch_size"])
+metrics.gauge_callback("rag_prompt_tokens_saved", "Prompt tokens saved by context assembly since start.",
+                       lambda: chat_app.prompt_stats.stats()["tokens_saved"])
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Query/retrieval cache counters
+@app.get("/cache/stats")
+def cache_stats():
+    return chat_app.cache_stats()
+
+
+# Prompt tokens saved by context merging/packing
+@app.get("/prompt/stats")
+def prompt_stats():
+    return chat_app.prompt_stats.stats()
+
+
+# Conversation memory held per session
+@app.get("/sessions/stats")
+def session_stats():
+    return chat_app.sessions.stats()
+
+
+# Achieved query-embedding batch sizes
+@app.get("/embedding/stats")
+def embedding_stats():
+    return chat_app.embedding_batcher.stats()
+
+
 # Chat Endpoint
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
 
+    session_id = request.session_id or new_session_id()
+
     try:
         user_query = request.query.strip()
 
@@ -56,34 +153,124 @@ async def chat_endpoint(request: ChatRequest):
         if is_greeting(user_query):
             return ChatResponse(
                 answer="Hi 👋 How can I help you?",
+                session_id=session_id,
                 sources=[]
             )
 
+        # Every blocking call runs on its dependency's bounded thread pool with a timeout,
+        # so the event loop keeps serving other requests meanwhile.
+
         # Generate embedding
-        query_vector = chat_app.get_embedding(user_query)
+        query_vector = await concurrency.embedding.run(chat_app.get_embedding, user_query)
 
-        # Retrieve context from Pinecone
-        contexts = chat_app.retrieve_context(query_vector)
+        # Retrieve context from the vector index, merged and packed into the prompt budget
+        contexts, report = await concurrency.vector_store.run(chat_app.build_context, user_query, query_vector)
 
         if not contexts:
             return ChatResponse(
                 answer="I couldn't find relevant information in the document.",
+                session_id=session_id,
                 sources=[]
             )
 
         # Generate answer using LLM
-        answer = chat_app.generate_answer(user_query, contexts)
+        answer = await concurrency.llm.run(chat_app.generate_answer, user_query, contexts, session_id)
 
         return ChatResponse(
             answer=answer,
-            sources=contexts
+            session_id=session_id,
+            sources=contexts,
+            prompt_tokens_saved=report["tokens_saved"]
         )
 
+    except DependencyTimeout as e:
+        print("Chat Timeout:", e)
+        raise HTTPException(status_code=504, detail=str(e))
+
     except Exception as e:
         print("Chat Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Reset Chat Endpoint: forget one session's conversation memory
+@app.post("/reset-chat")
+def reset_chat_endpoint(request: ResetRequest):
+    chat_app.reset_chat(request.session_id)
+    return {"status": "reset", "session_id": request.session_id}
+
+
+# Server-Sent Event helper
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Streaming Chat Endpoint (SSE): sources first, then LLM tokens as they arrive
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+
+    user_query = request.query.strip()
+    session_id = request.session_id or new_session_id()
+    start = time.perf_counter()
+
+    async def events():
+        try:
+            # Handle greetings separately
+            if is_greeting(user_query):
+                yield sse_event("sources", [])
+                yield sse_event("token", {"text": "Hi 👋 How can I help you?"})
+                yield sse_event("done", {"ttft_ms": 0, "session_id": session_id})
+                return
+
+            query_vector = await concurrency.embedding.run(chat_app.get_embedding, user_query)
+            contexts, report = await concurrency.vector_store.run(chat_app.build_context, user_query, query_vector)
+
+            yield sse_event("sources", contexts)
+
+            if not contexts:
+                yield sse_event("token", {"text": "I couldn't find relevant information in the document."})
+                yield sse_event("done", {"ttft_ms": None, "session_id": session_id})
+                return
+
+            ttft_ms = None
+            # One LLM slot is held for the whole stream; each token read is bounded by the LLM timeout
+            async with concurrency.llm.slot() as llm_call:
+                tokens = chat_app.stream_answer(user_query, contexts, session_id)
+                try:
+                    while True:
+                        token = await llm_call(next, tokens, None)
+                        if token is None:
+                            break
+
+                        if ttft_ms is None:
+                            ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                            print(f"[chat] Time to first token: {ttft_ms} ms")
+
+                        if await http_request.is_disconnected():
+                            print("[chat] Client disconnected, stopping stream.")
+                            return
+
+                        yield sse_event("token", {"text": token})
+                finally:
+                    # Completes memory bookkeeping, or closes the LLM stream if we stopped early
+                    try:
+                        await llm_call(tokens.close)
+                    except (ValueError, DependencyTimeout):
+                        pass  # a timed-out read is still running on its thread; the slot is freed when it finishes
+
+            yield sse_event("done", {"ttft_ms": ttft_ms, "prompt_tokens_saved": report["tokens_saved"],
+                                     "session_id": session_id})
+
+        except Exception as e:
+            print("Chat Stream Error:", e)
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id}
+    )
+
+
 # Run Server
 if __name__ == "__main__":
     print("🚀 Server Running...")
@@ -1,102 +1,222 @@
 import os
 import dotenv
-from groq import Groq
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
+import hashlib
+import threading
+import time
+from array import array
+
+from src.app.prompt import PromptStats, assemble_context
+from src.app.sessions import DEFAULT_SESSION, SessionStore
+from src.embeddings.batcher import MicroBatcher
+from src.retrieval import vector_store
+from src.utils import metrics, registry
+from src.utils.cache import TTLCache, read_index_version
+from src.utils.tokens import count_tokens
 
 
 # Load environment variables
 dotenv.load_dotenv()
 
 
-# --- Configuration ---
-PINECONE_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-
-# --- Initialize Groq ---
-client = Groq(api_key=GROQ_API_KEY)
+# --- Models & Clients ---
+# The embedding model, Groq client and vector index (Pinecone or local) are created lazily by the
+# shared registry (once per process) instead of at import time.
 
 
-# --- Initialize Pinecone ---
-pc = Pinecone(api_key=PINECONE_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
-
-
-# --- Local Embedding Model ---
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+# ------------------------------
+# QUERY / RETRIEVAL CACHE
+# ------------------------------
+# query text -> embedding, and (embedding, top_k) -> contexts.
+# Retrieval results are dropped whenever the ingestion pipeline bumps the index version.
+CACHE_MAX_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "600"))
+
+embedding_cache = TTLCache(max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+retrieval_cache = TTLCache(max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+
+# Seconds between two reads of the version record of a remote index
+INDEX_VERSION_POLL = float(os.getenv("INDEX_VERSION_POLL", "5"))
+
+_index_version = None
+_index_version_lock = threading.Lock()
+_remote_version = None
+_remote_checked_at = float("-inf")
+
+
+def _current_index_version():
+    """
+    The mtime of the local stamp file (ingestion on this host) and the version record of a
+    remote index (ingestion anywhere), the latter fetched at most every INDEX_VERSION_POLL seconds.
+    """
+    global _remote_version, _remote_checked_at
+    if time.monotonic() - _remote_checked_at >= INDEX_VERSION_POLL:
+        with _index_version_lock:
+            if time.monotonic() - _remote_checked_at >= INDEX_VERSION_POLL:
+                _remote_checked_at = time.monotonic()
+                try:
+                    _remote_version = vector_store.fetch_index_version(registry.get_vector_index())
+                except Exception as e:
+                    print(f"[chat_app] Could not read the index version: {e}")  # keep the last one
+    return read_index_version(), _remote_version
+
+
+def _check_index_version():
+    """Clear cached retrievals if the index was re-ingested since they were stored."""
+    global _index_version
+    current = _current_index_version()
+    if current != _index_version:
+        with _index_version_lock:
+            if current != _index_version:
+                retrieval_cache.clear()
+                if _index_version is not None:
+                    print("[chat_app] Index changed, retrieval cache cleared.")
+                _index_version = current
+
+
+def cache_stats():
+    return {
+        "embedding": embedding_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+    }
 
 
 # ------------------------------
 # MEMORY SUPPORT
 # ------------------------------
-conversation_memory = []
+# Per-session history, token-budgeted and evicted when idle (see sessions.py)
+sessions = SessionStore()
 
 
-def reset_chat():
-    """Clear chat history memory."""
-    global conversation_memory
-    conversation_memory = []
+def reset_chat(session_id=DEFAULT_SESSION):
+    """Clear chat history memory for one session."""
+    sessions.reset(session_id)
     return True
 
 
 # ----------------------------------------------------------
 # 1️⃣ EMBEDDING FUNCTION
 # ----------------------------------------------------------
+# Concurrent queries are coalesced into one model.encode call (see embeddings/batcher.py)
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "1") == "1"
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "2"))
+
+
+def _encode_batch(texts):
+    return registry.get_embedding_model().encode(texts, batch_size=len(texts))
+
+
+embedding_batcher = MicroBatcher(_encode_batch, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS)
+
+
 def get_embedding(text):
-    embedding = model.encode([text])[0]
-    return embedding.tolist()
+    with metrics.stage("embedding") as span:
+        key = " ".join(text.split())
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            span.set(cache="hit")
+            return cached
+
+        if EMBED_BATCHING:
+            embedding = embedding_batcher.embed(text).tolist()
+        else:
+            embedding = registry.get_embedding_model().encode([text])[0].tolist()
+        embedding_cache.put(key, embedding)
+        span.set(cache="miss")
+        return embedding
 
 
 # ----------------------------------------------------------
-# 2️⃣ RETRIEVE CONTEXT FROM PINECONE
+# 2️⃣ RETRIEVE CONTEXT FROM THE VECTOR INDEX
 # ----------------------------------------------------------
-def retrieve_context(query_vector, top_k=5):
+@metrics.stage("retrieval")
+def retrieve_matches(query_vector, top_k=5):
+    """Top matches as {"text", "score", "type", "source"} dicts, best first."""
 
-    results = index.query(
-        vector=query_vector,
-        top_k=top_k,
-        include_metadata=True
-    )
+    _check_index_version()
+    key = (hashlib.sha1(array("f", query_vector).tobytes()).hexdigest(), top_k)
+    cached = retrieval_cache.get(key)
+    if cached is not None:
+        return [dict(m) for m in cached]
 
-    contexts = []
+    with metrics.stage("vector_query", top_k=top_k):
+        results = registry.get_vector_index().query(
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+
+    matches = []
 
     for match in results["matches"]:
 
         metadata = match.get("metadata", {})
 
         # Support BOTH metadata keys (important fix)
-        if "text" in metadata:
-            contexts.append(metadata["text"])
+        text = metadata.get("text", metadata.get("content"))
+        if text is None:
+            continue
+
+        matches.append({
+            "text": text,
+            "score": match.get("score", 0.0),
+            "type": metadata.get("type", "text"),
+            "source": metadata.get("source"),
+        })
+
+    retrieval_cache.put(key, tuple(matches))
+    return [dict(m) for m in matches]
 
-        elif "content" in metadata:
-            contexts.append(metadata["content"])
 
-    return contexts
+def retrieve_context(query_vector, top_k=5):
+    return [m["text"] for m in retrieve_matches(query_vector, top_k)]
+
+
+# Merged, de-duplicated, token-budgeted contexts (see prompt.py)
+prompt_stats = PromptStats()
+
+
+def build_context(query, query_vector, top_k=5):
+    """Retrieves and assembles the contexts for one query; returns (contexts, report)."""
+    with metrics.stage("context") as span:
+        contexts, report = assemble_context(query, retrieve_matches(query_vector, top_k))
+        span.set(contexts=report["contexts"], tokens=report["tokens_after"], tokens_saved=report["tokens_saved"])
+    prompt_stats.add(report)
+    print(f"[chat_app] Context: {report['matches']} matches -> {report['contexts']} contexts, "
+          f"{report['tokens_after']} tokens ({report['tokens_saved']} saved).")
+    return contexts, report
 
 
 # ----------------------------------------------------------
 # 3️⃣ GENERATE ANSWER USING GROQ (LLAMA 3.3 70B)
 # ----------------------------------------------------------
-def generate_answer(query, context_list):
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
 
-    global conversation_memory
+LLM_TOKENS = metrics.counter("rag_llm_tokens_total", "LLM prompt and completion tokens.", ["kind"])
+LLM_TTFT_SECONDS = metrics.histogram("rag_llm_time_to_first_token_seconds", "Streamed LLM time to first token.")
 
-    context_text = "\n\n---\n\n".join(context_list)
 
-    # Build memory context
-    memory_text = ""
+def _record_usage(span, usage, prompt, answer):
+    """Token counts from the API's usage block, or estimated when it has none (streams)."""
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(answer)
+        span["tokens_estimated"] = True
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, kind="completion")
+    span.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
 
-    if conversation_memory:
 
-        memory_text = "\n\nPrevious conversation:\n"
+def build_prompt(query, context_list, session_id=DEFAULT_SESSION):
 
-        for q, a in conversation_memory:
-            memory_text += f"User: {q}\nAssistant: {a}\n"
+    context_text = "\n\n---\n\n".join(context_list)
+
+    # Build memory context
+    memory_text = sessions.memory_text(session_id)
 
     # Improved RAG prompt (less strict than before)
-    prompt = f"""
+    return f"""
 You are a helpful AI assistant answering questions from a document.
 
 Use the provided context to answer clearly.
@@ -117,29 +237,83 @@ Question:
 Answer:
 """
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    answer = response.choices[0].message.content
+def generate_answer(query, context_list, session_id=DEFAULT_SESSION):
+
+    prompt = build_prompt(query, context_list, session_id)
+
+    with metrics.stage("llm", model=LLM_MODEL) as span:
+        response = registry.get_llm_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+
+        answer = response.choices[0].message.content
+        _record_usage(span.attrs, getattr(response, "usage", None), prompt, answer)
 
     # Save conversation memory
-    conversation_memory.append((query, answer))
+    sessions.append(session_id, query, answer)
 
     return answer
 
 
+def stream_answer(query, context_list, session_id=DEFAULT_SESSION):
+    """
+    Yields answer tokens as the LLM produces them.
+    The full answer is saved to conversation memory only if the stream runs to completion;
+    closing the generator early (client disconnect) closes the upstream stream instead.
+    """
+    prompt = build_prompt(query, context_list, session_id)
+
+    stream = registry.get_llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        stream=True
+    )
+
+    # Timed by hand: the steps of this generator run on different threads (see app.py)
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    parts = []
+    completed = False
+    try:
+        for chunk in stream:
+            # Groq reports usage on the last chunk (x_groq.usage)
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    LLM_TTFT_SECONDS.observe(first_token)
+                parts.append(token)
+                yield token
+        completed = True
+    finally:
+        answer = "".join(parts)
+        attrs = {"model": LLM_MODEL, "completed": completed,
+                 "ttft_ms": round(first_token * 1000, 1) if first_token is not None else None}
+        _record_usage(attrs, usage, prompt, answer)
+        metrics.record_stage("llm_stream", time.perf_counter() - start, **attrs)
+        if completed:
+            # Save conversation memory
+            sessions.append(session_id, query, answer)
+        elif hasattr(stream, "close"):
+            stream.close()
+
+
 # ----------------------------------------------------------
 # 4️⃣ FASTAPI HELPER FUNCTION
 # ----------------------------------------------------------
-def process_query(query):
+def process_query(query, session_id=DEFAULT_SESSION):
 
     query_vector = get_embedding(query)
 
-    contexts = retrieve_context(query_vector)
+    contexts, _ = build_context(query, query_vector)
 
     if not contexts:
 
@@ -148,7 +322,7 @@ def process_query(query):
             "sources": []
         }
 
-    answer = generate_answer(query, contexts)
+    answer = generate_answer(query, contexts, session_id)
 
     return {
         "answer": answer,
@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from src.utils import metrics
+
+SLOT_WAIT_SECONDS = metrics.histogram("rag_dependency_slot_wait_seconds",
+                                      "Time requests waited for a free dependency slot.", ["dependency"])
+TIMEOUTS = metrics.counter("rag_dependency_timeouts_total", "Dependency slot or call timeouts.", ["dependency"])
+
+
+class DependencyTimeout(Exception):
+    """A dependency did not answer (or free a slot) within its timeout."""
+
+
+class Dependency:
+    """
+    Bounded access to one blocking dependency (embedding model, vector DB, LLM) from async code.
+
+    Calls run on the dependency's own thread pool, so a slow LLM cannot use up the threads the
+    embedding model or vector DB need, and never on the event loop. At most `max_concurrency`
+    requests use the dependency at once; waiting for a slot and each call are both bounded by `timeout`.
+    A slot is only freed once its call has finished on its thread: calls abandoned after a timeout
+    keep their slot, so a hung dependency makes new requests time out waiting for a slot instead of
+    queueing behind threads that are still busy.
+    """
+
+    def __init__(self, name, max_concurrency, timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _acquire(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc(dependency=self.name)
+            raise DependencyTimeout(f"{self.name}: no free slot within {self.timeout}s")
+        SLOT_WAIT_SECONDS.observe(time.perf_counter() - start, dependency=self.name)
+
+    def _release_after(self, futures):
+        """Frees the slot once every one of `futures` has finished on its thread."""
+        loop = asyncio.get_running_loop()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                loop.call_soon_threadsafe(self.semaphore.release)
+            except RuntimeError:
+                pass  # the event loop is already closed (shutdown)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    async def _call(self, fn, args):
+        """
+        Runs fn(*args) on the dependency's threads and waits at most `timeout` for it, returning
+        its result. On a timeout, the DependencyTimeout carries the still-running call as
+        `future`. The caller's context is copied, so stages run on the thread join the request's trace.
+        """
+        future = self.executor.submit(contextvars.copy_context().run, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc(dependency=self.name)
+            error = DependencyTimeout(f"{self.name}: no response within {self.timeout}s")
+            error.future = future
+            raise error
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one concurrency slot for several calls, e.g. for the whole duration of a token
+        stream. Yields an async `call(fn, *args)` that runs one call in the slot.
+        """
+        await self._acquire()
+        abandoned = []
+
+        async def call(fn, *args):
+            try:
+                return await self._call(fn, args)
+            except DependencyTimeout as e:
+                abandoned.append(e.future)
+                raise
+
+        try:
+            yield call
+        finally:
+            running = [future for future in abandoned if not future.done()]
+            if running:
+                self._release_after(running)
+            else:
+                self.semaphore.release()
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) in a slot of its own."""
+        async with self.slot() as call:
+            return await call(fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Per-dependency limits ---
+# Encodes are coalesced by chat_app's micro-batcher, so these threads mostly wait on a shared batch;
+# the limit should be at least EMBED_MAX_BATCH_SIZE for batches to fill up
+embedding = Dependency(
+    "embedding",
+    max_concurrency=int(os.getenv("EMBED_CONCURRENCY", "32")),
+    timeout=float(os.getenv("EMBED_TIMEOUT", "10")),
+)
+vector_store = Dependency(
+    "vector_store",
+    max_concurrency=int(os.getenv("VECTOR_CONCURRENCY", "16")),
+    timeout=float(os.getenv("VECTOR_TIMEOUT", "10")),
+)
+llm = Dependency(
+    "llm",
+    max_concurrency=int(os.getenv("LLM_CONCURRENCY", "32")),
+    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+)
+
+
+def shutdown():
+    for dependency in (embedding, vector_store, llm):
+        dependency.shutdown()
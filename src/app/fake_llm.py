@@ -0,0 +1,45 @@
+import time
+from types import SimpleNamespace
+
+
+class FakeLLMClient:
+    """
+    Offline stand-in for the Groq client (client.chat.completions.create).
+    Answers by echoing the start of the question, emitting one word per `token_delay` seconds
+    after `first_token_delay`, both with stream=False and stream=True.
+    """
+
+    def __init__(self, first_token_delay=0.05, token_delay=0.01, answer_words=40):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.answer_words = answer_words
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _answer_tokens(self, messages):
+        prompt = messages[-1]["content"]
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        words = f"Based on the document, here is what I found about: {question}".split()
+        words += ["lorem"] * max(0, self.answer_words - len(words))
+        return [word + " " for word in words[:self.answer_words]]
+
+    def _usage(self, messages, tokens):
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens),
+                               total_tokens=prompt_tokens + len(tokens))
+
+    def _create(self, model=None, messages=None, stream=False, **kwargs):
+        tokens = self._answer_tokens(messages)
+
+        if not stream:
+            time.sleep(self.first_token_delay + self.token_delay * len(tokens))
+            message = SimpleNamespace(content="".join(tokens).strip())
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)],
+                                   usage=self._usage(messages, tokens))
+
+        def chunks():
+            time.sleep(self.first_token_delay)
+            for token in tokens:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+                time.sleep(self.token_delay)
+
+        return chunks()
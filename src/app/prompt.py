@@ -0,0 +1,225 @@
+import os
+import re
+import threading
+
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+TABLE_TOKEN_BUDGET = int(os.getenv("TABLE_TOKEN_BUDGET", "400"))
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+MIN_OVERLAP_CHARS = 32
+MIN_PARTIAL_TOKENS = 100
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+# ------------------------------
+# OVERLAPPING CHUNKS
+# ------------------------------
+def _overlap(a, b):
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if under MIN_OVERLAP_CHARS)."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+
+    start = a.find(probe)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def merge_overlapping(matches):
+    """
+    Joins text chunks of the same source that overlap (neighbouring chunks share up to
+    `overlap` characters), so the shared text appears once. The merged chunk keeps the best score.
+    """
+    merged = [dict(m) for m in matches]
+    count = 0
+    changed = True
+    while changed:
+        changed = False
+        for i, a in enumerate(merged):
+            for j, b in enumerate(merged):
+                if i == j or a["type"] != "text" or b["type"] != "text" or a["source"] != b["source"]:
+                    continue
+                n = _overlap(a["text"], b["text"])
+                if n:
+                    a["text"] = a["text"] + b["text"][n:]
+                    a["score"] = max(a["score"], b["score"])
+                    del merged[j]
+                    count += 1
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged, count
+
+
+# ------------------------------
+# NEAR DUPLICATES
+# ------------------------------
+def _shingles(text, size=3):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(matches, threshold=DUPLICATE_THRESHOLD):
+    """
+    Drops a context when most of its word 3-grams already appear in a better-scored one
+    (containment >= threshold), which also catches a chunk fully contained in a merged one.
+    """
+    kept = []
+    dropped = 0
+    for match in sorted(matches, key=lambda m: m["score"], reverse=True):
+        shingles = _shingles(match["text"])
+        duplicate = False
+        for other in kept:
+            common = len(shingles & other["_shingles"])
+            if common / max(1, min(len(shingles), len(other["_shingles"]))) >= threshold:
+                # Keep the longer text under the better score if this one contains the other
+                if len(shingles) > len(other["_shingles"]):
+                    other["text"], other["_shingles"] = match["text"], shingles
+                duplicate = True
+                break
+        if duplicate:
+            dropped += 1
+        else:
+            kept.append({**match, "_shingles": shingles})
+
+    for match in kept:
+        del match["_shingles"]
+    return kept, dropped
+
+
+# ------------------------------
+# TABLES
+# ------------------------------
+def _is_table_row(line):
+    return line.lstrip().startswith("|")
+
+
+def truncate_table(text, query, max_tokens=TABLE_TOKEN_BUDGET):
+    """
+    Shrinks a markdown table to `max_tokens`: keeps the title, header, separator and first data
+    row (save_tables writes no header, so the real column names are usually that row), then the
+    rows sharing most words with the query, then leading rows; rows stay in document order.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text, False
+
+    lines = text.split("\n")
+    first_row = next((i for i, line in enumerate(lines) if _is_table_row(line)), None)
+    if first_row is None:
+        return truncate_to_tokens(text, max_tokens), True
+
+    # Title lines, the header row and its |---| separator
+    end = first_row + 1
+    if end < len(lines) and set(lines[end].strip()) <= set("|:- "):
+        end += 1
+    head = lines[:end]
+    rows = [line for line in lines[end:] if _is_table_row(line)]
+    if not rows:
+        return truncate_to_tokens(text, max_tokens), True
+
+    keep = {0}
+    budget = max_tokens - count_tokens("\n".join(head)) - count_tokens(rows[0]) - 10
+    query_words = set(_WORD_RE.findall(query.lower()))
+
+    def relevance(i):
+        return len(query_words & set(_WORD_RE.findall(rows[i].lower())))
+
+    ranked = sorted(range(1, len(rows)), key=lambda i: (-relevance(i), i))
+    for i in ranked:
+        tokens = count_tokens(rows[i])
+        if tokens > budget:
+            break
+        keep.add(i)
+        budget -= tokens
+
+    omitted = len(rows) - len(keep)
+    body = [rows[i] for i in sorted(keep)]
+    if omitted:
+        body.append(f"| ... {omitted} more rows omitted |")
+    return "\n".join(head + body), True
+
+
+# ------------------------------
+# ASSEMBLY
+# ------------------------------
+def assemble_context(query, matches, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turns retrieved matches ({"text", "score", "type", "source"}) into the prompt contexts:
+    merges overlapping chunks, drops near duplicates, shrinks tables, then packs contexts by
+    score into `budget` tokens (the last one is cut to fit if enough room remains).
+    Returns (contexts, report); report["tokens_saved"] is versus joining every match verbatim.
+    """
+    tokens_before = count_tokens(CONTEXT_SEPARATOR.join(m["text"] for m in matches))
+
+    merged, merges = merge_overlapping(matches)
+    unique, duplicates = drop_near_duplicates(merged)
+
+    tables_truncated = 0
+    for match in unique:
+        if match["type"] == "table":
+            match["text"], truncated = truncate_table(match["text"], query)
+            tables_truncated += truncated
+
+    contexts = []
+    remaining = budget
+    for match in sorted(unique, key=lambda m: m["score"], reverse=True):
+        tokens = count_tokens(match["text"])
+        if tokens <= remaining:
+            contexts.append(match["text"])
+            remaining -= tokens
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            contexts.append(truncate_to_tokens(match["text"], remaining))
+            break
+        else:
+            break
+
+    tokens_after = count_tokens(CONTEXT_SEPARATOR.join(contexts))
+    report = {
+        "matches": len(matches),
+        "contexts": len(contexts),
+        "merged": merges,
+        "duplicates_dropped": duplicates,
+        "tables_truncated": tables_truncated,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
+    return contexts, report
+
+
+class PromptStats:
+    """Running totals of prompt tokens saved by assemble_context."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def add(self, report):
+        with self.lock:
+            self.requests += 1
+            self.tokens_before += report["tokens_before"]
+            self.tokens_after += report["tokens_after"]
+
+    def stats(self):
+        with self.lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                "requests": self.requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": saved,
+                "avg_tokens_saved": saved / self.requests if self.requests else 0.0,
+            }
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+# --- Configuration ---
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1500"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+
+# Only for single-user, in-process use (process_query); the API never falls back to it
+DEFAULT_SESSION = "default"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def new_session_id():
+    """A random, unguessable session id for a client that did not send one."""
+    return uuid.uuid4().hex
+
+
+class Session:
+    def __init__(self):
+        self.turns = []  # [(question, answer, tokens)]
+        self.summary = ""
+        self.history_tokens = 0
+        self.last_used = time.monotonic()
+
+
+def _summarize_turn(question, answer):
+    """One line per dropped turn: the question and the first sentence of the answer."""
+    first_sentence = _SENTENCE_END.split(answer.strip(), 1)[0]
+    return f"- Asked: {truncate_to_tokens(question, 40)} -> {truncate_to_tokens(first_sentence, 60)}"
+
+
+class SessionStore:
+    """
+    Conversation memory per session ID, with a bounded footprint.
+
+    Each session keeps its most recent turns verbatim up to `history_tokens`; older turns are
+    folded into a short extractive summary capped at `summary_tokens` (oldest lines dropped first).
+    At most `max_sessions` sessions are kept (least recently used evicted), and sessions idle
+    for longer than `ttl` seconds are dropped.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL,
+                 history_tokens=SESSION_HISTORY_TOKENS, summary_tokens=SESSION_SUMMARY_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.evictions = 0
+        self.compactions = 0
+
+    def _get(self, session_id, create):
+        now = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session is not None and now - session.last_used > self.ttl:
+            del self.sessions[session_id]
+            self.evictions += 1
+            session = None
+
+        if session is None:
+            if not create:
+                return None
+            session = Session()
+            self.sessions[session_id] = session
+            self._evict(now)
+
+        session.last_used = now
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _evict(self, now):
+        # Oldest first: expired sessions, then least recently used beyond max_sessions
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - session.last_used <= self.ttl:
+                break
+            del self.sessions[session_id]
+            self.evictions += 1
+
+    def _compact(self, session):
+        while session.history_tokens > self.history_tokens and len(session.turns) > 1:
+            question, answer, tokens = session.turns.pop(0)
+            session.history_tokens -= tokens
+            lines = (session.summary.splitlines() if session.summary else [])
+            lines.append(_summarize_turn(question, answer))
+            while len(lines) > 1 and count_tokens("\n".join(lines)) > self.summary_tokens:
+                lines.pop(0)
+            session.summary = "\n".join(lines)
+            self.compactions += 1
+
+    def append(self, session_id, question, answer):
+        # A single turn may not exceed the whole history budget on its own
+        question = truncate_to_tokens(question, self.history_tokens // 4)
+        answer = truncate_to_tokens(answer, self.history_tokens - count_tokens(question))
+        tokens = count_tokens(question) + count_tokens(answer)
+        with self.lock:
+            session = self._get(session_id, create=True)
+            session.turns.append((question, answer, tokens))
+            session.history_tokens += tokens
+            self._compact(session)
+
+    def memory_text(self, session_id):
+        """The session's summary and recent turns, formatted for the prompt ('' if none)."""
+        with self.lock:
+            session = self._get(session_id, create=False)
+            if session is None or (not session.turns and not session.summary):
+                return ""
+            summary = session.summary
+            turns = list(session.turns)
+
+        text = ""
+        if summary:
+            text += "\n\nEarlier in the conversation:\n" + summary + "\n"
+        if turns:
+            text += "\n\nPrevious conversation:\n"
+            for q, a, _ in turns:
+                text += f"User: {q}\nAssistant: {a}\n"
+        return text
+
+    def reset(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.sessions.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "history_tokens": sum(s.history_tokens for s in self.sessions.values()),
+                "evictions": self.evictions,
+                "compactions": self.compactions,
+            }
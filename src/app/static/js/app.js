@@ -74,8 +74,15 @@ function loadHistoryList() {
     });
 }
 
+// Unguessable, so other clients cannot read or reset this conversation.
+// crypto.randomUUID only exists over HTTPS or on localhost; getRandomValues works everywhere.
+function newSessionId() {
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, b => b.toString(16).padStart(2, "0")).join("");
+}
+
 function startNewChat() {
-    currentSessionId = "session_" + Date.now();
+    currentSessionId = "session_" + newSessionId();
     sessions[currentSessionId] = [];
     saveSessions();
     loadHistoryList();
@@ -97,6 +104,13 @@ function saveMessage(role, text, sources = []) {
 }
 
 function clearHistory() {
+    Object.keys(sessions).forEach(id => {
+        fetch("/reset-chat", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ session_id: id }),
+        });
+    });
     sessions = {};
     localStorage.clear();
     loadHistoryList();
@@ -130,17 +144,54 @@ async function handleSend() {
     const loadingId = addLoading();
 
     try {
-        const response = await fetch("/chat", {
+        // Stream the answer: sources arrive first, then tokens as the LLM produces them
+        const response = await fetch("/chat/stream", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ query: text }),
+            body: JSON.stringify({ query: text, session_id: currentSessionId }),
         });
 
-        const data = await response.json();
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let answer = "";
+        let sources = [];
+        let streamDiv = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const event = (raw.match(/^event: (.*)$/m) || [])[1];
+                const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || "null");
+
+                if (event === "sources") {
+                    sources = data;
+                } else if (event === "token") {
+                    answer += data.text;
+                    if (!streamDiv) {
+                        removeMessage(loadingId);
+                        streamDiv = addStreamingMessage();
+                    }
+                    streamDiv.querySelector(".bubble").innerHTML = answer.replace(/\n/g, "<br>");
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                } else if (event === "error") {
+                    answer = answer || "Error: " + data.detail;
+                }
+            }
+        }
+
         removeMessage(loadingId);
+        if (streamDiv) streamDiv.remove();
 
-        addMessage(data.answer, "bot", data.sources);
-        saveMessage("bot", data.answer, data.sources);
+        addMessage(answer, "bot", sources);
+        saveMessage("bot", answer, sources);
 
     } catch {
         removeMessage(loadingId);
@@ -221,6 +272,16 @@ function addMessage(text, sender, sources = []) {
     chatContainer.scrollTop = chatContainer.scrollHeight;
 }
 
+function addStreamingMessage() {
+    const div = document.createElement("div");
+    div.className = "message bot";
+    div.innerHTML = `
+        <div class="avatar">🤖</div>
+        <div class="bubble"></div>`;
+    chatContainer.appendChild(div);
+    return div;
+}
+
 function addLoading() {
     const id = "loading-" + Date.now();
     const div = document.createElement("div");
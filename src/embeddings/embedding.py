@@ -1,41 +1,110 @@
+import os
 import time
-from sentence_transformers import SentenceTransformer
+from itertools import islice
 
-print("[embedding] Loading local embedding model...")
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-print("[embedding] Model loaded successfully!")
+import numpy as np
 
+from src.utils import metrics, registry
 
-def generate_embeddings(chunks):
+# --- Configuration ---
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# Items read ahead per streaming window; sorting by length happens within a window
+EMBEDDING_WINDOW_SIZE = int(os.getenv("EMBEDDING_WINDOW_SIZE", "8192"))
+
+
+class ThroughputReport:
     """
-    Generates embeddings for text chunks using local HuggingFace embeddings
-    (No API call required, fully free, no quota issues)
+    Accumulates embedded chunk counts and encode time across calls.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def add(self, chunks, seconds):
+        self.chunks += chunks
+        self.seconds += seconds
+
+    @property
+    def chunks_per_second(self):
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return f"{self.chunks} chunks in {self.seconds:.2f}s ({self.chunks_per_second:.1f} chunks/s)"
+
+
+EMBEDDED_CHUNKS = metrics.counter("rag_embedded_chunks_total", "Chunks embedded for ingestion.")
+
+
+def embedding_dimension():
+    return registry.get_embedding_model().get_sentence_embedding_dimension()
+
+
+def encode_matrix(chunks, batch_size=EMBEDDING_BATCH_SIZE, normalize=False, report=None):
+    """
+    Embeds a list of texts into one contiguous float32 matrix (row i = chunks[i]).
+    Texts are encoded in length order so each batch pads to similar lengths,
+    then written back to their original rows.
     """
+    embeddings = np.empty((len(chunks), embedding_dimension()), dtype=np.float32)
     if not chunks:
-        print("[embedding] No chunks to embed.")
-        return []
+        return embeddings
 
-    embeddings = []
-    batch_size = 10
+    model = registry.get_embedding_model()
+    start_time = time.perf_counter()
+    order = np.argsort([len(c) for c in chunks], kind="stable")
 
-    print(f"[embedding] Generating embeddings for {len(chunks)} chunks...")
+    with metrics.stage("embed_chunks", chunks=len(chunks)):
+        for start in range(0, len(chunks), batch_size):
+            rows = order[start:start + batch_size]
+            batch = [chunks[i] for i in rows]
+            embeddings[rows] = model.encode(
+                batch,
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False,
+            )
+    EMBEDDED_CHUNKS.inc(len(chunks))
 
-    try:
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
+    if report is not None:
+        report.add(len(chunks), time.perf_counter() - start_time)
+    return embeddings
+
+
+def iter_embeddings(chunks, batch_size=EMBEDDING_BATCH_SIZE, normalize=False,
+                    window_size=EMBEDDING_WINDOW_SIZE, report=None):
+    """
+    Streams embeddings for any iterable of texts without holding it all in memory.
+    Yields (texts, matrix) pairs of at most `window_size` items, in input order.
+    """
+    iterator = iter(chunks)
+    while True:
+        window = list(islice(iterator, window_size))
+        if not window:
+            return
+        yield window, encode_matrix(window, batch_size=batch_size, normalize=normalize, report=report)
 
-            # Generate embeddings locally
-            batch_embeddings = model.encode(batch)
 
-            # Convert from NumPy to Python list
-            for vector in batch_embeddings:
-                embeddings.append(vector.tolist())
+def generate_embeddings(chunks, batch_size=EMBEDDING_BATCH_SIZE, normalize=False):
+    """
+    Generates embeddings for text chunks using local HuggingFace embeddings
+    (No API call required, fully free, no quota issues).
+    Returns a float32 NumPy matrix with one row per chunk.
+    """
+    if not chunks:
+        print("[embedding] No chunks to embed.")
+        return np.empty((0, embedding_dimension()), dtype=np.float32)
+
+    print(f"[embedding] Generating embeddings for {len(chunks)} chunks (batch size {batch_size})...")
 
-            time.sleep(0.2)  # safe
+    try:
+        report = ThroughputReport()
+        embeddings = encode_matrix(chunks, batch_size=batch_size, normalize=normalize, report=report)
 
-        print(f"[embedding] Successfully generated {len(embeddings)} vectors.")
+        print(f"[embedding] Successfully generated {len(embeddings)} vectors: {report}.")
         return embeddings
 
     except Exception as e:
         print(f"[embedding] Error generating embeddings: {e}")
-        return []
+        return np.empty((0, embedding_dimension()), dtype=np.float32)
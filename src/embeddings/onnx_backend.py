@@ -0,0 +1,282 @@
+import argparse
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+
+# --- Configuration ---
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "0") == "1"   # use the int8 model written by `export --quantize`
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))          # 0 lets ONNX Runtime pick (one per physical core)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedding_config.json"
+
+PARITY_TEXTS = [
+    "What is the scaled dot-product attention formula?",
+    "Attention(Q, K, V) = softmax(Q K^T / sqrt(d_k)) V",
+    "The transformer uses multi-head attention in both the encoder and the decoder.",
+    "| Model | BLEU EN-DE | BLEU EN-FR | Training cost |",
+    "Image Description (Source: page3_img1.png): a diagram of the encoder stack with residual connections.",
+    "hello",
+    "Positional encodings use sine and cosine functions of different frequencies. " * 20,
+    "Wie funktioniert die Aufmerksamkeit im Transformer-Modell?",
+]
+
+
+class OnnxEmbeddingModel:
+    """
+    SentenceTransformer-compatible embedding model (encode / get_sentence_embedding_dimension)
+    running an exported transformer with ONNX Runtime and a Rust `tokenizers` tokenizer.
+    Mean pooling and normalization follow the pipeline recorded at export time.
+    Needs only numpy, onnxruntime and tokenizers: torch is never imported.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        config_path = os.path.join(model_dir, CONFIG_FILE)
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(
+                f"No exported model in '{model_dir}'. Run: python -m src.embeddings.onnx_backend export "
+                f"--output {model_dir} [--quantize]"
+            )
+        with open(config_path, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+
+        self.model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+        self.model_name = self.config["model_name"] + (" (onnx int8)" if quantized else " (onnx)")
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feed)[0]
+
+        # Mean over real (non-padding) tokens, as sentence-transformers' Pooling(mean) does
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Similar lengths per batch keep padding (wasted compute) low
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), max(1, batch_size)):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+
+        if self.config["normalize"] or normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+# ------------------------------
+# EXPORT (needs torch + sentence-transformers, not needed at serving time)
+# ------------------------------
+def export_model(model_name, output_dir, quantize=False, opset=17):
+    """
+    Exports the SentenceTransformer's transformer to ONNX (dynamic batch and sequence axes),
+    saves its tokenizer and the pooling/normalization settings, and with `quantize` also
+    writes a dynamically int8-quantized copy (weights int8, activations quantized at runtime).
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = next((m for m in model if type(m).__name__ == "Pooling"), None)
+    if pooling is not None and not getattr(pooling, "pooling_mode_mean_tokens", True):
+        raise ValueError(f"{model_name} does not use mean pooling; only mean pooling is supported.")
+
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic axes as given
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    print(f"[onnx] Exporting {model_name} to '{model_path}'...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(auto_model),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names},
+                          "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=opset,
+            **legacy,
+        )
+
+    tokenizer.save_pretrained(output_dir)
+    config = {
+        "model_name": model_name,
+        "dimension": getattr(model, "get_embedding_dimension", model.get_sentence_embedding_dimension)(),
+        "max_seq_length": model.max_seq_length,
+        "normalize": any(type(m).__name__ == "Normalize" for m in model),
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+        print(f"[onnx] Writing int8 model to '{quantized_path}'...")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    print(f"[onnx] Export complete: {config}")
+    return config
+
+
+# ------------------------------
+# PARITY AND BENCHMARK
+# ------------------------------
+def _torch_model(model_name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def parity(model_dir=ONNX_MODEL_DIR, texts=PARITY_TEXTS, min_cosine=None):
+    """
+    Cosine similarity between PyTorch and ONNX embeddings of the same texts, for the fp32 model
+    and (if exported) the int8 model. Returns {variant: (min, mean)}; raises AssertionError if
+    a minimum falls under `min_cosine` (default 0.9999 for fp32, 0.99 for int8).
+    """
+    with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+        model_name = json.load(f)["model_name"]
+    reference = _torch_model(model_name).encode(texts, normalize_embeddings=True)
+
+    results = {}
+    for quantized in (False, True):
+        if quantized and not os.path.exists(os.path.join(model_dir, QUANTIZED_MODEL_FILE)):
+            continue
+        onnx = OnnxEmbeddingModel(model_dir, quantized=quantized).encode(texts, normalize_embeddings=True)
+        cosines = np.sum(reference * onnx, axis=1)
+        variant = "int8" if quantized else "fp32"
+        results[variant] = (float(cosines.min()), float(cosines.mean()))
+        print(f"[onnx] Parity {variant}: min cosine {cosines.min():.6f}, mean {cosines.mean():.6f} over {len(texts)} texts")
+
+        threshold = min_cosine if min_cosine is not None else (0.99 if quantized else 0.9999)
+        assert cosines.min() >= threshold, f"{variant} parity below {threshold}: {cosines.min():.6f}"
+    return results
+
+
+def benchmark(model_dir=ONNX_MODEL_DIR, queries=200, batch_size=64, corpus=1024, include_torch=True):
+    """
+    Single-query latency (the /chat path) and batch throughput (ingestion) for PyTorch,
+    ONNX fp32 and ONNX int8.
+    """
+    with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+        model_name = json.load(f)["model_name"]
+
+    rng = np.random.default_rng(0)
+    words = " ".join(PARITY_TEXTS).split()
+    query_texts = [" ".join(rng.choice(words, 12)) for _ in range(queries)]
+    corpus_texts = [" ".join(rng.choice(words, 180)) for _ in range(corpus)]
+
+    backends = []
+    if include_torch:
+        backends.append(("torch", lambda: _torch_model(model_name)))
+    backends.append(("onnx fp32", lambda: OnnxEmbeddingModel(model_dir, quantized=False)))
+    if os.path.exists(os.path.join(model_dir, QUANTIZED_MODEL_FILE)):
+        backends.append(("onnx int8", lambda: OnnxEmbeddingModel(model_dir, quantized=True)))
+
+    results = {}
+    for name, load in backends:
+        start = time.perf_counter()
+        model = load()
+        load_seconds = time.perf_counter() - start
+        model.encode(query_texts[:4])  # warm-up
+
+        latencies = []
+        for text in query_texts:
+            start = time.perf_counter()
+            model.encode([text])
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        model.encode(corpus_texts, batch_size=batch_size)
+        throughput = len(corpus_texts) / (time.perf_counter() - start)
+
+        results[name] = {
+            "load_s": load_seconds,
+            "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+            "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+            "chunks_per_s": throughput,
+        }
+
+    print(f"\n{'backend':<10} {'load s':>7} {'query p50 ms':>13} {'query p95 ms':>13} {'chunks/s':>9}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['load_s']:>7.2f} {r['p50_ms']:>13.2f} {r['p95_ms']:>13.2f} {r['chunks_per_s']:>9.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX Runtime embedding backend: export, parity check, benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Export the SentenceTransformer model to ONNX")
+    export_parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    export_parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    export_parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+
+    parity_parser = commands.add_parser("parity", help="Compare ONNX and PyTorch embeddings")
+    parity_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parity_parser.add_argument("--min-cosine", type=float, default=None)
+
+    bench_parser = commands.add_parser("benchmark", help="Latency/throughput: PyTorch vs ONNX fp32 vs int8")
+    bench_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("--corpus", type=int, default=1024)
+    bench_parser.add_argument("--batch-size", type=int, default=64)
+    bench_parser.add_argument("--no-torch", action="store_true", help="Only the ONNX variants")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_model(args.model, args.output, quantize=args.quantize)
+    elif args.command == "parity":
+        parity(args.model_dir, min_cosine=args.min_cosine)
+    else:
+        benchmark(args.model_dir, queries=args.queries, batch_size=args.batch_size, corpus=args.corpus,
+                  include_torch=not args.no_torch)
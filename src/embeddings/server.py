@@ -0,0 +1,243 @@
+"""
+Local embedding inference process shared by every web worker.
+
+One process loads the embedding model; web workers started with EMBEDDING_BACKEND=remote
+send their texts over a unix socket instead of each loading their own copy. Requests from
+all workers are coalesced into shared batches (see batcher.py).
+
+    python -m src.embeddings.server --backend torch
+    EMBEDDING_BACKEND=remote uvicorn src.app.app:app --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from src.embeddings.batcher import MicroBatcher
+from src.utils import registry
+
+# --- Configuration ---
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/rag-embedding.sock")
+# How long a worker keeps retrying while the embedding server starts up
+EMBEDDING_CONNECT_TIMEOUT = float(os.getenv("EMBEDDING_CONNECT_TIMEOUT", "60"))
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+EMBEDDING_SERVER_BATCH_SIZE = int(os.getenv("EMBEDDING_SERVER_BATCH_SIZE", "64"))
+EMBEDDING_SERVER_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_WAIT_MS", "2"))
+
+_HEADER = struct.Struct("!I")
+
+
+# ------------------------------
+# FRAMING: 4-byte length, then the payload
+# ------------------------------
+def _send(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("embedding server connection closed")
+        received += n
+    return bytes(buffer)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return _recv_exactly(sock, size)
+
+
+# ------------------------------
+# SERVER
+# ------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    One worker connection. Each request is a JSON frame: {"op": "encode", "texts": [...]} is
+    answered with a JSON frame {"shape": [rows, dim]} and a frame of float32 rows,
+    {"op": "info"} with {"dimension": dim, "model": name}; failures with {"error": message}.
+    """
+
+    def handle(self):
+        while True:
+            try:
+                request = json.loads(_recv(self.request))
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                if request.get("op") == "info":
+                    _send(self.request, json.dumps(self.server.info).encode())
+                    continue
+                vectors = self.server.encode(request["texts"])
+            except Exception as e:
+                print(f"[embedding-server] Encode failed: {e}")
+                _send(self.request, json.dumps({"error": str(e)}).encode())
+                continue
+
+            _send(self.request, json.dumps({"shape": list(vectors.shape)}).encode())
+            _send(self.request, vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves `model.encode` on a unix socket. Every text goes through one MicroBatcher,
+    so concurrent requests from different workers share encode calls.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128  # every thread of every worker opens one connection
+
+    def __init__(self, socket_path, model, max_batch_size=EMBEDDING_SERVER_BATCH_SIZE,
+                 max_wait_ms=EMBEDDING_SERVER_WAIT_MS):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left over from a previous run
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+        self.socket_path = socket_path
+        self.model = model
+        self.dimension = model.get_sentence_embedding_dimension()
+        self.info = {"dimension": self.dimension, "model": str(getattr(model, "model_name", type(model).__name__))}
+        self.batcher = MicroBatcher(
+            lambda texts: model.encode(texts, batch_size=len(texts)),
+            max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+        )
+
+    def encode(self, texts):
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        futures = [self.batcher.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures]).astype(np.float32, copy=False)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path=EMBEDDING_SOCKET, backend="torch"):
+    """Loads the model with `backend` ("torch" or "onnx") and serves it until interrupted."""
+    if backend == "remote":
+        raise ValueError("The embedding server needs a local backend ('torch' or 'onnx').")
+
+    start = time.perf_counter()
+    model = registry.load_embedding_model(backend)
+    model.encode(["warm up"])
+    server = EmbeddingServer(socket_path, model)
+    print(f"[embedding-server] {server.info['model']} ({backend}) loaded in {time.perf_counter() - start:.2f}s, "
+          f"listening on '{socket_path}'")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[embedding-server] Stopped. Batches: {server.batcher.stats()}")
+
+
+# ------------------------------
+# CLIENT
+# ------------------------------
+class RemoteEmbeddingModel:
+    """
+    SentenceTransformer-compatible client of the embedding server (encode /
+    get_sentence_embedding_dimension). Each thread keeps its own connection; connections
+    are reopened after a fork or a dropped connection.
+    """
+
+    def __init__(self, socket_path=EMBEDDING_SOCKET, connect_timeout=EMBEDDING_CONNECT_TIMEOUT,
+                 timeout=EMBEDDING_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._info = None
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError, BlockingIOError) as e:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(
+                        f"No embedding server on '{self.socket_path}' ({e}). "
+                        "Start it with: python -m src.embeddings.server"
+                    ) from e
+                time.sleep(0.2)
+
+    def _connection(self):
+        if os.getpid() != self._pid:
+            # Forked: the parent's sockets belong to the parent
+            self._local = threading.local()
+            self._pid = os.getpid()
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, request):
+        # A dropped connection (server restart) is retried once on a new one
+        for attempt in range(2):
+            sock = self._connection()
+            try:
+                _send(sock, json.dumps(request).encode())
+                reply = json.loads(_recv(sock))
+                if "shape" in reply:
+                    body = _recv(sock)
+                    return np.frombuffer(body, dtype=np.float32).reshape(reply["shape"])
+                if "error" in reply:
+                    raise RuntimeError(f"Embedding server error: {reply['error']}")
+                return reply
+            except (ConnectionError, OSError):
+                self._drop_connection()
+                if attempt:
+                    raise
+
+    def info(self):
+        if self._info is None:
+            self._info = self._request({"op": "info"})
+        return self._info
+
+    def get_sentence_embedding_dimension(self):
+        return self.info()["dimension"]
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = self._request({"op": "encode", "texts": texts}).copy()
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the embedding model to local web workers over a unix socket")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=os.getenv("EMBEDDING_SERVER_BACKEND", "torch"))
+    args = parser.parse_args()
+    serve(args.socket, args.backend)
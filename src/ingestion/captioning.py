@@ -0,0 +1,274 @@
+import hashlib
+import io
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import metrics
+
+# --- Configuration ---
+CAPTION_MODEL = os.getenv("CAPTION_MODEL", "gemini-2.0-flash")
+CAPTION_WORKERS = int(os.getenv("CAPTION_WORKERS", "4"))
+CAPTION_RPM = int(os.getenv("CAPTION_RPM", "15"))
+CAPTION_TPM = int(os.getenv("CAPTION_TPM", "1000000"))
+CAPTION_TOKENS_PER_REQUEST = int(os.getenv("CAPTION_TOKENS_PER_REQUEST", "600"))
+CAPTION_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", os.path.join(".cache", "captions.sqlite"))
+
+# Prompt for technical document images
+CAPTION_PROMPT = "Analyze this image from a technical document. Describe the diagram, chart, or visual content in detail so that the information can be indexed for search."
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `capacity` tokens per minute.
+    """
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Combined requests-per-minute and tokens-per-minute limiter shared by all caption workers.
+    """
+
+    def __init__(self, requests_per_minute=CAPTION_RPM, tokens_per_minute=CAPTION_TPM):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens=CAPTION_TOKENS_PER_REQUEST):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+class CaptionCache:
+    """
+    Persistent caption cache keyed by the SHA-256 of the image bytes and the caption model.
+    """
+
+    def __init__(self, path=CAPTION_CACHE_PATH):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions (hash TEXT, model TEXT, caption TEXT, PRIMARY KEY (hash, model))"
+        )
+        self.conn.commit()
+
+    def get(self, image_hash, model):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT caption FROM captions WHERE hash = ? AND model = ?", (image_hash, model)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, image_hash, model, caption):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO captions (hash, model, caption) VALUES (?, ?, ?)",
+                (image_hash, model, caption),
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# One limiter and one cache per process: documents ingested concurrently share the RPM/TPM budget
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared(name, factory):
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def shared_limiter():
+    """The process-wide RateLimiter (created on first call)."""
+    return _get_shared("limiter", RateLimiter)
+
+
+def shared_cache():
+    """The process-wide CaptionCache (created on first call)."""
+    return _get_shared("cache", CaptionCache)
+
+
+class GeminiCaptioner:
+    """
+    Captions images with a Gemini vision model.
+    """
+
+    def __init__(self, api_key, model_name=CAPTION_MODEL, prompt=CAPTION_PROMPT):
+        import google.generativeai as genai
+        import PIL.Image
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.model_name = model_name
+        self.prompt = prompt
+        self._open_image = PIL.Image.open
+
+    def caption(self, image_bytes):
+        image = self._open_image(io.BytesIO(image_bytes))
+        response = self.model.generate_content([self.prompt, image])
+        return response.text
+
+
+class RateLimitedError(Exception):
+    """Raised by FakeCaptioner to simulate an HTTP 429 from the caption API."""
+    code = 429
+
+
+class FakeCaptioner:
+    """
+    Offline captioner for tests and benchmarks: returns a deterministic caption per image,
+    optionally sleeping `latency` seconds and failing the first `rate_limit_failures` calls with a 429.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_failures=0, model_name="fake-captioner"):
+        self.latency = latency
+        self.model_name = model_name
+        self.remaining_failures = rate_limit_failures
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def caption(self, image_bytes):
+        with self.lock:
+            self.calls += 1
+            if self.remaining_failures > 0:
+                self.remaining_failures -= 1
+                raise RateLimitedError("429 Resource has been exhausted (fake)")
+
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(image_bytes).hexdigest()[:12]
+        return f"A technical figure ({len(image_bytes)} bytes, id {digest})."
+
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def is_rate_limit_error(error):
+    """
+    True for 429 / quota-exhausted errors from the caption API (google.api_core or plain HTTP errors).
+    """
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    message = f"{type(error).__name__} {error}"
+    return "429" in message or "ResourceExhausted" in message or "rate limit" in message.lower()
+
+
+CAPTIONS = metrics.counter("rag_captions_total", "Image captions by outcome.", ["result"])
+CAPTION_RETRIES = metrics.counter("rag_caption_retries_total", "Caption calls retried after a rate limit.")
+
+
+def caption_with_retry(captioner, image_bytes, limiter=None, max_retries=5, base_delay=2.0, max_delay=60.0):
+    """
+    Calls the captioner behind the rate limiter, retrying 429s with exponential backoff and jitter.
+    """
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            with metrics.stage("caption_call"):
+                return captioner.caption(image_bytes)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            CAPTION_RETRIES.inc()
+            delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            print(f"[captioning] Rate limited, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+
+def _caption_uncached(name, image_bytes, key, model_name, captioner, limiter, cache, max_retries):
+    try:
+        caption = caption_with_retry(captioner, image_bytes, limiter=limiter, max_retries=max_retries)
+    except Exception as e:
+        print(f"[captioning] Failed to caption {name}: {e}")
+        CAPTIONS.inc(result="failed")
+        return None
+    CAPTIONS.inc(result="captioned")
+    if cache:
+        cache.put(key, model_name, caption)
+    print(f"[captioning] Captioned: {name}")
+    return caption
+
+
+def caption_image(name, image_bytes, captioner, limiter=None, cache=None, max_retries=5):
+    """
+    Captions one image (or returns its cached caption) on the calling thread, for callers
+    that bring their own workers. Returns None where captioning failed.
+    """
+    model_name = getattr(captioner, "model_name", type(captioner).__name__)
+    key = image_hash(image_bytes)
+    cached = cache.get(key, model_name) if cache else None
+    if cached is not None:
+        CAPTIONS.inc(result="cached")
+        return cached
+    return _caption_uncached(name, image_bytes, key, model_name, captioner, limiter, cache, max_retries)
+
+
+def caption_images(images, captioner, max_workers=CAPTION_WORKERS, limiter=None, cache=None, max_retries=5):
+    """
+    Captions (name, image_bytes) pairs with a bounded pool of concurrent workers.
+    Cached captions are returned without an API call. Returns a list aligned with `images`,
+    holding the caption text or None where captioning failed.
+    """
+    model_name = getattr(captioner, "model_name", type(captioner).__name__)
+    results = [None] * len(images)
+    pending = {}  # image hash -> (name, image_bytes, indexes sharing that image)
+
+    for i, (name, image_bytes) in enumerate(images):
+        key = image_hash(image_bytes)
+        cached = cache.get(key, model_name) if cache else None
+        if cached is not None:
+            results[i] = cached
+        elif key in pending:
+            pending[key][2].append(i)
+        else:
+            pending[key] = (name, image_bytes, [i])
+
+    cached_count = sum(1 for r in results if r is not None)
+    CAPTIONS.inc(cached_count, result="cached")
+    print(f"[captioning] {cached_count} cached, {len(pending)} unique images to caption with {max_workers} workers...")
+
+    def work(key):
+        name, image_bytes, indexes = pending[key]
+        caption = _caption_uncached(name, image_bytes, key, model_name, captioner, limiter, cache, max_retries)
+        for i in indexes:
+            results[i] = caption
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            list(executor.map(work, list(pending)))
+
+    return results
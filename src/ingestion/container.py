@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from src.ingestion import read_data
+
+# --- Configuration ---
+PARALLEL_DOCUMENTS = int(os.getenv("PARALLEL_DOCUMENTS", "4"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+BLOB_MANIFEST_PATH = os.getenv("BLOB_MANIFEST_PATH", os.path.join(".cache", "blob_manifest.json"))
+
+
+def get_container_client(connection_string, container_name, pool_size=DOWNLOAD_CONCURRENCY):
+    """
+    One BlobServiceClient for the whole run, with an HTTP connection pool large enough
+    for every concurrent download to reuse a kept-alive connection.
+    """
+    if not connection_string or not container_name:
+        print("[container] Missing connection parameters.")
+        return None
+
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.storage.blob import BlobServiceClient
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    service_client = BlobServiceClient.from_connection_string(
+        connection_string,
+        transport=RequestsTransport(session=session, session_owner=False),
+        max_single_get_size=read_data.DOWNLOAD_CHUNK_SIZE,
+        max_chunk_get_size=read_data.DOWNLOAD_CHUNK_SIZE,
+    )
+    return service_client.get_container_client(container_name)
+
+
+def list_pdf_blobs(container_client, prefix=None):
+    """
+    Returns the PDF blobs in the container, optionally only those whose name starts with `prefix`.
+    """
+    return [
+        blob for blob in container_client.list_blobs(name_starts_with=prefix)
+        if blob.name.lower().endswith(".pdf")
+    ]
+
+
+def blob_version(blob):
+    last_modified = blob.last_modified.isoformat() if blob.last_modified else None
+    return {"etag": blob.etag, "last_modified": last_modified}
+
+
+def safe_folder_name(blob_name):
+    """Filesystem-safe folder name for a blob's extracted outputs."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", blob_name)
+
+
+class BlobManifest:
+    """
+    Records the ETag/last-modified of every successfully ingested blob so unchanged
+    documents can be skipped without downloading them.
+    """
+
+    def __init__(self, path=BLOB_MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.blobs = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.blobs = json.load(f)
+
+    def is_unchanged(self, blob):
+        return self.blobs.get(blob.name) == blob_version(blob)
+
+    def record(self, blob):
+        with self.lock:
+            self.blobs[blob.name] = blob_version(blob)
+            self._save()
+
+    def _save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.blobs, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def ingest_container(container_client, process_document, prefix=None,
+                     parallel_documents=PARALLEL_DOCUMENTS, download_concurrency=DOWNLOAD_CONCURRENCY,
+                     manifest=None):
+    """
+    Downloads and processes every changed PDF in the container.
+    Each blob is streamed to a local temp file; `process_document(blob_name, pdf_path)` must return
+    True on success, and only then is the blob recorded in the manifest. At most `parallel_documents` documents are in flight at once, and at
+    most `download_concurrency` downloads run at the same time.
+    """
+    manifest = manifest or BlobManifest()
+    blobs = list_pdf_blobs(container_client, prefix)
+    changed = [blob for blob in blobs if not manifest.is_unchanged(blob)]
+    skipped = len(blobs) - len(changed)
+
+    print(f"[container] {len(blobs)} PDFs found, {skipped} unchanged, {len(changed)} to ingest "
+          f"({parallel_documents} at a time)...")
+
+    download_slots = threading.Semaphore(max(1, download_concurrency))
+    counts = {"ingested": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def work(blob):
+        pdf_path = None
+        try:
+            with download_slots:
+                pdf_path, size = read_data.download_to_file(container_client.get_blob_client(blob.name))
+            print(f"[container] Downloaded {blob.name} ({size} bytes).")
+
+            ok = process_document(blob.name, pdf_path)
+        except Exception as e:
+            print(f"[container] Failed to ingest {blob.name}: {e}")
+            ok = False
+        finally:
+            if pdf_path and os.path.exists(pdf_path):
+                os.remove(pdf_path)
+
+        if ok:
+            manifest.record(blob)
+        with counts_lock:
+            counts["ingested" if ok else "failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel_documents)) as executor:
+        list(executor.map(work, changed))
+
+    return {"found": len(blobs), "skipped": skipped, **counts}
+
+
+# ------------------------------
+# LOCAL STAND-IN FOR TESTS
+# ------------------------------
+class _LocalBlobProperties:
+    def __init__(self, name, path):
+        stat = os.stat(path)
+        self.name = name
+        self.size = stat.st_size
+        self.last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        self.etag = '"' + hashlib.md5(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest() + '"'
+
+
+class _LocalDownloader:
+    def __init__(self, path):
+        self.path = path
+
+    def readall(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def readinto(self, stream):
+        with open(self.path, "rb") as f:
+            shutil.copyfileobj(f, stream)
+        return os.path.getsize(self.path)
+
+
+class _LocalBlobClient:
+    def __init__(self, path):
+        self.path = path
+
+    def download_blob(self, **kwargs):
+        return _LocalDownloader(self.path)
+
+
+class FilesystemContainerClient:
+    """
+    Filesystem-backed stand-in for azure.storage.blob.ContainerClient: blob names are paths
+    relative to `root`. Supports the calls the ingestion code makes (list_blobs, get_blob_client,
+    download_blob). For wire-level testing use Azurite with a normal connection string instead.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_blobs(self, name_starts_with=None):
+        for folder, _, files in os.walk(self.root):
+            for filename in sorted(files):
+                path = os.path.join(folder, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name_starts_with and not name.startswith(name_starts_with):
+                    continue
+                yield _LocalBlobProperties(name, path)
+
+    def get_blob_client(self, blob_name):
+        return _LocalBlobClient(os.path.join(self.root, *blob_name.split("/")))
@@ -0,0 +1,117 @@
+import fitz  # PyMuPDF
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+class ParsedDocument:
+    """
+    A PDF opened once with PyMuPDF and shared by every extractor.
+    Page text, text spans and image xrefs are decoded lazily and cached per page,
+    so each page is parsed at most once per pipeline run.
+
+    `source` is either the PDF bytes or a local file path. A path is read by MuPDF on demand
+    and handed to Camelot as is, so the document is never copied into memory.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            self.doc = fitz.open(source)
+            self._file_path = os.fspath(source)
+        else:
+            self.doc = fitz.open(stream=source, filetype="pdf")
+            self._file_path = None
+        self.source = source
+        self._temp_path = None
+
+        self._text = {}
+        self._spans = {}
+        self._images = {}
+        self._image_data = {}
+
+    @property
+    def page_count(self):
+        return self.doc.page_count
+
+    def page_text(self, page_num):
+        """Plain text of a page (same output as page.get_text())."""
+        if page_num not in self._text:
+            self._text[page_num] = self.doc[page_num].get_text()
+        return self._text[page_num]
+
+    def page_spans(self, page_num):
+        """Flat list of text spans (text, bbox, font, size) on a page."""
+        if page_num not in self._spans:
+            spans = []
+            layout = self.doc[page_num].get_text("dict")
+            for block in layout.get("blocks", []):
+                for line in block.get("lines", []):
+                    spans.extend(line.get("spans", []))
+            self._spans[page_num] = spans
+        return self._spans[page_num]
+
+    def page_images(self, page_num):
+        """Image tuples of a page as returned by page.get_images(full=True)."""
+        if page_num not in self._images:
+            self._images[page_num] = self.doc[page_num].get_images(full=True)
+        return self._images[page_num]
+
+    def extract_image(self, xref):
+        """Decoded image for an xref, cached so shared images are decoded once."""
+        if xref not in self._image_data:
+            self._image_data[xref] = self.doc.extract_image(xref)
+        return self._image_data[xref]
+
+    def release(self, pages):
+        """
+        Drops the cached text, spans and images of `pages`, for callers that visit each page
+        once and should not keep the whole document's parse results in memory.
+        """
+        for page_num in pages:
+            self._text.pop(page_num, None)
+            self._spans.pop(page_num, None)
+            self._images.pop(page_num, None)
+        self._image_data.clear()
+
+    @property
+    def path(self):
+        """
+        Filesystem path of the PDF for tools that only accept paths (Camelot).
+        Documents opened from bytes are written to a temp file once and removed on close().
+        """
+        if self._file_path:
+            return self._file_path
+        if self._temp_path is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(self.source)
+                self._temp_path = tmp.name
+        return self._temp_path
+
+    def close(self):
+        self.doc.close()
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._temp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def shared_document(pdf):
+    """
+    Yields a ParsedDocument for raw PDF bytes, a local PDF path or an existing ParsedDocument.
+    Documents created here are closed on exit; shared ones are left open for the caller.
+    """
+    if isinstance(pdf, ParsedDocument):
+        yield pdf
+        return
+
+    doc = ParsedDocument(pdf)
+    try:
+        yield doc
+    finally:
+        doc.close()
@@ -1,10 +1,45 @@
-import fitz  # PyMuPDF
-import io
 import os
 
+from src.ingestion.document import shared_document
+
+# Heuristic keywords from your notebook
+MATH_INDICATORS = ["(", ")", "sqrt", "/", "Q", "K", "V", "sin", "cos", "theta"]
+
+def find_formulas(doc, pages=None):
+    """
+    Returns formula-like lines ("Page N: ...") for the given page indexes (all pages by default).
+    """
+    if pages is None:
+        pages = range(doc.page_count)
+
+    extracted_formulas = []
+    for page_num in pages:
+        text = doc.page_text(page_num)
+        lines = text.split("\n")
+
+        for line in lines:
+            # Basic heuristic: Line must have '=' AND at least one math symbol
+            if "=" in line and any(x in line for x in MATH_INDICATORS):
+                clean_line = line.strip()
+                extracted_formulas.append(f"Page {page_num + 1}: {clean_line}")
+
+    return extracted_formulas
+
+def save_formulas(extracted_formulas, output_folder="output_formulas"):
+    """
+    Writes the extracted formulas to a text file and returns its path.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    output_path = os.path.join(output_folder, "extracted_formulas.txt")
+    with open(output_path, "w", encoding="utf-8") as f:
+        for item in extracted_formulas:
+            f.write(item + "\n")
+    return output_path
+
 def extract_formulas_from_bytes(pdf_bytes, output_folder="output_formulas"):
     """
     Extracts lines of text that look like formulas/equations and saves them to a text file.
+    Accepts raw bytes or a shared ParsedDocument.
     """
     if not pdf_bytes:
         print("[formulas] No data to process.")
@@ -14,33 +49,15 @@ def extract_formulas_from_bytes(pdf_bytes, output_folder="output_formulas"):
     print("[formulas] Starting formula extraction...")
 
     try:
-        pdf_stream = io.BytesIO(pdf_bytes)
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        
-        extracted_formulas = []
-        
-        # Heuristic keywords from your notebook
-        math_indicators = ["(", ")", "sqrt", "/", "Q", "K", "V", "sin", "cos", "theta"]
-
-        for page_num, page in enumerate(doc):
-            text = page.get_text()
-            lines = text.split("\n")
-            
-            for line in lines:
-                # Basic heuristic: Line must have '=' AND at least one math symbol
-                if "=" in line and any(x in line for x in math_indicators):
-                    clean_line = line.strip()
-                    extracted_formulas.append(f"Page {page_num + 1}: {clean_line}")
+        with shared_document(pdf_bytes) as doc:
+            extracted_formulas = find_formulas(doc)
 
         # Save to file
-        output_path = os.path.join(output_folder, "extracted_formulas.txt")
-        with open(output_path, "w", encoding="utf-8") as f:
-            for item in extracted_formulas:
-                f.write(item + "\n")
+        output_path = save_formulas(extracted_formulas, output_folder)
 
         print(f"[formulas] Extracted {len(extracted_formulas)} potential formulas to '{output_path}'.")
         return extracted_formulas
 
     except Exception as e:
         print(f"[formulas] Error extracting formulas: {e}")
-        return []
\ No newline at end of file
+        return []
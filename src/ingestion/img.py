@@ -1,92 +1,218 @@
-import fitz  # PyMuPDF
 import io
 import os
-import time
-import PIL.Image
-import google.generativeai as genai
 
-def extract_images_from_bytes(pdf_bytes, output_folder="output_images"):
+from PIL import Image
+
+from src.ingestion import captioning
+from src.ingestion.document import shared_document
+from src.utils import metrics
+
+# --- Configuration ---
+MIN_IMAGE_BYTES = 5120  # tiny images (logos, lines) aren't worth a caption call
+IMAGE_DUPLICATE_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", "3"))  # max differing dHash bits
+CAPTION_MAX_SIDE = int(os.getenv("CAPTION_MAX_SIDE", "1024"))
+CAPTION_JPEG_QUALITY = int(os.getenv("CAPTION_JPEG_QUALITY", "85"))
+
+
+def dhash(image_bytes, size=8):
+    """64-bit difference hash: survives re-encoding and rescaling, so copies of a figure match."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def collect_images(doc, pages=None):
+    """
+    Returns the meaningful images on the given pages as in-memory dicts
+    {"name", "xref", "ext", "data", "pages", "dhash"}, one per xref: an image repeated on
+    several pages is decoded once and lists every (1-based) page it appears on.
+    """
+    if pages is None:
+        pages = range(doc.page_count)
+
+    images = {}
+    skipped = set()
+    for page_index in pages:
+        for img_index, img in enumerate(doc.page_images(page_index)):
+            xref = img[0]
+            if xref in skipped:
+                continue
+            if xref in images:
+                if images[xref]["pages"][-1] != page_index + 1:
+                    images[xref]["pages"].append(page_index + 1)
+                continue
+
+            base_image = doc.extract_image(xref)
+            image_bytes = base_image["image"]
+
+            # Filter out tiny images (logos, lines) < 5KB to save API costs
+            if len(image_bytes) < MIN_IMAGE_BYTES:
+                skipped.add(xref)
+                continue
+
+            images[xref] = {
+                "name": f"page{page_index+1}_img{img_index+1}.{base_image['ext']}",
+                "xref": xref,
+                "ext": base_image["ext"],
+                "data": image_bytes,
+                "pages": [page_index + 1],
+                "dhash": dhash(image_bytes),
+            }
+    return list(images.values())
+
+
+def merge_images(image_lists, max_distance=IMAGE_DUPLICATE_DISTANCE):
+    """
+    Merges per-shard image lists in page order. Images with the same xref, or whose dHashes
+    differ in at most `max_distance` bits (the same figure embedded twice), become one image
+    carrying the pages of all copies.
+    """
+    unique = []
+    by_xref = {}
+    for images in image_lists:
+        for image in images:
+            match = by_xref.get(image["xref"])
+            if match is None and image["dhash"] is not None:
+                match = next((
+                    u for u in unique
+                    if u["dhash"] is not None and bin(u["dhash"] ^ image["dhash"]).count("1") <= max_distance
+                ), None)
+
+            if match is None:
+                unique.append(image)
+                by_xref[image["xref"]] = image
+            else:
+                match["pages"] = sorted(set(match["pages"]) | set(image["pages"]))
+                by_xref[image["xref"]] = match
+    return unique
+
+
+def save_images(images, output_folder="output_images"):
+    """Writes each unique image once (for display in a UI) and records its path on the dict."""
+    os.makedirs(output_folder, exist_ok=True)
+    for image in images:
+        image["path"] = os.path.join(output_folder, image["name"])
+        with open(image["path"], "wb") as f:
+            f.write(image["data"])
+    return [image["path"] for image in images]
+
+
+def extract_images_from_bytes(pdf_bytes, output_folder="output_images", pages=None):
     """
     Extracts images from PDF bytes, saves them, and returns a list of their file paths.
+    Accepts raw bytes or a shared ParsedDocument; `pages` limits extraction to those page indexes.
+    Repeated images are saved once.
     """
     if not pdf_bytes:
         print("[img] No data to process.")
         return []
 
-    os.makedirs(output_folder, exist_ok=True)
     print("[img] Starting image extraction...")
-    
-    saved_image_paths = []
-    
+
     try:
-        pdf_stream = io.BytesIO(pdf_bytes)
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        
-        image_count = 0
-        
-        for page_index, page in enumerate(doc):
-            images = page.get_images(full=True)
-            for img_index, img in enumerate(images):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # Filter out tiny images (logos, lines) < 5KB to save API costs
-                if len(image_bytes) < 5120: 
-                    continue
-                
-                image_filename = f"page{page_index+1}_img{img_index+1}.{image_ext}"
-                image_path = os.path.join(output_folder, image_filename)
-                
-                with open(image_path, "wb") as f:
-                    f.write(image_bytes)
-                
-                saved_image_paths.append(image_path)
-                image_count += 1
-        
-        print(f"[img] Extracted {image_count} meaningful images to '{output_folder}'.")
+        with shared_document(pdf_bytes) as doc:
+            images = merge_images([collect_images(doc, pages)])
+        saved_image_paths = save_images(images, output_folder)
+
+        print(f"[img] Extracted {len(saved_image_paths)} meaningful images to '{output_folder}'.")
         return saved_image_paths
 
     except Exception as e:
         print(f"[img] Error extracting images: {e}")
         return []
 
-def generate_image_captions(image_paths, api_key):
+
+def prepare_for_caption(image_bytes, max_side=CAPTION_MAX_SIDE, quality=CAPTION_JPEG_QUALITY):
+    """
+    Downscales an image so its longer side is at most `max_side` pixels and re-encodes it
+    (JPEG, or PNG when it has transparency). Small images are passed through untouched.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            if max(image.size) <= max_side:
+                return image_bytes
+
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            if has_alpha:
+                image.save(out, format="PNG", optimize=True)
+            else:
+                image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+    except Exception as e:
+        print(f"[img] Could not downscale image, sending original: {e}")
+        return image_bytes
+
+    data = out.getvalue()
+    return data if len(data) < len(image_bytes) else image_bytes
+
+
+def caption_content(name, caption):
+    """The text embedded for a captioned image: a formatted string for the RAG system."""
+    return f"Image Description (Source: {name}):\n{caption}"
+
+
+def generate_image_captions(images, api_key, captioner=None, max_workers=None, limiter=None, cache=None):
     """
-    Uses Gemini 1.5 Flash to generate descriptive text for each image.
+    Generates descriptive text for each image with a pool of concurrent caption workers
+    (Gemini by default) behind a rate limiter and a persistent caption cache, by default the
+    process-wide ones so that concurrently ingested documents share one RPM/TPM budget.
+    `images` are the in-memory dicts from collect_images (saved paths are still accepted);
+    each is downscaled with prepare_for_caption before upload.
+    Pass `captioner` (e.g. captioning.FakeCaptioner) to run offline.
+    Returns (captions, captioned images).
     """
-    if not image_paths:
+    if not images:
         return [], []
 
-    print(f"[img] Generating captions for {len(image_paths)} images using Gemini...")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
+    captioner = captioner or captioning.GeminiCaptioner(api_key)
+    limiter = limiter or captioning.shared_limiter()
+    cache = cache or captioning.shared_cache()
+    max_workers = max_workers or captioning.CAPTION_WORKERS
+
+    print(f"[img] Generating captions for {len(images)} images using {captioner.model_name}...")
+
+    loaded = []
+    for image in images:
+        if isinstance(image, str):
+            image = {"name": os.path.basename(image), "path": image, "pages": []}
+        if "data" not in image:
+            # Saved image (a path, or metadata restored from an earlier run)
+            try:
+                with open(image["path"], "rb") as f:
+                    image = {**image, "data": f.read()}
+            except OSError as e:
+                print(f"[img] Failed to read {image['path']}: {e}")
+                continue
+        loaded.append(image)
+
+    with metrics.stage("caption_prepare"):
+        payloads = [(image["name"], prepare_for_caption(image["data"])) for image in loaded]
+    original_bytes = sum(len(image["data"]) for image in loaded)
+    upload_bytes = sum(len(data) for _, data in payloads)
+    print(f"[img] Upload size after downscaling: {upload_bytes} of {original_bytes} bytes.")
+
+    with metrics.stage("captions", images=len(payloads), upload_bytes=upload_bytes):
+        results = captioning.caption_images(payloads, captioner, max_workers=max_workers, limiter=limiter, cache=cache)
+
     captions = []
-    valid_paths = [] # Keep track of which images successfully got captions
-
-    for img_path in image_paths:
-        try:
-            image = PIL.Image.open(img_path)
-            
-            # Prompt for technical document images
-            prompt = "Analyze this image from a technical document. Describe the diagram, chart, or visual content in detail so that the information can be indexed for search."
-            
-            response = model.generate_content([prompt, image])
-            
-            # Create a formatted string for the RAG system
-            description = f"Image Description (Source: {os.path.basename(img_path)}):\n{response.text}"
-            
-            captions.append(description)
-            valid_paths.append(img_path)
-            
-            print(f"[img] Captioned: {os.path.basename(img_path)}")
-            
-            # Rate limiting (Gemini Free tier has limits)
-            time.sleep(2) 
-            
-        except Exception as e:
-            print(f"[img] Failed to caption {img_path}: {e}")
-
-    return captions, valid_paths
\ No newline at end of file
+    captioned = [] # Keep track of which images successfully got captions
+
+    for image, text in zip(loaded, results):
+        if text is None:
+            continue
+        captions.append(caption_content(image["name"], text))
+        captioned.append(image)
+
+    print(f"[img] Captioned {len(captions)}/{len(images)} images.")
+    return captions, captioned
@@ -0,0 +1,199 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from src.ingestion import img, table, formula
+from src.ingestion.document import ParsedDocument, shared_document
+from src.processing import chunking
+from src.utils import metrics
+
+# More shards than workers keeps every core busy when some pages are much slower (tables, images)
+SHARDS_PER_WORKER = 4
+
+def page_ranges(page_count, shards):
+    """
+    Splits page indexes 0..page_count-1 into at most `shards` contiguous, near-equal ranges.
+    """
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+
+    ranges = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(range(start, end))
+        start = end
+    return ranges
+
+def extract_pages(doc, pages, table_prefilter=True):
+    """
+    Runs every extractor over one page range of a document and returns the raw, unnumbered results.
+    Images are returned in memory, deduplicated by xref within the range; tables are not read here:
+    "table_pages" lists the pages worth running Camelot on.
+    Stage timings are recorded in the calling process only (a serial run, not the pool workers).
+    """
+    result = {"images": [], "table_pages": [], "formulas": [], "page_texts": [], "page_numbers": []}
+
+    try:
+        with metrics.stage("extract_images"):
+            result["images"] = img.collect_images(doc, pages)
+    except Exception as e:
+        print(f"[parallel] Error extracting images on pages {pages.start + 1}-{pages.stop}: {e}")
+
+    try:
+        with metrics.stage("table_prefilter"):
+            result["table_pages"] = table.find_table_pages(doc, pages) if table_prefilter else list(pages)
+    except Exception as e:
+        print(f"[parallel] Error prefiltering table pages {pages.start + 1}-{pages.stop}: {e}")
+        result["table_pages"] = list(pages)
+
+    try:
+        with metrics.stage("extract_formulas"):
+            result["formulas"] = formula.find_formulas(doc, pages)
+    except Exception as e:
+        print(f"[parallel] Error extracting formulas on pages {pages.start + 1}-{pages.stop}: {e}")
+
+    try:
+        with metrics.stage("extract_text"):
+            numbered = chunking.read_page_texts(doc, pages)
+            result["page_texts"] = [text for _, text in numbered]
+            result["page_numbers"] = [page_number for page_number, _ in numbered]
+    except Exception as e:
+        print(f"[parallel] Error extracting text on pages {pages.start + 1}-{pages.stop}: {e}")
+
+    return result
+
+def _extract_shard(pdf_source, pages, table_prefilter):
+    # Runs in a worker process: each worker parses the document once for its own page range.
+    # Passing a file path instead of bytes avoids pickling a copy of the PDF per shard.
+    with ParsedDocument(pdf_source) as doc:
+        return extract_pages(doc, pages, table_prefilter)
+
+def read_page_tables(doc, page_num):
+    try:
+        with metrics.stage("extract_tables", page=page_num + 1):
+            return table.read_page_tables(doc, page_num)
+    except Exception as e:
+        print(f"[parallel] Error extracting tables on page {page_num + 1}: {e}")
+        return []
+
+def _extract_page_tables(pdf_path, page_num):
+    # Runs in a worker process: Camelot on a single candidate page
+    with ParsedDocument(pdf_path) as doc:
+        return read_page_tables(doc, page_num)
+
+def iter_extract_shards(doc, ranges, workers, executor, table_prefilter):
+    """
+    Yields (page range, extract_pages result, table frames) for each range in page order, for
+    callers that process a document while it is being extracted. With workers > 1 (or a shared
+    `executor`) at most two shards per worker are in flight, so finished shards cannot pile up
+    in memory; serially, each range's cached parse results are released once yielded.
+    """
+    if workers <= 1 and executor is None:
+        for pages in ranges:
+            shard = extract_pages(doc, pages, table_prefilter)
+            frames = [df for page_num in shard["table_pages"] for df in read_page_tables(doc, page_num)]
+            yield pages, shard, frames
+            doc.release(pages)
+        return
+
+    shared_pool = executor is not None
+    executor = executor or ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        remaining = iter(ranges)
+        while True:
+            while len(pending) < 2 * max(1, workers):
+                pages = next(remaining, None)
+                if pages is None:
+                    break
+                pending.append((pages, executor.submit(_extract_shard, doc.source, pages, table_prefilter)))
+            if not pending:
+                return
+            pages, future = pending.popleft()
+            shard = future.result()
+            frames = [df for result in executor.map(_extract_page_tables, [doc.path] * len(shard["table_pages"]),
+                                                     shard["table_pages"]) for df in result]
+            yield pages, shard, frames
+    finally:
+        if not shared_pool:
+            executor.shutdown()
+
+def extract_all(pdf, workers=1, chunk_size=1000, overlap=200,
+                image_folder="output_images", table_folder="output_tables", formula_folder="output_formulas",
+                executor=None, table_prefilter=None):
+    """
+    Extracts images, tables, formulas and text chunks from a PDF (bytes or local file path).
+    Text is chunked page by page; "chunk_pages" holds the 1-based pages of each chunk.
+    With workers > 1 the pages are sharded across a ProcessPoolExecutor; shard results are merged
+    back in page order before tables are numbered and text is chunked, so the output is identical
+    to a serial run. Pass `executor` to share one process pool across several documents.
+
+    Camelot, the slowest extractor, then runs once per table candidate page (see
+    table.find_table_pages; `table_prefilter=False` sends every page), spread across the same pool.
+    """
+    if table_prefilter is None:
+        table_prefilter = table.TABLE_PREFILTER
+
+    with shared_document(pdf) as doc:
+        page_count = doc.page_count
+        parallel = not ((workers <= 1 and executor is None) or page_count < 2)
+
+        if not parallel:
+            print(f"[parallel] Extracting {page_count} pages serially...")
+            shards = [extract_pages(doc, range(page_count), table_prefilter)]
+            table_pages = shards[0]["table_pages"]
+            frames = [df for page_num in table_pages for df in read_page_tables(doc, page_num)]
+        else:
+            ranges = page_ranges(page_count, max(1, workers) * SHARDS_PER_WORKER)
+            print(f"[parallel] Extracting {page_count} pages in {len(ranges)} shards across {workers} workers...")
+            shared_pool = executor is not None
+            executor = executor or ProcessPoolExecutor(max_workers=workers)
+            try:
+                # map() yields results in submission order, i.e. page order
+                shards = list(executor.map(
+                    _extract_shard,
+                    [doc.source] * len(ranges),
+                    ranges,
+                    [table_prefilter] * len(ranges),
+                ))
+
+                # One task per candidate page keeps workers balanced when tables cluster in a few
+                # shards; doc.path is a temp file for byte sources, so the PDF isn't pickled per page
+                table_pages = [page_num for shard in shards for page_num in shard["table_pages"]]
+                page_frames = executor.map(_extract_page_tables, [doc.path] * len(table_pages), table_pages)
+                frames = [df for result in page_frames for df in result]
+            finally:
+                if not shared_pool:
+                    executor.shutdown()
+
+    formulas, page_texts, page_numbers = [], [], []
+    for shard in shards:
+        formulas.extend(shard["formulas"])
+        page_texts.extend(shard["page_texts"])
+        page_numbers.extend(shard["page_numbers"])
+
+    # Repeated figures (same xref in several shards, or the same picture embedded twice) become one image
+    images = img.merge_images([shard["images"] for shard in shards])
+    image_paths = img.save_images(images, image_folder) if image_folder else []
+    print(f"[parallel] Found {len(images)} unique images.")
+
+    print(f"[parallel] Camelot ran on {len(table_pages)} of {page_count} pages, found {len(frames)} tables.")
+    table_strings = table.save_tables(frames, table_folder)
+
+    output_path = formula.save_formulas(formulas, formula_folder)
+    print(f"[parallel] Extracted {len(formulas)} potential formulas to '{output_path}'.")
+
+    with metrics.stage("chunking"):
+        text_chunks, chunk_pages = chunking.chunk_page_texts(zip(page_numbers, page_texts),
+                                                             chunk_size=chunk_size, overlap=overlap)
+
+    return {
+        "images": images,
+        "image_paths": image_paths,
+        "table_strings": table_strings,
+        "formula_strings": formulas,
+        "text_chunks": text_chunks,
+        "chunk_pages": chunk_pages,
+        "page_texts": page_texts,
+        "page_numbers": page_numbers,
+    }
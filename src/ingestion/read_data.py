@@ -1,5 +1,15 @@
+import hashlib
+import os
+import tempfile
 from azure.storage.blob import BlobServiceClient
 
+from src.utils import metrics
+
+# --- Configuration ---
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR") or None  # None -> system temp dir
+DOWNLOAD_MAX_CONCURRENCY = int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", "8"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+
 def download_blob_data(connection_string, container_name, blob_name):
     """
     Connects to Azure Blob Storage and downloads the file as bytes.
@@ -12,10 +22,69 @@ def download_blob_data(connection_string, container_name, blob_name):
         print(f"[read_data] Connecting to Azure Blob: {blob_name}...")
         blob_service_client = BlobServiceClient.from_connection_string(connection_string)
         blob_client = blob_service_client.get_container_client(container_name).get_blob_client(blob_name)
-        
+
         pdf_bytes = blob_client.download_blob().readall()
         print(f"[read_data] Download successful. Size: {len(pdf_bytes)} bytes.")
         return pdf_bytes
     except Exception as e:
         print(f"[read_data] Error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def download_to_file(blob_client, max_concurrency=DOWNLOAD_MAX_CONCURRENCY, download_dir=DOWNLOAD_DIR):
+    """
+    Streams a blob straight into a local temp file and returns its path.
+    With max_concurrency > 1 the SDK fetches byte ranges in parallel and writes each one at its
+    offset in the file, so the document is never held in memory. The caller deletes the file.
+    """
+    if download_dir:
+        os.makedirs(download_dir, exist_ok=True)
+
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=download_dir)
+    try:
+        with metrics.stage("download") as span, os.fdopen(fd, "wb") as f:
+            size = blob_client.download_blob(max_concurrency=max_concurrency).readinto(f)
+            span.set(bytes=size)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size
+
+def download_blob_to_file(connection_string, container_name, blob_name,
+                          max_concurrency=DOWNLOAD_MAX_CONCURRENCY, download_dir=DOWNLOAD_DIR, cache_dir=None):
+    """
+    Connects to Azure Blob Storage and downloads the file to a local temp path
+    using parallel ranged reads. Returns the path, or None on failure.
+    With `cache_dir` the file is kept there under the blob's ETag and reused by later calls
+    until the blob changes (the caller removes it once it is no longer needed).
+    """
+    try:
+        if not connection_string or not container_name or not blob_name:
+            print("[read_data] Missing connection parameters.")
+            return None
+
+        print(f"[read_data] Connecting to Azure Blob: {blob_name}...")
+        blob_service_client = BlobServiceClient.from_connection_string(
+            connection_string,
+            max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+            max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
+        )
+        blob_client = blob_service_client.get_container_client(container_name).get_blob_client(blob_name)
+
+        if cache_dir:
+            etag = blob_client.get_blob_properties().etag.strip('"')
+            blob_key = hashlib.sha1(f"{container_name}/{blob_name}".encode("utf-8")).hexdigest()[:16]
+            cached_path = os.path.join(cache_dir, f"{blob_key}-{etag}.pdf")
+            if os.path.exists(cached_path):
+                print(f"[read_data] Reusing download from a previous run: '{cached_path}'.")
+                return cached_path
+            download_dir = cache_dir
+
+        path, size = download_to_file(blob_client, max_concurrency=max_concurrency, download_dir=download_dir)
+        if cache_dir:
+            os.replace(path, cached_path)
+            path = cached_path
+        print(f"[read_data] Download successful. Size: {size} bytes -> '{path}'.")
+        return path
+    except Exception as e:
+        print(f"[read_data] Error: {e}")
+        return None
@@ -0,0 +1,291 @@
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from src.embeddings import embedding
+from src.ingestion import captioning, formula, img, parallel, table
+from src.ingestion.document import shared_document
+from src.processing import chunking
+from src.retrieval import upsert, vector_store
+from src.retrieval.manifest import IngestionManifest, make_vector_id
+from src.utils import metrics
+
+# --- Configuration ---
+# Every queue is bounded: when a later stage falls behind, the earlier ones wait instead of piling up work
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "512"))            # texts waiting to be embedded
+STREAM_EMBED_BATCH = int(os.getenv("STREAM_EMBED_BATCH", "128"))          # texts per encode call (at most)
+STREAM_EMBED_WORKERS = int(os.getenv("STREAM_EMBED_WORKERS", "1"))
+STREAM_UPSERT_WORKERS = int(os.getenv("STREAM_UPSERT_WORKERS", str(upsert.UPSERT_CONCURRENCY)))
+STREAM_CAPTION_BACKLOG = int(os.getenv("STREAM_CAPTION_BACKLOG", "16"))   # images held until captioned
+STREAM_SHARD_PAGES = int(os.getenv("STREAM_SHARD_PAGES", "8"))            # pages extracted per step
+# Upserted items between two manifest checkpoints
+STREAM_CHECKPOINT = int(os.getenv("UPSERT_CHECKPOINT", "1000"))
+
+_DONE = object()
+
+
+class StreamReport:
+    """Counts and timings of one streamed document, including how long each stage waited on the next."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = Counter()
+        self.unchanged = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.failed = 0
+        self.deleted = 0
+        self.uncaptioned = 0
+        self.encode_calls = 0
+        self.extract_blocked = 0.0  # extraction waiting for room in the embedding queue
+        self.embed_blocked = 0.0    # embedding waiting for room in the upsert queue
+        self.max_queued = 0
+        self.seconds = 0.0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def __str__(self):
+        items = ", ".join(f"{count} {kind}" for kind, count in sorted(self.items.items())) or "no items"
+        return (f"{items}; {self.unchanged} unchanged, {self.embedded} embedded in {self.encode_calls} calls, "
+                f"{self.upserted} upserted, {self.failed} failed, {self.uncaptioned} images uncaptioned, "
+                f"{self.deleted} stale deleted in {self.seconds:.2f}s "
+                f"(extraction waited {self.extract_blocked:.2f}s, embedding waited {self.embed_blocked:.2f}s, "
+                f"max queued {self.max_queued})")
+
+
+class _Progress:
+    """Upserted ids of the document, checkpointed to the manifest every `checkpoint` ids."""
+
+    def __init__(self, manifest, source, checkpoint):
+        self.lock = threading.RLock()
+        self.manifest = manifest
+        self.source = source
+        self.stored = manifest.ids_for(source)
+        self.checkpoint = checkpoint
+        self.unsaved = 0
+
+    def add(self, ids):
+        with self.lock:
+            self.stored |= set(ids)
+            self.unsaved += len(ids)
+            if self.unsaved >= self.checkpoint:
+                self.save()
+
+    def save(self):
+        with self.lock:
+            self.manifest.update(self.source, self.stored)
+            self.manifest.save()
+            self.unsaved = 0
+
+
+def _start_thread(target, name):
+    # Each thread gets its own copy of the context, so its stages join the ingest trace
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(target,), name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def _take_batch(items, size):
+    """Blocks for one item, then takes whatever else is queued (up to `size`). None once the stream ended."""
+    first = items.get()
+    if first is _DONE:
+        return None
+    batch = [first]
+    while len(batch) < size:
+        try:
+            item = items.get_nowait()
+        except queue.Empty:
+            break
+        if item is _DONE:
+            items.put(_DONE)  # the next take (or another worker) sees the end
+            break
+        batch.append(item)
+    return batch
+
+
+def stream_document(pdf, source, index, workers=1, executor=None, output_root="", api_key=None,
+                    captioner=None, limiter=None, cache=None, chunk_size=1000, overlap=200, table_prefilter=None,
+                    queue_size=STREAM_QUEUE_SIZE, embed_batch=STREAM_EMBED_BATCH, embed_workers=STREAM_EMBED_WORKERS,
+                    upsert_workers=STREAM_UPSERT_WORKERS, caption_backlog=STREAM_CAPTION_BACKLOG,
+                    shard_pages=STREAM_SHARD_PAGES, checkpoint=STREAM_CHECKPOINT):
+    """
+    Ingests one PDF (bytes or local file path) as a stream: pages are extracted a few at a time
+    and every text chunk, table and formula goes into a bounded queue read by `embed_workers`
+    embedding threads, whose vectors go through a second bounded queue to `upsert_workers`
+    upsert threads. Images are captioned concurrently (at most `caption_backlog` in flight) and
+    indexed once extraction ends, when the pages of every copy of a figure are known.
+
+    Items already stored for `source` (same content hash) are skipped. Upserted ids are
+    checkpointed to the manifest as they land, so an interrupted run resumes there; stale
+    vectors are deleted at the end. Text chunks carry the pages they come from in metadata.
+    Images are only captioned with `api_key` or a `captioner`, behind `limiter` and `cache`
+    (default: the process-wide ones).
+    Returns (ok, StreamReport); ok is True when the index fully reflects the document,
+    uncaptioned images included.
+    """
+    if table_prefilter is None:
+        table_prefilter = table.TABLE_PREFILTER
+    start_time = time.perf_counter()
+    report = StreamReport()
+
+    manifest = IngestionManifest()
+    progress = _Progress(manifest, source, checkpoint)
+    previously_stored = set(progress.stored)
+    seen_ids = set()
+
+    items = queue.Queue(maxsize=max(1, queue_size))
+    batches = queue.Queue(maxsize=2 * max(1, upsert_workers))
+
+    # --- CONSUMERS ---
+    def embed_loop():
+        while True:
+            batch = _take_batch(items, embed_batch)
+            if batch is None:
+                return
+            texts = [text for _, text, _ in batch]
+            # A consumer must not die: the producer would block on the full queue forever
+            try:
+                vectors = embedding.encode_matrix(texts)
+                records = vector_store.make_records(index, texts, vectors, [meta for _, _, meta in batch],
+                                                    [vector_id for vector_id, _, _ in batch])
+            except Exception as e:
+                print(f"[streaming] Embedding {len(batch)} items failed: {e}")
+                report.add(failed=len(batch))
+                continue
+            report.add(embedded=len(batch), encode_calls=1)
+            waited = time.perf_counter()
+            batches.put(records)
+            report.add(embed_blocked=time.perf_counter() - waited)
+
+    def upsert_loop():
+        while True:
+            records = batches.get()
+            if records is _DONE:
+                return
+            # One request at a time per thread: concurrency comes from the upsert workers
+            try:
+                result = upsert.upsert_records(index, records, concurrency=1)
+                report.add(upserted=len(result.succeeded), failed=len(result.failed))
+                progress.add(result.succeeded)
+            except Exception as e:
+                print(f"[streaming] Upserting {len(records)} items failed: {e}")
+                report.add(failed=len(records))
+
+    embedders = [_start_thread(embed_loop, f"stream-embed-{i}") for i in range(max(1, embed_workers))]
+    uploaders = [_start_thread(upsert_loop, f"stream-upsert-{i}") for i in range(max(1, upsert_workers))]
+
+    # --- PRODUCER ---
+    def emit(text, meta):
+        vector_id = make_vector_id(source, meta["type"], text)
+        if vector_id in seen_ids:
+            return  # identical content appears twice in the document
+        seen_ids.add(vector_id)
+        report.items[meta["type"]] += 1
+        if vector_id in previously_stored:
+            report.unchanged += 1
+            return
+        waited = time.perf_counter()
+        items.put((vector_id, text, meta))
+        report.extract_blocked += time.perf_counter() - waited
+        report.max_queued = max(report.max_queued, items.qsize())
+
+    if api_key or captioner:
+        captioner = captioner or captioning.GeminiCaptioner(api_key)
+        limiter = limiter or captioning.shared_limiter()
+        cache = cache or captioning.shared_cache()
+    caption_slots = threading.BoundedSemaphore(max(1, caption_backlog))
+    caption_pool = ThreadPoolExecutor(max_workers=captioning.CAPTION_WORKERS, thread_name_prefix="stream-caption")
+
+    def caption(image):
+        try:
+            with metrics.stage("caption_prepare"):
+                data = img.prepare_for_caption(image["data"])
+            image["caption"] = captioning.caption_image(image["name"], data, captioner, limiter=limiter, cache=cache)
+        finally:
+            image.pop("data", None)  # the bytes are saved under output_images; keep only the caption
+            caption_slots.release()
+
+    images, formulas, tables_saved = [], [], 0
+    completed = False
+    try:
+        with metrics.stage("stream_extract", workers=workers), shared_document(pdf) as doc:
+            ranges = parallel.page_ranges(doc.page_count, -(-doc.page_count // max(1, shard_pages)))
+            print(f"[streaming] Streaming {doc.page_count} pages of {source} in {len(ranges)} steps...")
+            chunker = chunking.PageChunker(chunk_size=chunk_size, overlap=overlap)
+
+            for pages, shard, frames in parallel.iter_extract_shards(doc, ranges, workers, executor, table_prefilter):
+                for page_number, text in zip(shard["page_numbers"], shard["page_texts"]):
+                    for chunk, chunk_pages in chunker.add_page(page_number, text):
+                        emit(chunk, {"type": "text", "source": source, "pages": [str(p) for p in chunk_pages]})
+
+                for table_text in table.save_tables(frames, os.path.join(output_root, "output_tables"), start=tables_saved):
+                    emit(table_text, {"type": "table", "source": source})
+                tables_saved += len(frames)
+
+                for f in shard["formulas"]:
+                    emit(f"Mathematical Formula: {f}", {"type": "formula", "source": source})
+                formulas.extend(shard["formulas"])
+
+                # Copies of a figure already seen only add their pages; new figures are captioned right away
+                merged = img.merge_images([images, shard["images"]])
+                new_images, images = merged[len(images):], merged
+                img.save_images(new_images, os.path.join(output_root, "output_images"))
+                for image in new_images:
+                    if api_key or captioner:
+                        caption_slots.acquire()  # backpressure: bounded number of image bytes in memory
+                        caption_pool.submit(contextvars.copy_context().run, caption, image)
+                    else:
+                        image.pop("data", None)
+
+            for chunk, chunk_pages in chunker.flush():
+                emit(chunk, {"type": "text", "source": source, "pages": [str(p) for p in chunk_pages]})
+
+        formula.save_formulas(formulas, os.path.join(output_root, "output_formulas"))
+
+        caption_pool.shutdown(wait=True)
+        for image in images:
+            if image.get("caption") is None:
+                continue
+            meta = {"type": "image", "source": source, "pages": [str(p) for p in image["pages"]],
+                    "image_path": image["path"]}
+            emit(img.caption_content(image["name"], image["caption"]), meta)
+        uncaptioned = sum(1 for image in images if image.get("caption") is None)
+        if uncaptioned:
+            # As in the staged pipeline, they are left out; a re-run tries them again
+            print(f"[streaming] {uncaptioned} of {len(images)} images were not captioned.")
+            report.uncaptioned = uncaptioned
+        completed = True
+    finally:
+        caption_pool.shutdown(wait=True)
+        for _ in embedders:
+            items.put(_DONE)
+        for thread in embedders:
+            thread.join()
+        for _ in uploaders:
+            batches.put(_DONE)
+        for thread in uploaders:
+            thread.join()
+        progress.save()
+
+    # Only a complete pass knows which stored vectors no longer exist
+    stale_ids = sorted(previously_stored - seen_ids) if completed else []
+    deleted_ids = vector_store.delete_vectors(index, stale_ids)
+    if deleted_ids:
+        progress.stored -= set(deleted_ids)
+        progress.save()
+    report.deleted = len(deleted_ids)
+
+    # Tell running chat servers to drop cached retrievals
+    vector_store.mark_index_changed(index)
+
+    report.seconds = time.perf_counter() - start_time
+    print(f"[streaming] {source}: {report}")
+    ok = report.failed == 0 and report.uncaptioned == 0 and len(deleted_ids) == len(stale_ids)
+    return ok, report
@@ -1,11 +1,207 @@
 import camelot
-import tempfile
+import hashlib
+import json
 import os
 import pandas as pd
 
+from src.ingestion.document import shared_document
+
+# --- Configuration ---
+# Camelot's lattice flavor only finds ruled tables, so pages without ruling lines
+# (or a large scanned image) are skipped before Camelot ever renders them.
+TABLE_PREFILTER = os.getenv("TABLE_PREFILTER", "1") == "1"
+TABLE_CACHE_DIR = os.getenv("TABLE_CACHE_DIR", os.path.join(".cache", "tables"))  # "" disables
+
+MIN_GRID_JUNCTIONS = 2   # rulings ending inside or crossing another; the corners of a lone frame do not count
+MIN_RULING_LENGTH = 10   # points; shorter strokes are glyph decorations, underlines of single words etc.
+MAX_RULING_WIDTH = 3     # points; thicker filled rects are shading, not lines
+RULING_TOLERANCE = 1     # points; rulings this close are collinear, or touch
+MIN_IMAGE_AREA = 0.25    # fraction of the page a raster image must cover to possibly hold a scanned table
+
+def read_tables(doc, pages=None):
+    """
+    Runs Camelot on the given page indexes (all pages by default) and returns the table DataFrames.
+    """
+    if pages is None:
+        page_spec = "all"
+    else:
+        pages = list(pages)
+        if not pages:
+            return []
+        page_spec = ",".join(str(p + 1) for p in pages)
+
+    tables = camelot.read_pdf(doc.path, pages=page_spec)
+    return [tbl.df for tbl in tables]
+
+# ------------------------------
+# PAGE PREFILTER
+# ------------------------------
+def _merge_rulings(segments):
+    """Joins collinear (pos, start, end) segments that touch or overlap, e.g. the shared edges of cell rects."""
+    merged = []
+    for pos, start, end in sorted(segments):
+        last = merged[-1] if merged else None
+        if last and pos - last[0] < RULING_TOLERANCE and start <= last[2] + RULING_TOLERANCE:
+            last[2] = max(last[2], end)
+        else:
+            merged.append([pos, start, end])
+    return merged
+
+
+def _rulings(page):
+    """
+    Horizontal (y, x0, x1) and vertical (x, y0, y1) line segments drawn on a page: lines, thin
+    rects and the edges of bordered rects, with collinear pieces merged into whole rulings.
+    """
+    horizontal, vertical = [], []
+
+    def segment(p, q):
+        if abs(p.y - q.y) < RULING_TOLERANCE and abs(p.x - q.x) >= MIN_RULING_LENGTH:
+            horizontal.append(((p.y + q.y) / 2, min(p.x, q.x), max(p.x, q.x)))
+        elif abs(p.x - q.x) < RULING_TOLERANCE and abs(p.y - q.y) >= MIN_RULING_LENGTH:
+            vertical.append(((p.x + q.x) / 2, min(p.y, q.y), max(p.y, q.y)))
+
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] == "l":
+                segment(item[1], item[2])
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height <= MAX_RULING_WIDTH and rect.width >= MIN_RULING_LENGTH:
+                    horizontal.append(((rect.y0 + rect.y1) / 2, rect.x0, rect.x1))
+                elif rect.width <= MAX_RULING_WIDTH and rect.height >= MIN_RULING_LENGTH:
+                    vertical.append(((rect.x0 + rect.x1) / 2, rect.y0, rect.y1))
+                else:
+                    # A bordered rectangle is one cell: a grid only appears with more rulings
+                    segment(rect.tl, rect.tr)
+                    segment(rect.bl, rect.br)
+                    segment(rect.tl, rect.bl)
+                    segment(rect.tr, rect.br)
+            elif item[0] == "qu":
+                quad = item[1]
+                segment(quad.ul, quad.ur)
+                segment(quad.ur, quad.lr)
+                segment(quad.lr, quad.ll)
+                segment(quad.ll, quad.ul)
+
+    return _merge_rulings(horizontal), _merge_rulings(vertical)
+
+
+def _grid_junctions(horizontal, vertical, enough=MIN_GRID_JUNCTIONS):
+    """
+    Counts (up to `enough`) the points where a vertical and a horizontal ruling meet and at
+    least one of them continues past the other: the T and + joints of a grid. Where two
+    rulings only meet at their ends, as at the four corners of a frame, nothing is counted.
+    """
+    found = 0
+    for x, y0, y1 in vertical:
+        for y, x0, x1 in horizontal:
+            if not (x0 - RULING_TOLERANCE <= x <= x1 + RULING_TOLERANCE
+                    and y0 - RULING_TOLERANCE <= y <= y1 + RULING_TOLERANCE):
+                continue
+            if x0 + RULING_TOLERANCE < x < x1 - RULING_TOLERANCE or y0 + RULING_TOLERANCE < y < y1 - RULING_TOLERANCE:
+                found += 1
+                if found >= enough:
+                    return found
+    return found
+
+
+def _has_large_image(page):
+    page_area = abs(page.rect)
+    return any(
+        abs(page.rect & info["bbox"]) >= MIN_IMAGE_AREA * page_area
+        for info in page.get_image_info()
+    )
+
+
+def find_table_pages(doc, pages=None):
+    """
+    Returns the page indexes that may contain a table Camelot can detect: a grid of ruling lines
+    in the page's vector drawings (framed figures, callouts and page borders are not grids),
+    or a raster image large enough to be a scanned table.
+    """
+    pages = range(doc.page_count) if pages is None else pages
+    candidates = []
+    for page_num in pages:
+        page = doc.doc[page_num]
+        if _grid_junctions(*_rulings(page)) >= MIN_GRID_JUNCTIONS or _has_large_image(page):
+            candidates.append(page_num)
+    return candidates
+
+
+# ------------------------------
+# PER-PAGE CACHE
+# ------------------------------
+def page_hash(doc, page_num):
+    """
+    Fingerprint of everything Camelot sees on a page: content stream, geometry, text and image
+    digests (plus the Camelot version). Identical pages in any document share cached tables.
+    """
+    page = doc.doc[page_num]
+    h = hashlib.sha256()
+    h.update(getattr(camelot, "__version__", "").encode())
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+    h.update(page.read_contents())
+    h.update(doc.page_text(page_num).encode("utf-8", "surrogatepass"))
+    for info in page.get_image_info(hashes=True):
+        h.update(info.get("digest", b""))
+        h.update(repr(tuple(info["bbox"])).encode())
+    return h.hexdigest()
+
+
+def read_page_tables(doc, page_num, cache_dir=TABLE_CACHE_DIR):
+    """
+    Camelot tables of one page, memoized on disk by page hash.
+    Tables are stored as rows of cell strings, i.e. exactly Camelot's DataFrames.
+    """
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, page_hash(doc, page_num) + ".json")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return [pd.DataFrame(rows) for rows in json.load(f)]
+
+    frames = read_tables(doc, [page_num])
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([df.values.tolist() for df in frames], f)
+        os.replace(tmp_path, cache_path)
+    return frames
+
+
+def save_tables(frames, output_folder="output_tables", start=0):
+    """
+    Saves each table as CSV and returns them as numbered Markdown strings.
+    Numbering continues after `start` tables saved earlier (tables saved in several calls).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    table_texts = [] # List to store string representation of tables
+
+    for i, df in enumerate(frames, start):
+        # 1. Save CSV (same options as camelot's Table.to_csv)
+        output_path = os.path.join(output_folder, f"table_{i+1}.csv")
+        df.to_csv(output_path, encoding="utf-8", index=False, header=False, quoting=1)
+
+        # 2. Convert to Markdown for LLM
+        # We add a header so the LLM knows this is a table
+        try:
+            markdown_text = f"Table {i+1} Data:\n" + df.to_markdown(index=False)
+            table_texts.append(markdown_text)
+        except Exception as e:
+            # Fallback if markdown conversion fails
+            table_texts.append(f"Table {i+1} Data:\n" + df.to_string())
+
+        print(f"[table] Processed Table {i+1}")
+
+    return table_texts
+
 def extract_tables_from_bytes(pdf_bytes, output_folder="output_tables"):
     """
     Extracts tables and returns them as a list of Markdown strings for embedding.
+    Accepts raw bytes or a shared ParsedDocument (whose temp file is reused by Camelot).
     """
     if not pdf_bytes:
         print("[table] No data to process.")
@@ -13,41 +209,16 @@ def extract_tables_from_bytes(pdf_bytes, output_folder="output_tables"):
 
     os.makedirs(output_folder, exist_ok=True)
     print("[table] Starting table extraction...")
-    
-    table_texts = [] # List to store string representation of tables
-    temp_pdf_path = None
-    
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp.write(pdf_bytes)
-            temp_pdf_path = tmp.name
 
+    try:
         # Extract tables
-        tables = camelot.read_pdf(temp_pdf_path, pages="all")
-        print(f"[table] Found {len(tables)} tables.")
-
-        for i, tbl in enumerate(tables):
-            # 1. Save CSV (Keep existing logic)
-            output_path = os.path.join(output_folder, f"table_{i+1}.csv")
-            tbl.to_csv(output_path)
-            
-            # 2. Convert to Markdown for LLM (New Logic)
-            # We add a header so the LLM knows this is a table
-            try:
-                df = tbl.df
-                markdown_text = f"Table {i+1} Data:\n" + df.to_markdown(index=False)
-                table_texts.append(markdown_text)
-            except Exception as e:
-                # Fallback if markdown conversion fails
-                table_texts.append(f"Table {i+1} Data:\n" + df.to_string())
-
-            print(f"[table] Processed Table {i+1}")
-            
-        return table_texts
+        with shared_document(pdf_bytes) as doc:
+            pages = find_table_pages(doc) if TABLE_PREFILTER else range(doc.page_count)
+            frames = [df for page_num in pages for df in read_page_tables(doc, page_num)]
+        print(f"[table] Found {len(frames)} tables.")
+
+        return save_tables(frames, output_folder)
 
     except Exception as e:
         print(f"[table] Error extracting tables: {e}")
         return []
-    finally:
-        if temp_pdf_path and os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
\ No newline at end of file
@@ -1,12 +1,18 @@
 import os
+import argparse
 import dotenv
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 dotenv.load_dotenv()
 
-from src.ingestion import read_data, img, table, formula
-from src.processing import chunking
+from src.ingestion import read_data, img, parallel, container, table, captioning, streaming
 from src.embeddings import embedding
+from src.processing import chunking
 from src.retrieval import vector_store
+from src.retrieval.manifest import IngestionManifest, make_vector_id
+from src.utils import metrics, registry
+from src.utils.artifacts import ArtifactCache, document_hash
 
 # --- Configuration ---
 CONN_STR = os.getenv("connection_url")
@@ -15,81 +21,387 @@ BLOB_NAME = os.getenv("blob_name")
 GOOGLE_API_KEY = os.getenv('Gemini_Api')
 PINECONE_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX_NAME")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# Reuse stage outputs of an interrupted run of the same document (see utils/artifacts.py)
+INGEST_RESUME = os.getenv("INGEST_RESUME", "1") == "1"
+DOWNLOAD_CACHE_DIR = os.path.join(".cache", "downloads")
+# Items upserted between two manifest checkpoints
+UPSERT_CHECKPOINT = int(os.getenv("UPSERT_CHECKPOINT", "1000"))
+# Extraction, captioning, embedding and upserts overlap through bounded queues (see ingestion/streaming.py)
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "0") == "1"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
 
-def run_pipeline():
-    print("=== Multi-RAG Pipeline Started (Text + Tables + Formulas + Images) ===")
-    
-    # 1. Data Read
-    pdf_bytes = read_data.download_blob_data(CONN_STR, CONTAINER, BLOB_NAME)
-    
-    if pdf_bytes:
-        # --- EXTRACT EVERYTHING ---
-        
-        
-        # A. Images (Extract -> Caption)
-        image_paths = img.extract_images_from_bytes(pdf_bytes, output_folder="output_images")
-        image_captions = []
-        if image_paths and GOOGLE_API_KEY:
-            image_captions, valid_image_paths = img.generate_image_captions(image_paths, GOOGLE_API_KEY)
-        
-        # B. Tables (Get Markdown Strings)
-        table_strings = table.extract_tables_from_bytes(pdf_bytes, output_folder="output_tables")
-        
-        # C. Formulas (Get Formula Strings)
-        formula_strings = formula.extract_formulas_from_bytes(pdf_bytes, output_folder="output_formulas")
+def embed_content(texts, vector_ids, artifacts=None):
+    """
+    Embeds `texts`, reusing rows an earlier run of the same document already computed.
+    New rows are checkpointed to the artifact cache after every embedding window, one part per window.
+    """
+    config = {"model": registry.EMBEDDING_MODEL_NAME, "normalize": False}
+    saved = artifacts.load_embeddings(config) if artifacts else {}
+    missing = [i for i, vector_id in enumerate(vector_ids) if vector_id not in saved]
+    if len(missing) < len(texts):
+        print(f"[Pipeline] Reusing {len(texts) - len(missing)} embeddings from a previous run.")
+
+    if missing:
+        print(f"[embedding] Generating embeddings for {len(missing)} chunks...")
+        report = embedding.ThroughputReport()
+        done = 0
+        try:
+            for window, matrix in embedding.iter_embeddings((texts[i] for i in missing), report=report):
+                window_ids = [vector_ids[i] for i in missing[done:done + len(window)]]
+                saved.update(zip(window_ids, matrix))
+                done += len(window)
+                if artifacts:
+                    artifacts.append_embeddings(config, window_ids, matrix)
+        except Exception as e:
+            print(f"[embedding] Error generating embeddings: {e}")
+            return np.empty((0, 0), dtype=np.float32)
+        print(f"[embedding] Successfully generated {done} vectors: {report}.")
+
+    return np.stack([saved[vector_id] for vector_id in vector_ids])
+
+def index_content(source, all_content, all_metadata, index=None, artifacts=None):
+    """
+    Embeds and upserts only content that is not already indexed for `source`, and deletes
+    vectors whose content no longer exists. Ids are content hashes tracked in a local manifest,
+    so re-ingesting an edited document costs time in proportion to the change.
+    The manifest is saved after every upsert window, so an interrupted run resumes from there.
+    Returns True when the index fully reflects `all_content`.
+    """
+    vector_ids = [make_vector_id(source, meta["type"], text) for text, meta in zip(all_content, all_metadata)]
+
+    manifest = IngestionManifest()
+    new_indexes, stale_ids = manifest.plan(source, vector_ids)
+    unchanged = len(set(vector_ids)) - len(new_indexes)
+    print(f"\n[Pipeline] {len(new_indexes)} new/changed items, {unchanged} unchanged, {len(stale_ids)} stale.")
+
+    if not new_indexes and not stale_ids:
+        print("[Pipeline] Index already up to date, nothing to embed.")
+        return True
+
+    if index is None:
+        print("\n[Pipeline] Initializing Vector Database...")
+        index = vector_store.get_index(api_key=PINECONE_KEY, index_name=PINECONE_INDEX)
+    if not index:
+        return False
+
+    stored_ids = manifest.ids_for(source)
+    upserted_ids = []
+    if new_indexes:
+        new_content = [all_content[i] for i in new_indexes]
+        new_ids = [vector_ids[i] for i in new_indexes]
+        vectors = embed_content(new_content, new_ids, artifacts)
+
+        if len(vectors):
+            # Record progress after every window so a restart only sends what is still missing
+            for start in range(0, len(new_indexes), UPSERT_CHECKPOINT):
+                end = start + UPSERT_CHECKPOINT
+                window_ids = vector_store.upsert_vectors(
+                    index,
+                    new_content[start:end],
+                    vectors[start:end],
+                    [all_metadata[i] for i in new_indexes[start:end]],
+                    ids=new_ids[start:end],
+                ).succeeded
+                upserted_ids.extend(window_ids)
+                stored_ids |= set(window_ids)
+                manifest.update(source, stored_ids)
+                manifest.save()
+
+    deleted_ids = vector_store.delete_vectors(index, stale_ids)
+
+    # Only record what actually reached the index; failures are retried on the next run
+    stored_ids -= set(deleted_ids)
+    manifest.update(source, stored_ids)
+    manifest.save()
+
+    # Tell running chat servers to drop cached retrievals
+    vector_store.mark_index_changed(index)
+
+    return len(upserted_ids) == len(new_indexes) and len(deleted_ids) == len(stale_ids)
+
+def extract_document(pdf, workers, executor, output_root, artifacts=None, limiter=None, cache=None):
+    """
+    Runs (or restores) the extraction, chunking and captioning stages of one document.
+    Captions go through `limiter` and `cache` (default: the process-wide ones).
+    Each stage's output is saved to the artifact cache under its own configuration, so changing
+    e.g. the chunk size redoes chunking only.
+    """
+    extract_config = {
+        "output_root": output_root,
+        "table_prefilter": table.TABLE_PREFILTER,
+        "image_duplicate_distance": img.IMAGE_DUPLICATE_DISTANCE,
+    }
+    extracted = artifacts.load("extract", extract_config) if artifacts else None
+    if extracted and not all(os.path.exists(image["path"]) for image in extracted["images"]):
+        extracted = None  # the saved images were removed; extract again
+    if extracted and "page_numbers" not in extracted:
+        extracted = None  # saved before chunking was page-wise
+
+    if extracted is None:
+        # Pages are sharded across `workers` processes; results come back merged in page order.
+        with metrics.stage("extract", workers=workers):
+            result = parallel.extract_all(
+                pdf,
+                workers=workers,
+                chunk_size=CHUNK_SIZE,
+                overlap=CHUNK_OVERLAP,
+                image_folder=os.path.join(output_root, "output_images"),
+                table_folder=os.path.join(output_root, "output_tables"),
+                formula_folder=os.path.join(output_root, "output_formulas"),
+                executor=executor,
+            )
+        extracted = {
+            "page_texts": result["page_texts"],
+            "page_numbers": result["page_numbers"],
+            "table_strings": result["table_strings"],
+            "formula_strings": result["formula_strings"],
+            # Bytes stay out of the cache; the images are saved under output_images
+            "images": [{"name": i["name"], "path": i["path"], "pages": i["pages"]} for i in result["images"]],
+        }
+        chunks = {"text_chunks": result["text_chunks"], "chunk_pages": result["chunk_pages"]}
+        if artifacts:
+            artifacts.save("extract", extract_config, extracted)
+            artifacts.save("chunks", {"chunk_size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}, chunks)
+        extracted.update(chunks)
+    else:
+        chunk_config = {"chunk_size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}
+        chunks = artifacts.load("chunks", chunk_config)
+        if chunks is None:
+            text_chunks, chunk_pages = chunking.chunk_page_texts(
+                zip(extracted["page_numbers"], extracted["page_texts"]), chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+            chunks = {"text_chunks": text_chunks, "chunk_pages": chunk_pages}
+            artifacts.save("chunks", chunk_config, chunks)
+        extracted.update(chunks)
+
+    # A. Images (Extract -> Caption)
+    extracted["image_captions"], extracted["captioned_images"] = [], []
+    if extracted["images"] and GOOGLE_API_KEY:
+        caption_config = {"model": captioning.CAPTION_MODEL, "max_side": img.CAPTION_MAX_SIDE, "images": extracted["images"]}
+        captioned = artifacts.load("captions", caption_config) if artifacts else None
+        if captioned is None:
+            captions, images = img.generate_image_captions(extracted["images"], GOOGLE_API_KEY,
+                                                          limiter=limiter, cache=cache)
+            images = [{"name": i["name"], "path": i["path"], "pages": i["pages"]} for i in images]
+            captioned = {"captions": captions, "images": images}
+            # Partial results are not saved: a rerun retries the failures (and hits the caption cache for the rest)
+            if artifacts and len(captions) == len(extracted["images"]):
+                artifacts.save("captions", caption_config, captioned)
+        extracted["image_captions"], extracted["captioned_images"] = captioned["captions"], captioned["images"]
+
+    return extracted
+
+def stream_content(pdf, source, workers, executor, output_root, index=None, limiter=None, cache=None):
+    """
+    Streams one PDF through extraction, captioning, embedding and upserts at once (see
+    ingestion/streaming.py). Resumes from the manifest: items already upserted are skipped.
+    """
+    if index is None:
+        print("\n[Pipeline] Initializing Vector Database...")
+        index = vector_store.get_index(api_key=PINECONE_KEY, index_name=PINECONE_INDEX)
+    if not index:
+        return False
+
+    ok, _ = streaming.stream_document(
+        pdf, source, index,
+        workers=workers,
+        executor=executor,
+        output_root=output_root,
+        api_key=GOOGLE_API_KEY,
+        limiter=limiter,
+        cache=cache,
+        chunk_size=CHUNK_SIZE,
+        overlap=CHUNK_OVERLAP,
+    )
+    return ok
+
+def ingest_document(pdf, source, workers=None, executor=None, output_root=None, index=None, resume=None, stream=None,
+                    limiter=None, cache=None):
+    """
+    Extracts, captions, embeds and indexes one PDF (bytes or local file path). `executor` lets several documents share one
+    process pool for extraction; `output_root` keeps each document's extracted files apart.
+    Stage outputs are cached per document hash, so with `resume` (default INGEST_RESUME) a run
+    that was interrupted picks up after the last completed stage or upsert window.
+    With `stream` (default INGEST_STREAMING) the stages overlap instead, see stream_content.
+    Documents ingested concurrently must share one caption `limiter` and `cache` (the
+    process-wide ones by default), or together they exceed the caption API's rate limits.
+    Returns True when the document was fully indexed.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    output_root = output_root or ""
+    resume = INGEST_RESUME if resume is None else resume
+    stream = INGEST_STREAMING if stream is None else stream
+
+    if stream:
+        return stream_content(pdf, source, workers, executor, output_root, index=index, limiter=limiter, cache=cache)
+
+    artifacts = ArtifactCache(document_hash(pdf), read=resume)
+
+    # --- EXTRACT EVERYTHING ---
+    extracted = extract_document(pdf, workers, executor, output_root, artifacts, limiter=limiter, cache=cache)
+    image_captions = extracted["image_captions"]
+    captioned_images = extracted["captioned_images"]
+
+    # B. Tables (Get Markdown Strings)
+    table_strings = extracted["table_strings"]
+
+    # C. Formulas (Get Formula Strings)
+    formula_strings = extracted["formula_strings"]
+
+    # D. Text Chunks (with the pages each one comes from)
+    text_chunks = extracted["text_chunks"]
+    chunk_pages = extracted["chunk_pages"]
+
+    # --- PREPARE MULTI-MODAL DATA FOR EMBEDDING ---
+    all_content = []
+    all_metadata = []
+
+    # 1. Add Text (pages are strings, as for images below)
+    for t, pages in zip(text_chunks, chunk_pages):
+        all_content.append(t)
+        all_metadata.append({"type": "text", "source": source, "pages": [str(p) for p in pages]})
         
-        # D. Text Chunks
-        text_chunks = chunking.extract_text_and_chunk(pdf_bytes, chunk_size=1000, overlap=200)
-
-        # --- PREPARE MULTI-MODAL DATA FOR EMBEDDING ---
-        all_content = []
-        all_metadata = []
-
-        # 1. Add Text
-        for t in text_chunks:
-            all_content.append(t)
-            all_metadata.append({"type": "text", "source": BLOB_NAME})
-            
-        # 2. Add Tables
-        for t in table_strings:
-            all_content.append(t)
-            all_metadata.append({"type": "table", "source": BLOB_NAME})
-
-        # 3. Add Formulas
-        for f in formula_strings:
-            all_content.append(f"Mathematical Formula: {f}")
-            all_metadata.append({"type": "formula", "source": BLOB_NAME})
-
-        # 4. Add Images
-        for i, caption in enumerate(image_captions):
-            all_content.append(caption)
-            # We store the image path in metadata so a UI could potentially display it later
-            all_metadata.append({
-                "type": "image", 
-                "source": BLOB_NAME, 
-                "image_path": valid_image_paths[i]
-            })
-
-        print(f"\n[Pipeline] Total items to embed: {len(all_content)}")
-        print(f"   - Text Chunks: {len(text_chunks)}")
-        print(f"   - Tables: {len(table_strings)}")
-        print(f"   - Formulas: {len(formula_strings)}")
-        print(f"   - Images: {len(image_captions)}")
-
-        # --- EMBED & STORE ---
-        if all_content and GOOGLE_API_KEY:
-            vectors = embedding.generate_embeddings(all_content)
-            
-            if vectors:
-                print("\n[Pipeline] Initializing Vector Database...")
-                index = vector_store.init_pinecone(api_key=PINECONE_KEY, index_name=PINECONE_INDEX)
-                
-                if index:
-                    vector_store.upsert_vectors(index, all_content, vectors, all_metadata)
-
-        print("\n=== Pipeline Completed Successfully ===")
+    # 2. Add Tables
+    for t in table_strings:
+        all_content.append(t)
+        all_metadata.append({"type": "table", "source": source})
+
+    # 3. Add Formulas
+    for f in formula_strings:
+        all_content.append(f"Mathematical Formula: {f}")
+        all_metadata.append({"type": "formula", "source": source})
+
+    # 4. Add Images
+    for i, caption in enumerate(image_captions):
+        all_content.append(caption)
+        # We store the image path in metadata so a UI could potentially display it later.
+        # Pages are strings because Pinecone metadata lists must hold strings.
+        meta = {
+            "type": "image", 
+            "source": source, 
+            "pages": [str(p) for p in captioned_images[i]["pages"]]
+        }
+        if captioned_images[i].get("path"):
+            meta["image_path"] = captioned_images[i]["path"]
+        all_metadata.append(meta)
+
+    print(f"\n[Pipeline] Total items to embed: {len(all_content)}")
+    print(f"   - Text Chunks: {len(text_chunks)}")
+    print(f"   - Tables: {len(table_strings)}")
+    print(f"   - Formulas: {len(formula_strings)}")
+    print(f"   - Images: {len(image_captions)}")
+
+    # --- EMBED & STORE ---
+    if all_content:
+        if not GOOGLE_API_KEY:
+            print("[Pipeline] Gemini_Api is not set: skipping embedding and upserts, nothing was indexed.")
+            return False
+        indexed = index_content(source, all_content, all_metadata, index=index, artifacts=artifacts)
+        # Images whose captioning failed are not indexed yet; a re-run retries them
+        if not (indexed and len(image_captions) == len(extracted["images"])):
+            return False
+
+    # Fully indexed: the saved stage outputs are not needed to resume anymore
+    artifacts.clear()
+    return True
+
+def run_pipeline(workers=None, resume=None, stream=None):
+    print("=== Multi-RAG Pipeline Started (Text + Tables + Formulas + Images) ===")
+    resume = INGEST_RESUME if resume is None else resume
+
+    # One trace (logged as a JSON line with every stage's span) per ingested document
+    with metrics.trace("ingest", source=BLOB_NAME) as trace:
+        # 1. Data Read (streamed to a local file; extractors read it in place).
+        # When resuming, the file is kept until the document is fully indexed so a restart skips the download.
+        pdf_path = read_data.download_blob_to_file(CONN_STR, CONTAINER, BLOB_NAME,
+                                                   cache_dir=DOWNLOAD_CACHE_DIR if resume else None)
+
+        ok = False
+        if pdf_path:
+            try:
+                ok = ingest_document(pdf_path, BLOB_NAME, workers=workers, resume=resume, stream=stream)
+            finally:
+                if ok or not resume:
+                    os.remove(pdf_path)
+        trace.set(ok=ok)
+
+    if pdf_path:
+        if ok:
+            print("\n=== Pipeline Completed Successfully ===")
+        else:
+            print("\n=== Pipeline Incomplete: re-run to resume from the last completed step ===")
     else:
         print("Pipeline aborted: Failed to download data.")
 
+def run_container_pipeline(prefix=None, workers=None, parallel_documents=None, local_dir=None, resume=None, stream=None):
+    """
+    Ingests every PDF in the container (optionally under `prefix`). Documents are downloaded through
+    one pooled client and processed `parallel_documents` at a time; their extraction shards share a
+    single process pool of `workers` processes. Blobs whose ETag/last-modified match the blob
+    manifest are skipped. `local_dir` ingests from a directory instead of Azure (offline testing).
+    """
+    print("=== Multi-RAG Container Pipeline Started ===")
+    workers = INGEST_WORKERS if workers is None else workers
+    parallel_documents = parallel_documents or container.PARALLEL_DOCUMENTS
+
+    if local_dir:
+        container_client = container.FilesystemContainerClient(local_dir)
+    else:
+        container_client = container.get_container_client(CONN_STR, CONTAINER)
+    if container_client is None:
+        print("Pipeline aborted: Could not connect to the container.")
+        return
+
+    # Without it nothing would be fully indexed, and no blob may be recorded as ingested
+    if not GOOGLE_API_KEY:
+        print("Pipeline aborted: Gemini_Api is not set.")
+        return
+
+    index = vector_store.get_index(api_key=PINECONE_KEY, index_name=PINECONE_INDEX)
+    # Every document in flight captions within the same RPM/TPM budget
+    limiter, cache = captioning.shared_limiter(), captioning.shared_cache()
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        def process_document(blob_name, pdf_path):
+            output_root = os.path.join("output", container.safe_folder_name(blob_name))
+            with metrics.trace("ingest", source=blob_name) as trace:
+                ok = ingest_document(pdf_path, blob_name, workers=max(1, workers), executor=executor,
+                                     output_root=output_root, index=index, resume=resume, stream=stream,
+                                     limiter=limiter, cache=cache)
+                trace.set(ok=ok)
+            return ok
+
+        summary = container.ingest_container(
+            container_client,
+            process_document,
+            prefix=prefix,
+            parallel_documents=parallel_documents,
+        )
+
+    print(f"\n=== Container Pipeline Completed: {summary['ingested']} ingested, "
+          f"{summary['skipped']} unchanged, {summary['failed']} failed ===")
+
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multi-RAG ingestion pipeline")
+    parser.add_argument("--container", action="store_true", help="Ingest every PDF in the container instead of blob_name")
+    parser.add_argument("--prefix", default=None, help="Only ingest blobs whose name starts with this prefix")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction worker processes (default INGEST_WORKERS)")
+    parser.add_argument("--parallel-documents", type=int, default=None, help="Documents processed at the same time")
+    parser.add_argument("--local-dir", default=None, help="Read PDFs from this directory instead of Azure")
+    parser.add_argument("--fresh", action="store_true", help="Ignore stage outputs saved by earlier runs")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="Overlap extraction, captioning, embedding and upserts (default INGEST_STREAMING)")
+    args = parser.parse_args()
+
+    if args.container or args.local_dir:
+        run_container_pipeline(
+            prefix=args.prefix,
+            workers=args.workers,
+            parallel_documents=args.parallel_documents,
+            local_dir=args.local_dir,
+            resume=False if args.fresh else None,
+            stream=args.stream,
+        )
+    else:
+        run_pipeline(workers=args.workers, resume=False if args.fresh else None, stream=args.stream)
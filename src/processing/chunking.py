@@ -1,39 +1,140 @@
-from PyPDF2 import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import io
+
+from src.ingestion.document import shared_document
+
+def iter_page_texts(doc, pages=None):
+    """
+    Yields (1-based page number, text) for the non-empty pages among the given page indexes
+    (all pages by default), in page order.
+    """
+    if pages is None:
+        pages = range(doc.page_count)
+
+    for page_num in pages:
+        text = doc.page_text(page_num)
+        if text:
+            yield page_num + 1, text
+
+def read_page_texts(doc, pages=None):
+    """
+    Returns (1-based page number, text) for the non-empty pages among the given page indexes
+    (all pages by default), in page order.
+    """
+    return list(iter_page_texts(doc, pages))
+
+def _make_splitter(chunk_size, overlap):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+class PageChunker:
+    """
+    Splits text page by page as pages arrive, tracking the 1-based pages each chunk spans.
+
+    The last chunk of every page is held back and split again together with the next page,
+    so chunks still run across page breaks while at most one page plus one chunk is in memory.
+    """
+
+    def __init__(self, chunk_size=1000, overlap=100):
+        self.overlap = overlap
+        self.splitter = _make_splitter(chunk_size, overlap)
+        self.carry = ""
+        self.carry_pages = []  # (offset in carry, page number) where each page's text starts
+        self.carry_tail = ""   # whitespace after the carry on its page
+
+    def _split(self, text, starts):
+        """Yields (chunk, pages) for all chunks of `text` but the last, which becomes the new carry."""
+        chunks = self.splitter.split_text(text)
+        if not chunks:
+            return
+
+        search_from = 0
+        positions = []
+        for chunk in chunks:
+            # The splitter strips whitespace, so locate each chunk to map it back to its pages
+            offset = text.find(chunk, search_from)
+            offset = search_from if offset < 0 else offset
+            positions.append(offset)
+            search_from = max(0, offset + len(chunk) - self.overlap)
+
+        bounds = [start for start, _ in starts[1:]] + [len(text)]
+        def pages_in(begin, end):
+            return [page for (start, page), stop in zip(starts, bounds) if start < end and stop > begin]
+
+        for chunk, offset in zip(chunks[:-1], positions[:-1]):
+            yield chunk, pages_in(offset, offset + len(chunk))
+
+        self.carry, offset = chunks[-1], positions[-1]
+        self.carry_tail = text[offset + len(self.carry):]
+        self.carry_pages = [
+            (max(0, start - offset), page)
+            for (start, page), stop in zip(starts, bounds) if start < offset + len(self.carry) and stop > offset
+        ]
+
+    def add_page(self, page_number, text):
+        """Yields the (chunk, pages) pairs completed by this page."""
+        if self.carry:
+            # The same separator chunk_page_texts has between the pages: the page's trailing
+            # whitespace (stripped from the chunk by the splitter) and one newline
+            joined = self.carry + self.carry_tail + "\n"
+            starts = self.carry_pages + [(len(joined), page_number)]
+            text = joined + text
+        else:
+            starts = [(0, page_number)]
+        self.carry, self.carry_pages, self.carry_tail = "", [], ""
+        yield from self._split(text, starts)
+
+    def flush(self):
+        """Yields the last chunk held back, once no more pages follow."""
+        if self.carry:
+            yield self.carry, [page for _, page in self.carry_pages]
+        self.carry, self.carry_pages, self.carry_tail = "", [], ""
+
+def iter_page_chunks(page_texts, chunk_size=1000, overlap=100):
+    """
+    Chunks (page number, text) pairs page by page, yielding (chunk, pages) pairs.
+    """
+    chunker = PageChunker(chunk_size=chunk_size, overlap=overlap)
+    for page_number, text in page_texts:
+        yield from chunker.add_page(page_number, text)
+    yield from chunker.flush()
+
+def chunk_page_texts(page_texts, chunk_size=1000, overlap=100):
+    """
+    Chunks (page number, text) pairs page by page, as iter_page_chunks. Returns two aligned
+    lists: the chunks, and the 1-based page numbers each chunk comes from.
+    """
+    chunks, chunk_pages = [], []
+    for chunk, pages in iter_page_chunks(page_texts, chunk_size=chunk_size, overlap=overlap):
+        chunks.append(chunk)
+        chunk_pages.append(pages)
+
+    print(f"[chunking] Created {len(chunks)} chunks.")
+    return chunks, chunk_pages
 
 def extract_text_and_chunk(pdf_bytes, chunk_size=1000, overlap=100):
     """
-    Extracts text from PDF bytes and splits it using RecursiveCharacterTextSplitter.
+    Extracts text from PDF bytes and yields its chunks page by page as (chunk, pages) pairs,
+    where pages are the 1-based page numbers the chunk's text comes from.
+    Accepts raw bytes or a shared ParsedDocument, reusing its cached page text.
+    Errors are raised, not swallowed, so a failure is never mistaken for a shorter document.
     """
     if not pdf_bytes:
         print("[chunking] No data to process.")
-        return []
+        return
 
     print("[chunking] Extracting text...")
+    count = 0
     try:
-        pdf_stream = io.BytesIO(pdf_bytes)
-        reader = PdfReader(pdf_stream)
-        
-        full_text = ""
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                full_text += text + "\n"
-
-        print(f"[chunking] Extracted {len(full_text)} characters. Chunking with RecursiveCharacterTextSplitter...")
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=overlap,
-            length_function=len,
-            is_separator_regex=False,
-        )
-        
-        chunks = text_splitter.split_text(full_text)
-            
-        print(f"[chunking] Created {len(chunks)} chunks.")
-        return chunks
+        with shared_document(pdf_bytes) as doc:
+            for chunk, pages in iter_page_chunks(iter_page_texts(doc), chunk_size=chunk_size, overlap=overlap):
+                count += 1
+                yield chunk, pages
     except Exception as e:
-        print(f"[chunking] Error processing text: {e}")
-        return []  
\ No newline at end of file
+        # Chunks may already have been yielded: the caller must not take them for the whole document
+        print(f"[chunking] Error processing text after {count} chunks: {e}")
+        raise
+    print(f"[chunking] Created {count} chunks.")
@@ -0,0 +1,417 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from src.retrieval import quantization
+
+
+class LocalVectorStore:
+    """
+    Embedded vector index with the same upsert/query/delete interface as a Pinecone Index.
+
+    Vectors are L2-normalized and kept in a memory-mapped float32 file (`vectors.f32`), so cosine
+    similarity is a single matrix-vector product. Ids, row numbers and zlib-compressed JSON metadata
+    live in a SQLite side store (`meta.sqlite`).
+
+    mode="exact" scores every vector with vectorized NumPy.
+    mode="ivf" clusters the vectors into `nlist` k-means lists and only scores the `nprobe` lists
+    closest to the query (falls back to exact search below `ivf_min_vectors`).
+
+    quantization="int8" or "binary" also keeps compact codes (`codes.int8` + `scales.f32`, or
+    `codes.binary`) and scans those instead of the float32 rows; the best `rescore_factor * top_k`
+    candidates are then rescored exactly, so only those float32 rows are read. The setting is
+    stored with the index (None keeps the stored one, "none" turns it off).
+    """
+
+    accepts_arrays = True  # upsert() takes NumPy rows directly, no list conversion needed
+
+    def __init__(self, path, dimension=384, mode="exact", nlist=None, nprobe=8, ivf_min_vectors=10000,
+                 quantization=None, rescore_factor=None):
+        self.path = path
+        self.dimension = dimension
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_vectors = ivf_min_vectors
+        self.requested_quantization = quantization
+        self.rescore_factor = rescore_factor
+
+        os.makedirs(path, exist_ok=True)
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.sqlite")
+        self.ivf_path = os.path.join(path, "ivf.npz")
+        self.scales_path = os.path.join(path, "scales.f32")
+
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.meta_path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, row INTEGER UNIQUE, metadata BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        self._load()
+
+    # ------------------------------
+    # STORAGE
+    # ------------------------------
+    def _load(self):
+        with self.lock:
+            info = dict(self.conn.execute("SELECT key, value FROM info").fetchall())
+            self.dimension = int(info.get("dimension", self.dimension))
+            self.capacity = int(info.get("capacity", 0))
+            self.rows_used = int(info.get("rows_used", 0))
+            self.ivf_trained_on = int(info.get("ivf_trained_on", 0))
+
+            stored_quantization = info.get("quantization") or None
+            if self.requested_quantization is None:
+                self.quantization = stored_quantization
+            else:
+                self.quantization = None if self.requested_quantization == "none" else self.requested_quantization
+            if self.quantization not in (None,) + quantization.CODE_KINDS:
+                raise ValueError(f"Unknown quantization '{self.quantization}'")
+
+            self.row_ids = [None] * self.capacity
+            self.id_rows = {}
+            for vector_id, row in self.conn.execute("SELECT id, row FROM vectors"):
+                self.row_ids[row] = vector_id
+                self.id_rows[vector_id] = row
+            self.alive = np.zeros(self.capacity, dtype=bool)
+            if self.id_rows:
+                self.alive[list(self.id_rows.values())] = True
+            self.free_rows = [r for r in range(self.rows_used) if not self.alive[r]]
+
+            self.matrix = None
+            if self.capacity:
+                self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                        shape=(self.capacity, self.dimension))
+
+            self.codes = None
+            self.scales = None
+            if self.quantization and self.capacity:
+                self._open_codes(rebuild=stored_quantization != self.quantization)
+            if self.quantization != stored_quantization:
+                self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('quantization', ?)",
+                                  (self.quantization or "",))
+                self.conn.commit()
+
+            self.centroids = None
+            self.assignments = None
+            if os.path.exists(self.ivf_path):
+                ivf = np.load(self.ivf_path)
+                self.centroids = ivf["centroids"]
+                self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+                stored = ivf["assignments"][:self.capacity]
+                self.assignments[:len(stored)] = stored
+
+            self._meta_mtime = self._stat_meta()
+
+    def _stat_meta(self):
+        try:
+            return os.stat(self.meta_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        # Another process (e.g. the ingestion pipeline) may have written to the index
+        if self._stat_meta() != self._meta_mtime:
+            self._load()
+
+    # ------------------------------
+    # QUANTIZED CODES
+    # ------------------------------
+    @property
+    def codes_path(self):
+        return os.path.join(self.path, f"codes.{self.quantization}")
+
+    def _code_width(self):
+        return self.dimension if self.quantization == "int8" else (self.dimension + 7) // 8
+
+    def _open_codes(self, rebuild=False):
+        """Maps the code files at the current capacity, (re)encoding every row if they are missing or stale."""
+        code_dtype = np.int8 if self.quantization == "int8" else np.uint8
+        code_bytes = self.capacity * self._code_width()
+        rebuild = rebuild or not os.path.exists(self.codes_path) or os.path.getsize(self.codes_path) > code_bytes
+        if rebuild and os.path.exists(self.codes_path):
+            os.remove(self.codes_path)
+
+        for path, size in [(self.codes_path, code_bytes), (self.scales_path, self.capacity * 4)]:
+            if path == self.scales_path and self.quantization != "int8":
+                continue
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+        self.codes = np.memmap(self.codes_path, dtype=code_dtype, mode="r+", shape=(self.capacity, self._code_width()))
+        self.scales = None
+        if self.quantization == "int8":
+            self.scales = np.memmap(self.scales_path, dtype=np.float32, mode="r+", shape=(self.capacity,))
+
+        if rebuild and self.rows_used:
+            print(f"[local_store] Encoding {self.rows_used} vectors as {self.quantization} codes...")
+            block = 65536
+            for start in range(0, self.rows_used, block):
+                end = min(start + block, self.rows_used)
+                self._encode_rows(np.arange(start, end), np.asarray(self.matrix[start:end]))
+            self.codes.flush()
+
+    def _encode_rows(self, rows, values):
+        if self.quantization == "int8":
+            self.codes[rows], self.scales[rows] = quantization.quantize_int8(values)
+        else:
+            self.codes[rows] = quantization.quantize_binary(values)
+
+    def _quantized_search(self, q, n, candidates, top_k):
+        """Shortlists rows by their codes, then rescores the shortlist with the float32 rows."""
+        if candidates is None:
+            scales = self.scales[:n] if self.scales is not None else None
+            approx = quantization.approximate_scores(self.quantization, self.codes[:n], scales, q)
+            approx[~self.alive[:n]] = -np.inf
+            rows = np.arange(n)
+        else:
+            rows = candidates
+            scales = self.scales[rows] if self.scales is not None else None
+            approx = quantization.approximate_scores(self.quantization, self.codes[rows], scales, q)
+
+        factor = self.rescore_factor or quantization.RESCORE_FACTORS[self.quantization]
+        shortlist_size = min(top_k * factor, int(np.isfinite(approx).sum()))
+        shortlist = rows[quantization.top_k(approx, shortlist_size)]
+        return quantization.rescore(self.matrix, shortlist, q, top_k)
+
+    def _grow(self, needed_rows):
+        new_capacity = max(1024, self.capacity)
+        while new_capacity < needed_rows:
+            new_capacity *= 2
+        if new_capacity == self.capacity:
+            return
+
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                shape=(new_capacity, self.dimension))
+
+        if self.quantization:
+            if self.codes is not None:
+                self.codes.flush()
+                del self.codes
+            old_capacity, self.capacity = self.capacity, new_capacity
+            self._open_codes()
+            self.capacity = old_capacity
+
+        self.row_ids.extend([None] * (new_capacity - self.capacity))
+        self.alive = np.concatenate([self.alive, np.zeros(new_capacity - self.capacity, dtype=bool)])
+        if self.assignments is not None:
+            self.assignments = np.concatenate(
+                [self.assignments, np.full(new_capacity - self.capacity, -1, dtype=np.int32)])
+        self.capacity = new_capacity
+
+    def _save_info(self):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            [("dimension", str(self.dimension)), ("capacity", str(self.capacity)),
+             ("rows_used", str(self.rows_used))],
+        )
+
+    def _commit(self):
+        self._save_info()
+        self.matrix.flush()
+        if self.codes is not None:
+            self.codes.flush()
+            if self.scales is not None:
+                self.scales.flush()
+        if self.centroids is not None:
+            np.savez(self.ivf_path, centroids=self.centroids, assignments=self.assignments[:self.rows_used])
+        self.conn.commit()
+        self._meta_mtime = self._stat_meta()
+
+    # ------------------------------
+    # PINECONE-COMPATIBLE API
+    # ------------------------------
+    def upsert(self, vectors):
+        """
+        Inserts or replaces [{"id", "values", "metadata"}] records.
+        """
+        if not vectors:
+            return {"upserted_count": 0}
+
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {values.shape}")
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            self._maybe_reload()
+
+            rows = []
+            new_ids = len({v["id"] for v in vectors} - self.id_rows.keys())
+            self._grow(self.rows_used + max(0, new_ids - len(self.free_rows)))
+
+            records = []
+            for v in vectors:
+                row = self.id_rows.get(v["id"])
+                if row is None:
+                    row = self.free_rows.pop() if self.free_rows else self.rows_used
+                    if row == self.rows_used:
+                        self.rows_used += 1
+                    self.id_rows[v["id"]] = row
+                    self.row_ids[row] = v["id"]
+                self.alive[row] = True
+                rows.append(row)
+
+                metadata = zlib.compress(json.dumps(v.get("metadata", {}), separators=(",", ":")).encode("utf-8"))
+                records.append((v["id"], row, metadata))
+
+            rows = np.asarray(rows)
+            self.matrix[rows] = values
+            if self.codes is not None:
+                self._encode_rows(rows, values)
+            if self.centroids is not None:
+                self.assignments[rows] = np.argmax(values @ self.centroids.T, axis=1)
+
+            self.conn.executemany("INSERT OR REPLACE INTO vectors (id, row, metadata) VALUES (?, ?, ?)", records)
+            self._commit()
+
+        if self.mode == "ivf" and self._ivf_stale():
+            self.build_ivf()
+
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False):
+        with self.lock:
+            self._maybe_reload()
+            if delete_all:
+                ids = list(self.id_rows)
+            for vector_id in ids or []:
+                row = self.id_rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                self.alive[row] = False
+                self.row_ids[row] = None
+                self.free_rows.append(row)
+            self.conn.executemany("DELETE FROM vectors WHERE id = ?", [(i,) for i in ids or []])
+            if self.matrix is not None:
+                self._commit()
+            else:
+                self.conn.commit()
+        return {}
+
+    def fetch_metadata(self, ids):
+        placeholders = ",".join("?" for _ in ids)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, metadata FROM vectors WHERE id IN ({placeholders})", list(ids)).fetchall()
+        return {vector_id: json.loads(zlib.decompress(blob)) for vector_id, blob in rows}
+
+    def query(self, vector, top_k=5, include_metadata=False, include_values=False, **kwargs):
+        """
+        Returns {"matches": [{"id", "score", "metadata"}]} ordered by cosine similarity.
+        """
+        with self.lock:
+            self._maybe_reload()
+            n = self.rows_used
+            if n == 0 or not self.id_rows:
+                return {"matches": []}
+
+            q = np.asarray(vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+
+            candidates = self._candidate_rows(q, n)
+            if self.codes is not None:
+                best_rows, best_scores = self._quantized_search(q, n, candidates, top_k)
+            else:
+                if candidates is None:
+                    scores = self.matrix[:n] @ q
+                    scores[~self.alive[:n]] = -np.inf
+                    rows = np.arange(n)
+                else:
+                    rows = candidates
+                    scores = self.matrix[rows] @ q
+
+                k = min(top_k, int(np.isfinite(scores).sum()))
+                best = quantization.top_k(scores, k)
+                best_rows, best_scores = rows[best], scores[best]
+
+            if len(best_rows) == 0:
+                return {"matches": []}
+
+            matches = [{"id": self.row_ids[row], "score": float(score)} for row, score in zip(best_rows, best_scores)]
+            if include_values:
+                for match, row in zip(matches, best_rows):
+                    match["values"] = self.matrix[row].tolist()
+
+        if include_metadata:
+            metadata = self.fetch_metadata([m["id"] for m in matches])
+            for match in matches:
+                match["metadata"] = metadata.get(match["id"], {})
+
+        return {"matches": matches}
+
+    def describe_index_stats(self):
+        return {"dimension": self.dimension, "total_vector_count": len(self.id_rows)}
+
+    # ------------------------------
+    # IVF (APPROXIMATE SEARCH)
+    # ------------------------------
+    def _ivf_stale(self):
+        count = len(self.id_rows)
+        if count < self.ivf_min_vectors:
+            return False
+        if self.centroids is None:
+            return True
+        # Rebuild once the corpus has doubled since the lists were trained
+        return count > 2 * self.ivf_trained_on
+
+    def _candidate_rows(self, q, n):
+        if self.mode != "ivf" or self.centroids is None or len(self.id_rows) < self.ivf_min_vectors:
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        mask = np.isin(self.assignments[:n], probes) & self.alive[:n]
+        return np.nonzero(mask)[0]
+
+    def build_ivf(self, nlist=None, iterations=10, sample_size=50000, seed=0):
+        """
+        Trains k-means centroids on a sample of the stored vectors and assigns every row to a list.
+        """
+        with self.lock:
+            rows = np.nonzero(self.alive[:self.rows_used])[0]
+            if len(rows) == 0:
+                return
+            nlist = nlist or self.nlist or max(1, int(np.sqrt(len(rows))))
+            nlist = min(nlist, len(rows))
+            print(f"[local_store] Building IVF index with {nlist} lists over {len(rows)} vectors...")
+
+            rng = np.random.default_rng(seed)
+            sample = np.asarray(self.matrix[np.sort(rng.choice(rows, min(sample_size, len(rows)), replace=False))])
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroid = members.mean(axis=0)
+                        centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+            self.centroids = centroids.astype(np.float32)
+            self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+            block = 65536
+            for start in range(0, self.rows_used, block):
+                end = min(start + block, self.rows_used)
+                self.assignments[start:end] = np.argmax(self.matrix[start:end] @ self.centroids.T, axis=1)
+
+            self.ivf_trained_on = len(rows)
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('ivf_trained_on', ?)",
+                              (str(self.ivf_trained_on),))
+            self._commit()
+
+    def close(self):
+        with self.lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+            self.conn.close()
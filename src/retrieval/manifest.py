@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+
+# --- Configuration ---
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(".cache", "ingest_manifest.json"))
+
+# Serializes read-merge-write of manifest files when documents are ingested concurrently
+_save_lock = threading.Lock()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_vector_id(source, content_type, text):
+    """
+    Deterministic vector id: the same content from the same source always maps to the same id,
+    e.g. "text-3f2a9c1b0d-9b1e...". Re-ingesting unchanged content overwrites instead of duplicating.
+    """
+    source_part = hashlib.sha1(str(source).encode("utf-8")).hexdigest()[:10]
+    return f"{content_type}-{source_part}-{content_hash(text)[:32]}"
+
+
+class IngestionManifest:
+    """
+    Local record of which vector ids are stored for each source document.
+    Stored as JSON: {source: [vector ids]}.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.sources = self._read()
+        self._changed = set()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def ids_for(self, source):
+        return set(self.sources.get(source, []))
+
+    def plan(self, source, vector_ids):
+        """
+        Compares the ids produced by this run with the stored ones.
+        Returns (indexes of ids that need embedding + upsert, stored ids that no longer exist).
+        """
+        stored = self.ids_for(source)
+        seen = set()
+        new_indexes = []
+        for i, vector_id in enumerate(vector_ids):
+            if vector_id in seen:
+                continue  # identical content appears twice in the document
+            seen.add(vector_id)
+            if vector_id not in stored:
+                new_indexes.append(i)
+        stale_ids = sorted(stored - seen)
+        return new_indexes, stale_ids
+
+    def update(self, source, vector_ids):
+        self.sources[source] = sorted(set(vector_ids))
+        self._changed.add(source)
+
+    def save(self):
+        """
+        Writes the sources changed through this instance, merged with whatever other
+        writers saved since it was loaded.
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        with _save_lock:
+            merged = self._read()
+            for source in self._changed:
+                merged[source] = self.sources[source]
+            self.sources = merged
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.sources, f)
+            os.replace(tmp_path, self.path)
+        self._changed.clear()
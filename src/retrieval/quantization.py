@@ -0,0 +1,180 @@
+import argparse
+import time
+
+import numpy as np
+
+# Rows scored per block: small enough that the float32 copy of a block stays in CPU cache
+BLOCK_ROWS = 1024
+
+# Set bits in every byte value, for Hamming distances on packed binary codes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+CODE_KINDS = ("int8", "binary")
+
+# Candidates kept per result for float32 rescoring: int8 scores are nearly exact,
+# 1-bit codes need a much deeper shortlist for the same recall
+RESCORE_FACTORS = {"int8": 4, "binary": 40}
+
+
+# ------------------------------
+# INT8
+# ------------------------------
+def quantize_int8(vectors):
+    """
+    Symmetric per-row int8 codes: row ≈ codes * scale / 127. Needs no training, so every
+    upsert can encode its own rows. 1 byte per dimension plus a float32 scale per row.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1)
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None] * 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scores(codes, scales, q):
+    """Approximate dot products of `q` with every int8-coded row."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        block = np.asarray(codes[start:start + BLOCK_ROWS], dtype=np.float32)
+        scores[start:start + len(block)] = block @ q
+    scores *= np.asarray(scales, dtype=np.float32) / 127.0
+    return scores
+
+
+# ------------------------------
+# BINARY
+# ------------------------------
+def quantize_binary(vectors):
+    """Sign bit per dimension, packed 8 per byte (384 dims -> 48 bytes)."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def _popcounts(xor):
+    """Set bits per row of a uint8 matrix (64 bits at a time with NumPy >= 2.0)."""
+    if hasattr(np, "bitwise_count") and xor.shape[1] % 8 == 0:
+        return np.bitwise_count(np.ascontiguousarray(xor).view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+def binary_scores(codes, q):
+    """Similarity = number of matching sign bits with the query (dimension - Hamming distance)."""
+    q_bits = quantize_binary(q[None, :])[0]
+    dimension = len(q)
+    scores = np.empty(len(codes), dtype=np.float32)
+    block_rows = BLOCK_ROWS * 16  # XOR + popcount is cheap per row
+    for start in range(0, len(codes), block_rows):
+        block = np.asarray(codes[start:start + block_rows])
+        scores[start:start + len(block)] = dimension - _popcounts(block ^ q_bits)
+    return scores
+
+
+# ------------------------------
+# SEARCH
+# ------------------------------
+def approximate_scores(kind, codes, scales, q):
+    if kind == "int8":
+        return int8_scores(codes, scales, q)
+    if kind == "binary":
+        return binary_scores(codes, q)
+    raise ValueError(f"Unknown quantization '{kind}', expected one of {CODE_KINDS}")
+
+
+def top_k(scores, k):
+    """Indexes of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def rescore(full_vectors, rows, q, k):
+    """
+    Exact float32 scores for candidate `rows` only (full_vectors may be a memmap; just these
+    rows are read). Returns (rows, scores) of the best k, best first.
+    """
+    rows = np.sort(rows)  # sequential reads from the memmap
+    scores = np.asarray(full_vectors[rows], dtype=np.float32) @ q
+    best = top_k(scores, k)
+    return rows[best], scores[best]
+
+
+# ------------------------------
+# BENCHMARK
+# ------------------------------
+def _synthetic_embeddings(n, dimension, clusters, rng):
+    """Unit vectors drawn around random cluster centres, roughly like sentence embeddings."""
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def benchmark(n=200000, dimension=384, queries=200, k=10, rescore_factor=None, seed=0):
+    """
+    Compares exact float32 search with int8 and binary candidate search + float32 rescoring:
+    recall@k against exact, mean/p95 query latency and bytes held per vector.
+    """
+    rng = np.random.default_rng(seed)
+    print(f"[quantization] Generating {n} x {dimension} vectors...")
+    vectors = _synthetic_embeddings(n, dimension, clusters=max(1, n // 500), rng=rng)
+    query_vectors = _synthetic_embeddings(queries, dimension, clusters=max(1, n // 500), rng=np.random.default_rng(seed))
+    query_vectors = 0.5 * query_vectors + 0.5 * vectors[rng.integers(0, n, queries)]
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    int8_codes, int8_scales = quantize_int8(vectors)
+    binary_codes = quantize_binary(vectors)
+
+    def exact(q):
+        return top_k(vectors @ q, k)
+
+    def quantized(kind, codes, scales):
+        shortlist = k * (rescore_factor or RESCORE_FACTORS[kind])
+
+        def search(q):
+            candidates = top_k(approximate_scores(kind, codes, scales, q), shortlist)
+            return rescore(vectors, candidates, q, k)[0]
+        return search
+
+    methods = [
+        ("float32 exact", exact, vectors.nbytes),
+        ("int8 + rescore", quantized("int8", int8_codes, int8_scales), int8_codes.nbytes + int8_scales.nbytes),
+        ("binary + rescore", quantized("binary", binary_codes, None), binary_codes.nbytes),
+    ]
+
+    truth = [set(exact(q).tolist()) for q in query_vectors]
+    results = {}
+    for name, search, nbytes in methods:
+        latencies, recall = [], 0.0
+        for q, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            found = search(q)
+            latencies.append(time.perf_counter() - start)
+            recall += len(expected & set(found.tolist())) / k
+        results[name] = {
+            "recall": recall / len(query_vectors),
+            "mean_ms": 1000 * float(np.mean(latencies)),
+            "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+            "bytes_per_vector": nbytes / n,
+            "scan_mb": nbytes / 1e6,
+        }
+
+    print(f"\n{'method':<18} {'recall@' + str(k):>10} {'mean ms':>9} {'p95 ms':>8} {'bytes/vec':>10} {'scanned MB':>11}")
+    for name, r in results.items():
+        print(f"{name:<18} {r['recall']:>10.3f} {r['mean_ms']:>9.2f} {r['p95_ms']:>8.2f} "
+              f"{r['bytes_per_vector']:>10.0f} {r['scan_mb']:>11.1f}")
+    factors = {kind: rescore_factor or RESCORE_FACTORS[kind] for kind in CODE_KINDS}
+    print("\n(Quantized methods also read " + ", ".join(f"{k * f} ({kind})" for kind, f in factors.items())
+          + " float32 rows per query for rescoring.)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantized vs exact float32 search benchmark")
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=None, help="Default: per code type (RESCORE_FACTORS)")
+    args = parser.parse_args()
+    benchmark(args.vectors, args.dimension, args.queries, args.top_k, args.rescore_factor)
@@ -0,0 +1,232 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import metrics
+
+# --- Configuration ---
+# Pinecone accepts at most 1000 vectors / 2 MB per upsert request and 40 KB of metadata per vector
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "200"))
+UPSERT_MAX_BYTES = int(os.getenv("UPSERT_MAX_BYTES", str(1_800_000)))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+UPSERT_RETRIES = int(os.getenv("UPSERT_RETRIES", "5"))
+METADATA_MAX_BYTES = 40_000
+
+# Upper bound for one float in a JSON request body ("-0.012345678918063641,")
+BYTES_PER_VALUE = 24
+
+UPSERTED = metrics.counter("rag_upserted_vectors_total", "Vectors sent to the index by outcome.", ["result"])
+UPSERT_RETRIES_TOTAL = metrics.counter("rag_upsert_retries_total", "Upsert batches retried.")
+UPSERT_BATCH_SECONDS = metrics.histogram("rag_upsert_batch_duration_seconds", "Duration of one upsert request.")
+UPSERT_BYTES = metrics.counter("rag_upsert_bytes_total", "Estimated upsert request bytes sent.")
+
+
+def _text_bytes(value):
+    return len(value.encode("utf-8"))
+
+
+def fit_metadata(meta, max_bytes=METADATA_MAX_BYTES):
+    """
+    Cuts meta["text"] so the serialized metadata fits in `max_bytes` (UTF-8 bytes, not
+    characters: 30,000 characters of non-Latin text can be three times that).
+    """
+    size = _text_bytes(json.dumps(meta, ensure_ascii=False))
+    if size <= max_bytes or "text" not in meta:
+        return meta
+
+    text = meta["text"]
+    budget = _text_bytes(text) - (size - max_bytes)
+    if budget <= 0:
+        meta["text"] = ""
+    else:
+        meta["text"] = text.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+    return meta
+
+
+def record_bytes(record):
+    """
+    Estimated size of one vector in an upsert request body. JSON clients escape non-ASCII
+    text as \\uXXXX, so it is measured the same way.
+    """
+    values = record["values"]
+    header = {k: v for k, v in record.items() if k != "values"}
+    return len(json.dumps(header)) + len(values) * BYTES_PER_VALUE
+
+
+def make_batches(records, max_count=UPSERT_BATCH_SIZE, max_bytes=UPSERT_MAX_BYTES):
+    """
+    Groups records in order into batches of at most `max_count` records and `max_bytes`
+    estimated request size. A single record over `max_bytes` is sent on its own.
+    """
+    batches = []
+    batch, batch_bytes = [], 0
+    for record in records:
+        size = record_bytes(record)
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(record)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_retryable(error):
+    """
+    Throttling, server and network errors are retried; other 4xx responses (bad request,
+    payload too large, auth) would fail the same way again.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return not isinstance(error, (ValueError, TypeError))
+
+
+class UpsertReport:
+    """Outcome of one upsert: which ids made it, which did not, and how long it took."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.succeeded = []
+        self.failed = []
+        self.errors = []
+        self.batches = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def add_success(self, ids, size):
+        with self.lock:
+            self.succeeded.extend(ids)
+            self.batches += 1
+            self.bytes += size
+
+    def add_failure(self, ids, error):
+        with self.lock:
+            self.failed.extend(ids)
+            self.batches += 1
+            self.errors.append(f"{type(error).__name__}: {error}")
+
+    def add_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    @property
+    def vectors_per_second(self):
+        return len(self.succeeded) / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{len(self.succeeded)} upserted, {len(self.failed)} failed in {self.batches} batches "
+                f"({self.retries} retries, {self.bytes / 1e6:.1f} MB, {self.vectors_per_second:.0f} vectors/s)")
+
+
+def upsert_records(index, records, batch_size=UPSERT_BATCH_SIZE, max_bytes=UPSERT_MAX_BYTES,
+                   concurrency=UPSERT_CONCURRENCY, max_retries=UPSERT_RETRIES, base_delay=0.5, max_delay=30.0):
+    """
+    Upserts {"id", "values", "metadata"} records: byte- and count-limited batches are sent by
+    `concurrency` threads sharing the index client's connection pool, and each batch is retried
+    with exponential backoff and jitter. Returns an UpsertReport; failed ids are listed, not lost.
+    """
+    report = UpsertReport()
+    batches = make_batches(records, max_count=batch_size, max_bytes=max_bytes)
+    start = time.perf_counter()
+
+    def send(batch):
+        ids = [record["id"] for record in batch]
+        for attempt in range(max_retries + 1):
+            sent_at = time.perf_counter()
+            try:
+                index.upsert(vectors=batch)
+                size = sum(record_bytes(record) for record in batch)
+                report.add_success(ids, size)
+                UPSERT_BATCH_SECONDS.observe(time.perf_counter() - sent_at)
+                UPSERTED.inc(len(ids), result="succeeded")
+                UPSERT_BYTES.inc(size)
+                return
+            except Exception as e:
+                if not is_retryable(e) or attempt == max_retries:
+                    print(f"[upsert] Batch of {len(batch)} failed: {e}")
+                    report.add_failure(ids, e)
+                    UPSERTED.inc(len(ids), result="failed")
+                    return
+                report.add_retry()
+                UPSERT_RETRIES_TOTAL.inc()
+                delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                time.sleep(delay)
+
+    with metrics.stage("upsert", vectors=len(records), batches=len(batches)) as span:
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as executor:
+                list(executor.map(send, batches))
+        span.set(failed=len(report.failed), retries=report.retries)
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+# ------------------------------
+# LOCAL STAND-IN FOR TESTS
+# ------------------------------
+class FakeIndexError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeIndex:
+    """
+    In-memory Pinecone-like index for offline tests and benchmarks. Each request sleeps
+    `latency` seconds (plus `per_vector_latency` per vector), fails with a 503 with probability
+    `failure_rate`, and is rejected with a 400 when its JSON body exceeds `max_request_bytes`.
+    """
+
+    def __init__(self, latency=0.02, per_vector_latency=0.0, failure_rate=0.0,
+                 max_request_bytes=2 * 1024 * 1024, seed=None):
+        self.latency = latency
+        self.per_vector_latency = per_vector_latency
+        self.failure_rate = failure_rate
+        self.max_request_bytes = max_request_bytes
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.vectors = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def upsert(self, vectors):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.random.random() < self.failure_rate
+        try:
+            body = json.dumps({"vectors": [
+                {**v, "values": [float(x) for x in v["values"]]} for v in vectors
+            ]})
+            time.sleep(self.latency + self.per_vector_latency * len(vectors))
+            if len(body.encode("utf-8")) > self.max_request_bytes:
+                raise FakeIndexError(f"Request size {len(body)} exceeds {self.max_request_bytes} bytes", status=400)
+            if fail:
+                raise FakeIndexError("Service unavailable", status=503)
+            with self.lock:
+                for v in vectors:
+                    self.vectors[v["id"]] = v
+            return {"upserted_count": len(vectors)}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def delete(self, ids=None, delete_all=False):
+        with self.lock:
+            if delete_all:
+                self.vectors.clear()
+            for vector_id in ids or []:
+                self.vectors.pop(vector_id, None)
+
+    def describe_index_stats(self):
+        with self.lock:
+            return {"total_vector_count": len(self.vectors)}
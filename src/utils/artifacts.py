@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# --- Configuration ---
+# Per-document stage outputs, so an interrupted ingestion resumes instead of starting over
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(".cache", "artifacts"))
+
+
+def document_hash(pdf):
+    """SHA-256 of a PDF given as bytes or a local file path (streamed, never fully loaded)."""
+    h = hashlib.sha256()
+    if isinstance(pdf, (str, os.PathLike)):
+        with open(pdf, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+    else:
+        h.update(pdf)
+    return h.hexdigest()
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class ArtifactCache:
+    """
+    Stage outputs of one document, stored under `root/<document hash>/<stage>-<config hash>.*`.
+    A stage's entry is only reused when both the document bytes and the stage configuration
+    match. JSON for structured outputs, float32 .npz parts (one per embedding window) for
+    embeddings. With `read=False` nothing is loaded (fresh run) but outputs are still written.
+    """
+
+    def __init__(self, doc_hash, root=ARTIFACT_DIR, read=True):
+        self.doc_hash = doc_hash
+        self.folder = os.path.join(root, doc_hash)
+        self.read = read
+
+    def _path(self, stage, config, ext):
+        return os.path.join(self.folder, f"{stage}-{config_hash(config)}{ext}")
+
+    def load(self, stage, config):
+        path = self._path(stage, config, ".json")
+        if not self.read or not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            print(f"[artifacts] Reusing '{stage}' from a previous run.")
+            return json.load(f)
+
+    def save(self, stage, config, value):
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+        _atomic_write(self._path(stage, config, ".json"), write)
+
+    def load_embeddings(self, config):
+        """Returns {vector id: embedding row} saved for this document (empty if none)."""
+        folder = self._path("embeddings", config, "")
+        if not self.read or not os.path.isdir(folder):
+            return {}
+        saved = {}
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".npz"):
+                with np.load(os.path.join(folder, name)) as data:
+                    saved.update(zip(data["ids"].tolist(), data["vectors"]))
+        return saved
+
+    def append_embeddings(self, config, ids, matrix):
+        """
+        Saves one window of embeddings as a new part, so checkpointing costs the window's size
+        rather than everything embedded so far.
+        """
+        folder = self._path("embeddings", config, "")
+        part = len(os.listdir(folder)) if os.path.isdir(folder) else 0
+
+        # One .npz holds both arrays, so ids and rows can never get out of step
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, ids=np.array(list(ids), dtype=str), vectors=np.asarray(matrix, dtype=np.float32))
+        _atomic_write(os.path.join(folder, f"{part:06d}.npz"), write)
+
+    def clear(self):
+        """Removes every saved output of the document (once it is fully indexed)."""
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,408 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+# --- Configuration ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"                     # one JSON log line per finished trace
+TRACE_LOG_MIN_MS = float(os.getenv("TRACE_LOG_MIN_MS", "0"))       # only log traces slower than this
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))         # spans kept per trace (the rest are counted)
+
+# Seconds; covers cache hits (sub-ms) up to long LLM generations and ingestion stages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+# ------------------------------
+# METRIC TYPES
+# ------------------------------
+def _label_key(labelnames, labels):
+    if len(labels) != len(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count, e.g. requests or tokens. One lock-protected float per label set."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed buckets (Prometheus `le` semantics), plus sum and
+    count, so latency percentiles can be computed per label set on the server side.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # label key -> [per-bucket counts (+Inf last), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = [("le", _format_value(bound) if bound != float("inf") else "+Inf")]
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+class _Callback:
+    """Gauge read at scrape time from existing stats (cache sizes, sessions...)."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [(self.name, "", value)]
+        return [(self.name, _format_labels(self.labelnames, key if isinstance(key, tuple) else (str(key),)), v)
+                for key, v in value.items()]
+
+
+class Registry:
+    """Named metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        # Creating the same metric twice (module reloads) returns the first one
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"[metrics] Could not collect {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge_callback(name, help, fn, labelnames=()):
+    """`fn` returns a number, or {label value (tuple): number} for `labelnames`."""
+    return REGISTRY.register(_Callback(name, help, fn, labelnames))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# ------------------------------
+# STRUCTURED LOGS
+# ------------------------------
+def log_event(event, **fields):
+    """Prints one JSON object per line, for log pipelines to parse."""
+    print(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+# ------------------------------
+# TRACES AND STAGES
+# ------------------------------
+STAGE_SECONDS = histogram("rag_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"])
+STAGE_ERRORS = counter("rag_stage_errors_total", "Pipeline stages that raised.", ["stage"])
+TRACE_SECONDS = histogram("rag_trace_duration_seconds", "Duration of traced requests and ingestion runs.", ["trace"])
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    """
+    Spans recorded during one request or ingestion run. The trace lives in a ContextVar, so
+    stages deeper in the call stack (and in threads started with a copy of the context, see
+    concurrency.Dependency) attach their spans to it without it being passed around.
+    """
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add_span(self, name, start, end, parent=None, attrs=None, error=None):
+        with self.lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return None
+            span_id = len(self.spans)
+            span = {"id": span_id, "name": name, "parent": parent,
+                    "start_ms": round((start - self.start) * 1000, 2), "ms": round((end - start) * 1000, 2)}
+            if attrs:
+                span.update(attrs)
+            if error:
+                span["error"] = error
+            self.spans.append(span)
+            return span_id
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class trace:
+    """
+    `with metrics.trace("chat", session=...) as t:` starts a trace; when it ends its duration is
+    observed and, with TRACE_LOG, one structured log line lists every span.
+    `log_empty=False` skips the log line for traces that recorded no spans (health checks...).
+    """
+
+    def __init__(self, name, log_empty=True, **attrs):
+        self.trace = Trace(name, attrs)
+        self.log_empty = log_empty
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self.token)
+        t = self.trace
+        seconds = time.perf_counter() - t.start
+        if METRICS_ENABLED:
+            TRACE_SECONDS.observe(seconds, trace=t.name)
+        if TRACE_LOG and seconds * 1000 >= TRACE_LOG_MIN_MS and (t.spans or self.log_empty):
+            record = {"trace": t.name, "trace_id": t.trace_id, "ms": round(seconds * 1000, 2), **t.attrs,
+                      "spans": t.spans}
+            if t.dropped:
+                record["spans_dropped"] = t.dropped
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            log_event("trace", **record)
+        return False
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(name, seconds, error=None, **attrs):
+    """Records a stage timed by the caller (e.g. across the steps of a generator)."""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if error:
+        STAGE_ERRORS.inc(stage=name)
+    t = _current_trace.get()
+    if t is not None:
+        end = time.perf_counter()
+        t.add_span(name, end - seconds, end, parent=_current_span.get(), attrs=attrs, error=error)
+
+
+class stage:
+    """
+    Times one pipeline stage: `with metrics.stage("retrieval") as span: ... span.set(matches=5)`,
+    or as a decorator `@metrics.stage("embedding")`. Observes rag_stage_duration_seconds{stage},
+    counts errors, and adds a span (with its attributes) to the current trace if there is one.
+    Costs a few microseconds, so it stays on in production.
+    """
+
+    __slots__ = ("name", "attrs", "start", "span_token", "trace")
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        self.span_token = None
+        if self.trace is not None:
+            # Reserve the span id now so nested stages can point at it as their parent
+            self.span_token = _current_span.set(object())
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if not METRICS_ENABLED:
+            if self.span_token is not None:
+                _current_span.reset(self.span_token)
+            return False
+        STAGE_SECONDS.observe(end - self.start, stage=self.name)
+        error = exc_type.__name__ if exc_type is not None else None
+        if error:
+            STAGE_ERRORS.inc(stage=self.name)
+        if self.trace is not None:
+            marker = _current_span.get()
+            _current_span.reset(self.span_token)
+            span_id = self.trace.add_span(self.name, self.start, end, parent=_current_span.get(),
+                                          attrs=self.attrs, error=error)
+            # Children finished first and recorded this stage's marker as their parent
+            with self.trace.lock:
+                for span in self.trace.spans:
+                    if span["parent"] is marker:
+                        span["parent"] = span_id
+        return False
+
+    def __call__(self, fn):
+        name = self.name
+
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        wrapper.__name__ = fn.__name__
+        wrapper.__qualname__ = fn.__qualname__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+
+# ------------------------------
+# HTTP (ASGI MIDDLEWARE)
+# ------------------------------
+HTTP_REQUESTS = counter("rag_http_requests_total", "HTTP requests by handler, method and status.",
+                        ["handler", "method", "status"])
+HTTP_SECONDS = histogram("rag_http_request_duration_seconds",
+                         "HTTP request duration until the last body chunk (whole stream for SSE).", ["handler"])
+HTTP_IN_FLIGHT = gauge("rag_http_requests_in_flight", "HTTP requests being served.")
+
+
+def _handler_name(scope):
+    # Route template when the router exposes it (no per-URL label explosion), else the endpoint name
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (safe with streaming responses): wraps each HTTP request in a trace,
+    so every stage it runs logs under one trace id (also returned as X-Trace-Id), and records
+    request count, duration and in-flight gauge.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        HTTP_IN_FLIGHT.inc()
+
+        with trace("http", log_empty=False, method=scope["method"], path=scope["path"]) as t:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    message = {**message, "headers": list(message.get("headers", [])) +
+                               [(b"x-trace-id", t.trace_id.encode("ascii"))]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                handler = _handler_name(scope)
+                t.set(handler=handler, status=status["code"])
+                HTTP_IN_FLIGHT.dec()
+                HTTP_REQUESTS.inc(handler=handler, method=scope["method"], status=status["code"])
+                HTTP_SECONDS.observe(time.perf_counter() - t.start, handler=handler)
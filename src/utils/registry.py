@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+# --- Configuration ---
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")  # "groq" or "fake" (offline, see src/app/fake_llm.py)
+# "torch" (sentence-transformers), "onnx" (ONNX Runtime, no torch import; see embeddings/onnx_backend.py)
+# or "remote" (a shared embedding server process over a unix socket; see embeddings/server.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# One instance of each heavy model/client per process, created on first use.
+_instances = {}
+_lock = threading.RLock()
+_ready = threading.Event()
+_warmup_error = None
+
+
+def _get_or_create(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = factory()
+                _instances[name] = instance
+                print(f"[registry] Loaded {name} in {time.perf_counter() - start:.2f}s")
+    return instance
+
+
+def load_embedding_model(backend=None):
+    """
+    Creates a new embedding model for `backend` (default EMBEDDING_BACKEND): a SentenceTransformer,
+    the exported model on ONNX Runtime, or a client of the embedding server (same encode() interface).
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        from src.embeddings.onnx_backend import OnnxEmbeddingModel
+        return OnnxEmbeddingModel()
+    if backend == "remote":
+        from src.embeddings.server import RemoteEmbeddingModel
+        return RemoteEmbeddingModel()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def get_embedding_model():
+    """Shared embedding model (loaded on first call), see load_embedding_model."""
+    return _get_or_create("embedding_model", load_embedding_model)
+
+
+def get_llm_client():
+    """Shared chat-completion client: Groq, or the offline fake when LLM_BACKEND=fake (created on first call)."""
+    def load():
+        if LLM_BACKEND == "fake":
+            from src.app.fake_llm import FakeLLMClient
+            return FakeLLMClient()
+        from groq import Groq
+        return Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _get_or_create("llm_client", load)
+
+
+def get_vector_index():
+    """
+    Shared handle to the vector index selected by VECTOR_BACKEND: the Pinecone index named by
+    PINECONE_INDEX_NAME, or the local embedded index (created on first call).
+    """
+    def load():
+        from src.retrieval import vector_store
+        if vector_store.VECTOR_BACKEND == "pinecone":
+            from pinecone import Pinecone
+            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            return pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+        return vector_store.get_index()
+    return _get_or_create("vector_index", load)
+
+
+def override(name, instance):
+    """
+    Installs `instance` as the shared "embedding_model", "llm_client" or "vector_index"
+    (offline fakes in tests and benchmarks).
+    """
+    with _lock:
+        _instances[name] = instance
+
+
+def warm_up():
+    """
+    Loads the embedding model and API clients and runs one throwaway encode so the first
+    real request pays no initialization cost. Marks the process ready when done.
+    """
+    global _warmup_error
+    start = time.perf_counter()
+    try:
+        get_embedding_model().encode(["warm up"])
+        get_llm_client()
+        get_vector_index()
+    except Exception as e:
+        _warmup_error = e
+        print(f"[registry] Warm-up failed: {e}")
+        return False
+
+    _warmup_error = None
+    _ready.set()
+    print(f"[registry] Warm-up complete in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def mark_ready():
+    """Marks the process ready without warming up (models and clients then load on first use)."""
+    global _warmup_error
+    _warmup_error = None
+    _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def warmup_error():
+    return _warmup_error
+
+
+def reset(keep=()):
+    """
+    Drops every cached instance except those named in `keep` (e.g. after fork, where the
+    preloaded model can be shared but network clients must not be, or in tests).
+    """
+    global _warmup_error
+    with _lock:
+        for name in list(_instances):
+            if name not in keep:
+                del _instances[name]
+        _ready.clear()
+        _warmup_error = None
@@ -0,0 +1,33 @@
+import math
+import re
+
+# Llama-style BPE tokenizers average roughly 4 characters of English per token;
+# words and punctuation are counted too so short, symbol-heavy text isn't underestimated.
+CHARS_PER_TOKEN = 4.0
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """
+    Cheap token estimate for prompt budgeting (no tokenizer download needed).
+    Errs on the high side so budgets stay under the model's real limit.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / CHARS_PER_TOKEN), len(_WORD_RE.findall(text)) * 3 // 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text to roughly `max_tokens`, on a word boundary where possible."""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    cut = text[:int(max_tokens * CHARS_PER_TOKEN)]
+    while cut and count_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + " ..."
@@ -0,0 +1,57 @@
+"""
+Parity of the ONNX Runtime embedding backend with the PyTorch model it was exported from.
+
+Exports the model (all-MiniLM-L6-v2 by default, or PARITY_MODEL: a model name or local path)
+to a temporary folder and checks the cosine thresholds of onnx_backend.parity: >= 0.9999 for
+fp32 and >= 0.99 for int8. Skipped when torch, sentence-transformers or ONNX Runtime are not
+installed, or the model cannot be loaded (e.g. offline without a local copy).
+
+    python -m pytest tests
+"""
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+from src.embeddings import onnx_backend
+from src.utils import registry
+
+PARITY_MODEL = os.getenv("PARITY_MODEL", registry.EMBEDDING_MODEL_NAME)
+
+
+@pytest.fixture(scope="module")
+def exported_model(tmp_path_factory):
+    from sentence_transformers import SentenceTransformer
+
+    try:
+        SentenceTransformer(PARITY_MODEL, device="cpu")
+    except Exception as e:
+        pytest.skip(f"{PARITY_MODEL} is not available: {e}")
+
+    model_dir = str(tmp_path_factory.mktemp("onnx"))
+    onnx_backend.export_model(PARITY_MODEL, model_dir, quantize=True)
+    return model_dir
+
+
+def test_fp32_and_int8_match_pytorch(exported_model):
+    # parity() raises AssertionError when a minimum cosine falls under its threshold
+    results = onnx_backend.parity(exported_model)
+
+    assert set(results) == {"fp32", "int8"}
+    assert results["fp32"][0] >= 0.9999
+    assert results["int8"][0] >= 0.99
+
+
+def test_matches_pytorch_on_padded_batches(exported_model):
+    # Texts of very different lengths in one batch: padding must not leak into the mean pooling
+    texts = ["short", " ".join(onnx_backend.PARITY_TEXTS)] + onnx_backend.PARITY_TEXTS[:3]
+    reference = onnx_backend._torch_model(PARITY_MODEL).encode(texts, normalize_embeddings=True)
+    vectors = onnx_backend.OnnxEmbeddingModel(exported_model, quantized=False).encode(
+        texts, batch_size=len(texts), normalize_embeddings=True)
+
+    assert vectors.shape == reference.shape
+    assert (reference * vectors).sum(axis=1).min() >= 0.9999